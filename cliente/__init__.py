@@ -0,0 +1,19 @@
+# cliente/__init__.py
+# Description: Biblioteca cliente del servidor de procesos (protocolo de
+# texto), con API síncrona y asyncio, pool de conexiones y pipelining.
+#
+#   with Cliente("127.0.0.1", 12345) as c:
+#       pid = c.crear("backup", "alta")
+#       c.pipeline(["CREAR|a|1", "CREAR|b|2"])
+#
+#   async with PoolClientesAsync("127.0.0.1", 12345) as pool:
+#       respuestas = await asyncio.gather(*(pool.enviar("CREAR|p|1") for _ in range(1000)))
+
+from cliente.respuestas import ErrorProtocolo, ErrorServidor, Evento, Respuesta, ServidorOcupado
+from cliente.sincrono import Cliente, PoolClientes
+from cliente.asincrono import ClienteAsync, PoolClientesAsync
+
+__all__ = [
+    "Cliente", "PoolClientes", "ClienteAsync", "PoolClientesAsync",
+    "Respuesta", "Evento", "ErrorServidor", "ErrorProtocolo", "ServidorOcupado",
+]
@@ -0,0 +1,227 @@
+# cliente/asincrono.py
+# Description: Cliente asyncio con pipelining y pool de conexiones.
+#
+# Una misma conexión admite comandos de varias corrutinas a la vez: cada
+# comando se escribe en cuanto se pide (sin esperar a las respuestas
+# anteriores) y una tarea lectora resuelve las respuestas en orden. Los
+# comandos pedidos en la misma vuelta del bucle se envían en una sola
+# escritura.
+
+import asyncio
+import collections
+
+from cliente.respuestas import (ErrorProtocolo, ErrorServidor, LectorRespuestas, ServidorOcupado, argumento,
+                                codificar, comando_crear, comando_listar, comando_lote, mensajes_lote, parsear_evento,
+                                pid_creado)
+
+TAM_LECTURA = 65536
+
+"""
+    Cliente asyncio sobre una conexión. Crear con await ClienteAsync.conectar(...).
+"""
+class ClienteAsync:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.lector = LectorRespuestas()
+        # Futures de los comandos enviados, en orden de envío.
+        self.pendientes = collections.deque()
+        self.salida = []
+        self.cerrado = False
+        self.tarea = None
+
+    @classmethod
+    async def conectar(cls, host="127.0.0.1", port=12345):
+        reader, writer = await asyncio.open_connection(host, port)
+        bienvenida = await reader.readline()
+        if bienvenida.startswith(b"ERROR|"):
+            writer.close()
+            raise ServidorOcupado(bienvenida.decode().strip().partition("|")[2])
+        if not bienvenida:
+            writer.close()
+            raise ConnectionError("El servidor cerró la conexión.")
+        cliente = cls(reader, writer)
+        cliente.tarea = asyncio.get_running_loop().create_task(cliente._leer())
+        return cliente
+
+    """
+        Número de comandos enviados que aún esperan respuesta.
+    """
+    @property
+    def en_vuelo(self):
+        return len(self.pendientes)
+
+    async def _leer(self):
+        error = None
+        try:
+            while True:
+                data = await self.reader.read(TAM_LECTURA)
+                if not data:
+                    break
+                for respuesta in self.lector.alimentar(data):
+                    futuro = self.pendientes.popleft()
+                    if not futuro.done():
+                        futuro.set_result(respuesta)
+        except (OSError, ErrorProtocolo) as e:
+            error = e
+        finally:
+            self.cerrado = True
+            while self.pendientes:
+                futuro = self.pendientes.popleft()
+                if not futuro.done():
+                    futuro.set_exception(error or ConnectionError("El servidor cerró la conexión."))
+
+    def _vaciar(self):
+        datos, self.salida = b"".join(self.salida), []
+        if not self.cerrado:
+            self.writer.write(datos)
+
+    def _encolar(self, comando):
+        if self.cerrado:
+            raise ConnectionError("La conexión está cerrada.")
+        datos, forma = codificar(comando)
+        if not self.salida:
+            asyncio.get_running_loop().call_soon(self._vaciar)
+        self.salida.append(datos)
+        self.lector.esperar(forma)
+        futuro = asyncio.get_running_loop().create_future()
+        self.pendientes.append(futuro)
+        return futuro
+
+    """
+        Envía un comando y retorna su Respuesta (sin lanzar en ERROR|).
+        Se puede llamar de forma concurrente: los comandos se encadenan.
+    """
+    async def enviar(self, comando):
+        futuro = self._encolar(comando)
+        if self.writer.transport.get_write_buffer_size() > TAM_LECTURA:
+            await self.writer.drain()
+        return await futuro
+
+    """
+        Envía varios comandos en una sola escritura y retorna sus respuestas en orden.
+    """
+    async def pipeline(self, comandos):
+        futuros = [self._encolar(comando) for comando in comandos]
+        return list(await asyncio.gather(*futuros))
+
+    async def crear(self, nombre, prioridad, ttl=None):
+        return pid_creado(await self.enviar(comando_crear(nombre, prioridad, ttl)))
+
+    async def eliminar(self, pid):
+        return (await self.enviar(f"ELIMINAR|{argumento(pid)}")).comprobar().mensaje
+
+    async def modificar(self, pid, campo, valor):
+        return (await self.enviar(f"MODIFICAR|{argumento(pid)}|{argumento(campo)}|{argumento(valor)}")).comprobar().mensaje
+
+    async def renovar(self, pid, ttl):
+        return (await self.enviar(f"RENOVAR|{argumento(pid)}|{float(ttl)}")).comprobar().mensaje
+
+    async def listar(self, filtros=None, offset=None, limit=None):
+        return (await self.enviar(comando_listar(filtros, offset, limit))).comprobar().filas()
+
+    async def top(self, k):
+        return (await self.enviar(f"TOP|{int(k)}")).comprobar().filas()
+
+    async def siguiente(self):
+        filas = (await self.enviar("SIGUIENTE")).comprobar().filas()
+        return filas[0] if filas else None
+
+    async def lote(self, comandos):
+        return mensajes_lote(await self.enviar(comando_lote(comandos)))
+
+    async def estadisticas(self):
+        respuesta = (await self.enviar("ESTADISTICAS")).comprobar()
+        return [respuesta.mensaje] + respuesta.lineas
+
+    """
+        Suscribe esta conexión a los eventos y genera objetos Evento hasta
+        que se cierra. No debe haber comandos en vuelo; después la conexión
+        ya no admite otros comandos.
+    """
+    async def suscribir(self, desde=None, latidos=False):
+        if self.pendientes:
+            raise RuntimeError("No se puede suscribir con comandos en vuelo.")
+        self.tarea.cancel()
+        self.cerrado = True
+        comando = "SUSCRIBIR" if desde is None else f"SUSCRIBIR|{int(desde)}"
+        self.writer.write((comando + "\n").encode())
+        pendiente = bytearray(self.lector.buffer)
+        confirmado = False
+        while True:
+            *lineas, resto = pendiente.split(b"\n")
+            pendiente = bytearray(resto)
+            for linea in lineas:
+                texto = linea.decode(errors="replace")
+                if not confirmado:
+                    if texto.startswith("ERROR|"):
+                        raise ErrorServidor(texto.partition("|")[2])
+                    confirmado = True
+                    continue
+                evento = parsear_evento(texto)
+                if latidos or evento.tipo != "latido":
+                    yield evento
+            data = await self.reader.read(TAM_LECTURA)
+            if not data:
+                return
+            pendiente += data
+
+    async def cerrar(self):
+        self.cerrado = True
+        if self.tarea is not None:
+            self.tarea.cancel()
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.cerrar()
+
+"""
+    Pool de conexiones asyncio. Cada comando va a la conexión con menos
+    comandos en vuelo; las conexiones se abren según hacen falta, hasta tamano.
+"""
+class PoolClientesAsync:
+    def __init__(self, host="127.0.0.1", port=12345, tamano=4):
+        self.host, self.port, self.tamano = host, port, tamano
+        self.clientes = []
+        self.abriendo = None
+
+    async def _cliente(self):
+        self.clientes = [c for c in self.clientes if not c.cerrado]
+        libre = min(self.clientes, key=lambda c: c.en_vuelo, default=None)
+        if libre is not None and (libre.en_vuelo == 0 or len(self.clientes) >= self.tamano):
+            return libre
+        if self.abriendo is None:
+            self.abriendo = asyncio.ensure_future(ClienteAsync.conectar(self.host, self.port))
+        abriendo = self.abriendo
+        try:
+            cliente = await abriendo
+        finally:
+            if self.abriendo is abriendo:
+                self.abriendo = None
+        if cliente not in self.clientes:
+            self.clientes.append(cliente)
+        return cliente
+
+    async def enviar(self, comando):
+        return await (await self._cliente()).enviar(comando)
+
+    async def pipeline(self, comandos):
+        return await (await self._cliente()).pipeline(comandos)
+
+    async def cerrar(self):
+        for cliente in self.clientes:
+            await cliente.cerrar()
+        self.clientes = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.cerrar()
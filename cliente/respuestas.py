@@ -0,0 +1,235 @@
+# cliente/respuestas.py
+# Description: Análisis de las respuestas del protocolo de texto, sin E/S,
+# compartido por el cliente síncrono y el asyncio.
+#
+# Las respuestas DATOS pueden ocupar varias líneas sin terminador, así que
+# cada comando declara cómo termina su respuesta:
+#   UNA     una sola línea (CREAR, ELIMINAR, MODIFICAR, RENOVAR, ...)
+#   LOTE    n líneas si empieza por DATOS| (LOTE|n), una si es ERROR|
+#   STREAM  DATOS|STREAM, filas y una línea FIN|<n> (LISTAR|STREAM)
+#   PING    el cliente envía PING detrás y lee hasta OK|PONG (LISTAR,
+#           TOP, AYUDA, ESTADISTICAS y cualquier comando desconocido)
+
+import ast
+import collections
+
+UNA = "una"
+LOTE = "lote"
+STREAM = "stream"
+PING = "ping"
+
+LINEA_PONG = "OK|PONG"
+
+# Acciones cuya respuesta es siempre una línea.
+_ACCIONES_UNA = frozenset(("crear", "eliminar", "modificar", "renovar", "siguiente", "simular", "ping", "salir"))
+
+"""
+    Error devuelto por el servidor (respuesta ERROR|...).
+"""
+class ErrorServidor(Exception):
+    pass
+
+"""
+    Llegó algo que no corresponde a ningún comando enviado: la conexión
+    está desincronizada y se debe cerrar.
+"""
+class ErrorProtocolo(ConnectionError):
+    pass
+
+"""
+    El servidor rechazó la conexión por estar saturado (ERROR|Ocupado).
+"""
+class ServidorOcupado(ErrorServidor):
+    pass
+
+"""
+    Respuesta completa a un comando.
+    estado: "OK", "ERROR", "DATOS", "SALIR"...
+    mensaje: Resto de la primera línea tras el estado.
+    lineas: Líneas siguientes de una respuesta de varias líneas (sin la
+    línea FIN| de un streaming).
+"""
+class Respuesta:
+    __slots__ = ("estado", "mensaje", "lineas")
+
+    def __init__(self, estado, mensaje, lineas=()):
+        self.estado = estado
+        self.mensaje = mensaje
+        self.lineas = list(lineas)
+
+    @property
+    def ok(self):
+        return self.estado != "ERROR"
+
+    """
+        Texto completo de la respuesta, como lo envió el servidor.
+    """
+    @property
+    def texto(self):
+        return "\n".join([f"{self.estado}|{self.mensaje}", *self.lineas])
+
+    """
+        Lanza ErrorServidor si la respuesta es un ERROR. Retorna la respuesta.
+    """
+    def comprobar(self):
+        if self.estado == "ERROR":
+            raise ErrorServidor(self.mensaje)
+        return self
+
+    """
+        Filas de proceso de un listado como lista de (pid, dict).
+    """
+    def filas(self):
+        datos = [self.mensaje] + self.lineas if self.mensaje not in ("STREAM", "Sin procesos.") else self.lineas
+        return [parsear_fila(linea) for linea in datos]
+
+    def __repr__(self):
+        return f"Respuesta({self.texto!r})"
+
+"""
+    Convierte una fila "pid: {'nombre': ..., ...}" en (pid, dict).
+"""
+def parsear_fila(linea):
+    pid, _, datos = linea.partition(": ")
+    return int(pid), ast.literal_eval(datos)
+
+"""
+    Retorna (forma, n) de la respuesta que se espera para un comando.
+"""
+def forma_respuesta(comando):
+    # En un LOTE solo cuenta la cabecera, no los comandos que la siguen.
+    partes = comando.partition("\n")[0].split("|", 2)
+    accion = partes[0].strip().lower()
+    if accion in _ACCIONES_UNA:
+        return UNA, 1
+    if accion == "lote" and len(partes) == 2 and partes[1].strip().isdigit():
+        return LOTE, int(partes[1])
+    if accion == "listar" and len(partes) > 1 and partes[1].strip().lower() == "stream":
+        return STREAM, 0
+    return PING, 0
+
+"""
+    Bytes a enviar para un comando (con el PING detrás si hace falta) y
+    su forma de respuesta.
+    comando: Comando sin '\n' final; un LOTE lleva sus líneas separadas por '\n'.
+"""
+def codificar(comando):
+    forma = forma_respuesta(comando)
+    if forma[0] == PING:
+        return (comando + "\nPING\n").encode(), forma
+    return (comando + "\n").encode(), forma
+
+"""
+    Separa el flujo de bytes recibido en objetos Respuesta, sabiendo la
+    forma de cada respuesta esperada (en el orden en que se enviaron).
+"""
+class LectorRespuestas:
+    def __init__(self):
+        self.esperadas = collections.deque()
+        self.buffer = bytearray()
+        self.actual = None
+        self.faltan = 0
+
+    """
+        Anota la forma de la respuesta del siguiente comando enviado.
+    """
+    def esperar(self, forma):
+        self.esperadas.append(forma)
+
+    """
+        Añade bytes recibidos y retorna las respuestas completadas.
+    """
+    def alimentar(self, data):
+        self.buffer += data
+        if b"\n" not in data:
+            return []
+        *lineas, resto = self.buffer.split(b"\n")
+        self.buffer = bytearray(resto)
+        completas = []
+        for linea in lineas:
+            respuesta = self._linea(linea.decode(errors="replace").rstrip("\r"))
+            if respuesta is not None:
+                completas.append(respuesta)
+        return completas
+
+    def _linea(self, linea):
+        if self.actual is None:
+            if not self.esperadas:
+                raise ErrorProtocolo(f"Respuesta inesperada del servidor: {linea!r}")
+            estado, _, mensaje = linea.partition("|")
+            self.actual = Respuesta(estado, mensaje)
+            forma, n = self.esperadas[0]
+            if forma == UNA or (forma == LOTE and (estado != "DATOS" or n <= 1)):
+                return self._terminar()
+            if forma == STREAM and not (estado == "DATOS" and mensaje == "STREAM"):
+                return self._terminar()
+            if forma == PING and linea == LINEA_PONG:
+                # Comando desconocido o sin salida propia: solo llegó el PONG.
+                self.actual = Respuesta(estado, mensaje)
+                return self._terminar()
+            self.faltan = n - 1
+            return None
+        forma = self.esperadas[0][0]
+        if forma == LOTE:
+            self.actual.lineas.append(linea)
+            self.faltan -= 1
+            return self._terminar() if self.faltan == 0 else None
+        if forma == STREAM:
+            if linea.startswith("FIN|"):
+                return self._terminar()
+            self.actual.lineas.append(linea)
+            return None
+        if linea == LINEA_PONG:
+            return self._terminar()
+        self.actual.lineas.append(linea)
+        return None
+
+    def _terminar(self):
+        respuesta, self.actual = self.actual, None
+        self.esperadas.popleft()
+        return respuesta
+
+"""
+    Evento de una suscripción (ver eventos.py del servidor).
+    campos: dict con los campo=valor del evento.
+"""
+Evento = collections.namedtuple("Evento", ("seq", "tipo", "pid", "campos"))
+
+def parsear_evento(linea):
+    partes = linea.split("|")
+    pid = int(partes[3]) if len(partes) > 3 else None
+    campos = dict(parte.split("=", 1) for parte in partes[4:])
+    return Evento(int(partes[1]), partes[2], pid, campos)
+
+"""
+    Comprueba que un argumento no rompa el encuadre del protocolo.
+"""
+def argumento(valor):
+    valor = str(valor)
+    if "|" in valor or "\n" in valor:
+        raise ValueError(f"Argumento inválido (contiene '|' o salto de línea): {valor!r}")
+    return valor
+
+# --- Construcción de comandos e interpretación de respuestas, comunes a ambos clientes ---
+
+def pid_creado(respuesta):
+    # "OK|Proceso <pid> creado."
+    return int(respuesta.comprobar().mensaje.split()[1])
+
+def comando_crear(nombre, prioridad, ttl=None):
+    comando = f"CREAR|{argumento(nombre)}|{argumento(prioridad)}"
+    return comando if ttl is None else f"{comando}|{float(ttl)}"
+
+def comando_listar(filtros=None, offset=None, limit=None):
+    partes = ["LISTAR", "STREAM"]
+    partes += [f"{argumento(c)}={argumento(v)}" for c, v in (filtros or {}).items()]
+    if offset is not None or limit is not None:
+        partes += [str(int(offset or 0)), str(int(limit if limit is not None else 2 ** 31))]
+    return "|".join(partes)
+
+def comando_lote(comandos):
+    return "\n".join([f"LOTE|{len(comandos)}", *comandos])
+
+def mensajes_lote(respuesta):
+    respuesta.comprobar()
+    return [respuesta.mensaje.partition("|")[2]] + [linea.partition("|")[2] for linea in respuesta.lineas]
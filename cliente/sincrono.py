@@ -0,0 +1,229 @@
+# cliente/sincrono.py
+# Description: Cliente síncrono (sockets bloqueantes) y pool de conexiones.
+
+import contextlib
+import queue
+import select
+import socket
+import threading
+
+from cliente.respuestas import (ErrorServidor, LectorRespuestas, ServidorOcupado, argumento, codificar, comando_crear,
+                                comando_listar, comando_lote, mensajes_lote, parsear_evento, pid_creado)
+
+TAM_LECTURA = 65536
+
+"""
+    Abre un socket al servidor y consume la línea de bienvenida.
+    Retorna (socket, bytes recibidos tras la bienvenida).
+    Lanza ServidorOcupado si el servidor rechaza la conexión.
+"""
+def conectar(host, port, timeout):
+    sock = socket.create_connection((host, port), timeout=timeout)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    recibido = bytearray()
+    while b"\n" not in recibido:
+        parte = sock.recv(TAM_LECTURA)
+        if not parte:
+            sock.close()
+            raise ConnectionError("El servidor cerró la conexión.")
+        recibido += parte
+    bienvenida, _, resto = recibido.partition(b"\n")
+    if bienvenida.startswith(b"ERROR|"):
+        sock.close()
+        raise ServidorOcupado(bienvenida.decode().partition("|")[2])
+    return sock, bytes(resto)
+
+"""
+    Cliente del protocolo de texto sobre una conexión. No es seguro usar
+    la misma instancia desde varios hilos a la vez (usar PoolClientes).
+    pipeline() envía varios comandos en un único sendall y lee todas sus
+    respuestas en orden.
+"""
+class Cliente:
+    def __init__(self, host="127.0.0.1", port=12345, timeout=None):
+        self.socket, resto = conectar(host, port, timeout)
+        self.lector = LectorRespuestas()
+        self.listas = []
+        self._recibir(resto)
+
+    def _recibir(self, data):
+        self.listas += self.lector.alimentar(data)
+
+    """
+        Envía los comandos juntos y retorna sus respuestas (objetos Respuesta), en orden.
+    """
+    def pipeline(self, comandos):
+        envio = []
+        for comando in comandos:
+            datos, forma = codificar(comando)
+            envio.append(datos)
+            self.lector.esperar(forma)
+        self.socket.sendall(b"".join(envio))
+        while len(self.listas) < len(comandos):
+            data = self.socket.recv(TAM_LECTURA)
+            if not data:
+                raise ConnectionError("El servidor cerró la conexión.")
+            self._recibir(data)
+        respuestas, self.listas = self.listas[:len(comandos)], self.listas[len(comandos):]
+        return respuestas
+
+    """
+        Envía un comando y retorna su Respuesta (sin lanzar en ERROR|).
+    """
+    def enviar(self, comando):
+        return self.pipeline([comando])[0]
+
+    """
+        Crea un proceso y retorna su PID.
+        ttl: Segundos tras los que caduca si no se renueva (None = nunca).
+    """
+    def crear(self, nombre, prioridad, ttl=None):
+        return pid_creado(self.enviar(comando_crear(nombre, prioridad, ttl)))
+
+    def eliminar(self, pid):
+        return self.enviar(f"ELIMINAR|{argumento(pid)}").comprobar().mensaje
+
+    def modificar(self, pid, campo, valor):
+        return self.enviar(f"MODIFICAR|{argumento(pid)}|{argumento(campo)}|{argumento(valor)}").comprobar().mensaje
+
+    """
+        Renueva el plazo de un proceso: caducará ttl segundos después de ahora.
+    """
+    def renovar(self, pid, ttl):
+        return self.enviar(f"RENOVAR|{argumento(pid)}|{float(ttl)}").comprobar().mensaje
+
+    """
+        Lista procesos como [(pid, dict)], con filtros {campo: valor} opcionales.
+    """
+    def listar(self, filtros=None, offset=None, limit=None):
+        return self.enviar(comando_listar(filtros, offset, limit)).comprobar().filas()
+
+    def top(self, k):
+        return self.enviar(f"TOP|{int(k)}").comprobar().filas()
+
+    """
+        Retorna (pid, dict) del siguiente proceso listo, o None.
+    """
+    def siguiente(self):
+        filas = self.enviar("SIGUIENTE").comprobar().filas()
+        return filas[0] if filas else None
+
+    """
+        Ejecuta comandos CREAR/ELIMINAR/MODIFICAR de forma atómica.
+        Retorna la lista de mensajes OK; lanza ErrorServidor si el lote falla.
+    """
+    def lote(self, comandos):
+        return mensajes_lote(self.enviar(comando_lote(comandos)))
+
+    def estadisticas(self):
+        respuesta = self.enviar("ESTADISTICAS").comprobar()
+        return [respuesta.mensaje] + respuesta.lineas
+
+    """
+        Suscribe esta conexión a los eventos y genera objetos Evento hasta
+        que se cierra. La conexión ya no admite otros comandos.
+        latidos: True para generar también los eventos "latido".
+    """
+    def suscribir(self, desde=None, latidos=False):
+        comando = "SUSCRIBIR" if desde is None else f"SUSCRIBIR|{int(desde)}"
+        self.socket.sendall((comando + "\n").encode())
+        pendiente = bytearray(self.lector.buffer)
+        confirmado = False
+        while True:
+            *lineas, resto = pendiente.split(b"\n")
+            pendiente = bytearray(resto)
+            for linea in lineas:
+                texto = linea.decode(errors="replace")
+                if not confirmado:
+                    if texto.startswith("ERROR|"):
+                        raise ErrorServidor(texto.partition("|")[2])
+                    confirmado = True
+                    continue
+                evento = parsear_evento(texto)
+                if latidos or evento.tipo != "latido":
+                    yield evento
+            data = self.socket.recv(TAM_LECTURA)
+            if not data:
+                return
+            pendiente += data
+
+    """
+        Comprueba sin bloquear que el servidor no ha cerrado la conexión.
+        Entre respuestas el servidor no envía nada: si hay algo que leer es
+        el aviso de inactividad o el cierre, y la conexión ya no sirve.
+    """
+    def abierta(self):
+        legibles, _, _ = select.select([self.socket], [], [], 0)
+        return not legibles
+
+    def cerrar(self):
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+"""
+    Pool de clientes síncronos para usar desde varios hilos: cada hilo toma
+    una conexión libre (o abre una nueva hasta tamano) y la devuelve al acabar.
+"""
+class PoolClientes:
+    def __init__(self, host="127.0.0.1", port=12345, tamano=8, timeout=None):
+        self.host, self.port, self.timeout = host, port, timeout
+        self.libres = queue.LifoQueue()
+        self.plazas = threading.BoundedSemaphore(tamano)
+
+    """
+        Context manager que presta un Cliente del pool. Si la conexión falla
+        durante el uso, se cierra en vez de devolverse.
+    """
+    @contextlib.contextmanager
+    def conexion(self):
+        self.plazas.acquire()
+        try:
+            cliente = self._libre()
+            if cliente is None:
+                cliente = Cliente(self.host, self.port, self.timeout)
+            try:
+                yield cliente
+            except ErrorServidor:
+                # Un ERROR| no desincroniza la conexión: se puede reutilizar.
+                self.libres.put(cliente)
+                raise
+            except BaseException:
+                cliente.cerrar()
+                raise
+            self.libres.put(cliente)
+        finally:
+            self.plazas.release()
+
+    """
+        Retorna una conexión libre que siga abierta, o None. Las que el
+        servidor cerró mientras esperaban (por ejemplo, por inactividad) se descartan.
+    """
+    def _libre(self):
+        while True:
+            try:
+                cliente = self.libres.get_nowait()
+            except queue.Empty:
+                return None
+            if cliente.abierta():
+                return cliente
+            cliente.cerrar()
+
+    def enviar(self, comando):
+        with self.conexion() as cliente:
+            return cliente.enviar(comando)
+
+    def pipeline(self, comandos):
+        with self.conexion() as cliente:
+            return cliente.pipeline(comandos)
+
+    def cerrar(self):
+        while True:
+            try:
+                self.libres.get_nowait().cerrar()
+            except queue.Empty:
+                return
@@ -0,0 +1,518 @@
+# cluster.py
+# Description: Modo cluster. Reparte los procesos entre varios servidores
+# (nodos) con un anillo de hash consistente sobre el PID, así la capacidad
+# y las operaciones crecen con el número de nodos.
+#
+# Cada nodo tiene un id (1..MAX_NODOS-1) y asigna PIDs con ese resto módulo
+# MAX_NODOS, de modo que dos nodos nunca asignan el mismo PID sin necesidad
+# de coordinarse. El dueño de un PID es el nodo que le toca en el anillo
+# (VIRTUALES puntos por nodo). Cualquier nodo acepta cualquier comando:
+#   CREAR                         reserva un PID y lo crea en su dueño
+#   ELIMINAR, MODIFICAR, RENOVAR  se reenvían al dueño del PID
+#   LISTAR, TOP                   se piden a todos los nodos a la vez y se
+#                                 mezclan (por PID / por prioridad)
+#   SIGUIENTE                     TOP|1 en todos y SIGUIENTE en el mejor
+#   LOTE                          no disponible: no sería atómico entre nodos
+# SIMULAR, ESTADO_PLANIFICADOR, SUSCRIBIR y ESTADISTICAS son de cada nodo, y
+# el protocolo binario no está disponible (no enruta).
+#
+# Los nodos se hablan con el protocolo de texto, con un pool de conexiones
+# (cliente.PoolClientes) por nodo. Lo que llega como NODO|<firma>|<comando>
+# se ejecuta en local, sin volver a enrutar, si la firma es el HMAC-SHA256
+# del comando con el secreto compartido del cluster (--cluster-secreto); si
+# no, se rechaza, así un cliente normal no puede usar estos comandos:
+#   CREAR|<pid>|<nombre>|<prioridad>[|<ttl>]   crea con ese PID
+#   ACOGER|<json [[pid, nombre, prioridad, estado, ttl], ...]>
+#   UNIR|<id>|<host>:<puerto>                  añade un nodo al anillo
+#   <comando>                                  cualquier otro, en local
+# El secreto no viaja por la red, pero la conexión no va cifrada: quien
+# pueda capturar el tráfico entre nodos puede repetir un comando firmado.
+#
+# Al añadir un nodo (CLUSTER_UNIR en cualquier nodo, que avisa a los demás)
+# solo cambian de dueño los PIDs de los tramos del anillo que ocupa el
+# nuevo, alrededor de 1/N. Cada nodo se los envía (NODO|ACOGER) y los borra
+# si no han cambiado mientras tanto. Durante el traslado, un comando sobre
+# un PID que aún no ha llegado a su nuevo dueño responde "Proceso no
+# encontrado.".
+
+import ast
+import bisect
+import collections
+import concurrent.futures
+import hashlib
+import heapq
+import hmac
+import itertools
+import json
+import threading
+
+import command_handler
+import process_manager
+import protocolo_binario
+import registro
+from cliente import ErrorServidor, PoolClientes
+from command_handler import COMANDOS, formato_datos, formato_error, formato_ok
+
+# Los PIDs de cada nodo son los de su id módulo MAX_NODOS (ids 1..99).
+MAX_NODOS = 100
+
+# Puntos de cada nodo en el anillo: más puntos, reparto más uniforme.
+VIRTUALES = 160
+
+# Conexiones abiertas como mucho hacia cada uno de los otros nodos. Cada
+# una ocupa un hilo de trabajo del otro nodo mientras está abierta, así que
+# un nodo recibe hasta CONEXIONES_POR_NODO * (N - 1) conexiones de los demás:
+# --hilos debe dejar sitio para ellas además de para los clientes.
+CONEXIONES_POR_NODO = 8
+
+# Segundos máximos de espera de una respuesta de otro nodo.
+TIMEOUT_NODO = 30.0
+
+# Hilos que piden a la vez LISTAR/TOP a los otros nodos.
+HILOS_CONSULTA = 32
+
+# Bytes máximos de un NODO|ACOGER (por debajo de protocolo.MAX_LINEA).
+MAX_ACOGER = 32 * 1024
+
+# Pasadas de traslado tras un cambio del anillo (los procesos modificados
+# durante una pasada se vuelven a enviar en la siguiente).
+PASADAS_TRASLADO = 3
+
+ERROR_LOTE = formato_error("LOTE no está disponible en modo cluster: no sería atómico entre nodos.")
+ERROR_NO_CLUSTER = formato_error("Este servidor no está en modo cluster.")
+ERROR_NODO_NO_AUTORIZADO = formato_error("NODO solo se acepta de otros nodos del cluster.")
+MENSAJE_BINARIO = "El protocolo binario no está disponible en modo cluster; usa el de texto."
+SIN_PROCESOS = formato_datos("Sin procesos.")
+
+# Cluster activo (None si este servidor no está en un cluster).
+_cluster = None
+
+def _hash(clave):
+    return int.from_bytes(hashlib.blake2b(clave.encode(), digest_size=8).digest(), "big")
+
+"""
+    Anillo de hash consistente. Cada nodo ocupa VIRTUALES puntos; una
+    clave pertenece al nodo del primer punto igual o posterior a su hash.
+    Al añadir un nodo solo cambian de dueño las claves de los tramos que
+    quedan delante de sus puntos.
+"""
+class Anillo:
+    def __init__(self, nodos=(), virtuales=VIRTUALES):
+        self.virtuales = virtuales
+        # Hashes de los puntos, ordenados, y el nodo de cada uno.
+        self.puntos = []
+        self.duenos = []
+        for nodo in nodos:
+            self.agregar(nodo)
+
+    def agregar(self, nodo):
+        for i in range(self.virtuales):
+            punto = _hash(f"{nodo}#{i}")
+            pos = bisect.bisect(self.puntos, punto)
+            self.puntos.insert(pos, punto)
+            self.duenos.insert(pos, nodo)
+
+    """
+        Retorna el nodo dueño de una clave (un PID).
+    """
+    def dueno(self, clave):
+        pos = bisect.bisect_left(self.puntos, _hash(clave))
+        return self.duenos[pos if pos < len(self.puntos) else 0]
+
+"""
+    Convierte "host:puerto" en (host, puerto), o None si no es válida.
+"""
+def parsear_direccion(texto):
+    host, _, puerto = texto.strip().rpartition(":")
+    if not host or not puerto.isdigit():
+        return None
+    return host, int(puerto)
+
+def _id_valido(nodo):
+    return nodo.isdigit() and 1 <= int(nodo) < MAX_NODOS
+
+"""
+    Convierte la lista de nodos de --cluster ("1=host:puerto,2=host:puerto")
+    en un dict id -> (host, puerto). Lanza ValueError si no es válida.
+"""
+def parsear_nodos(texto):
+    nodos = {}
+    for parte in texto.split(","):
+        nodo, _, direccion = parte.strip().partition("=")
+        direccion = parsear_direccion(direccion)
+        if not _id_valido(nodo) or direccion is None:
+            raise ValueError(f"Nodo inválido: {parte!r}. Se necesita id=host:puerto con id entre 1 y {MAX_NODOS - 1}.")
+        if str(int(nodo)) in nodos:
+            raise ValueError(f"Nodo repetido: {nodo}.")
+        nodos[str(int(nodo))] = direccion
+    return nodos
+
+def _filas(respuesta):
+    # "DATOS|fila\nfila..." -> [fila, ...]
+    datos = respuesta.partition("|")[2]
+    return [] if datos == "Sin procesos." else datos.split("\n")
+
+def _pid_fila(fila):
+    return int(fila.partition(":")[0])
+
+"""
+    Orden de TOP y SIGUIENTE para una fila: el de la cola de prioridad de
+    process_manager (mayor prioridad primero y, a igualdad, menor PID).
+"""
+def _orden_prioridad(fila):
+    pid, _, datos = fila.partition(": ")
+    return -process_manager.clave_prioridad(ast.literal_eval(datos)["prioridad"]), int(pid)
+
+"""
+    Un nodo del cluster: el anillo, los pools de conexiones a los otros
+    nodos y los manejadores que enrutan los comandos.
+    id_local: Id de este nodo.
+    nodos: dict id -> (host, puerto) de todos los nodos, incluido este.
+    secreto: Secreto compartido con el que se firman los comandos NODO|.
+"""
+class Cluster:
+    def __init__(self, id_local, nodos, secreto):
+        self.id = id_local
+        self.secreto = secreto.encode()
+        # Los dicts y el anillo no se modifican: UNIR los reemplaza, así
+        # los hilos que enrutan no necesitan lock.
+        self.nodos = dict(nodos)
+        self.anillo = Anillo(self.nodos)
+        self.pools = {}
+        self.lock = threading.Lock()
+        self.reenviados = collections.Counter()
+        self.migrados = 0
+        # Traslados en curso (uno por cambio del anillo).
+        self.trasladando = 0
+        self.ejecutor = concurrent.futures.ThreadPoolExecutor(HILOS_CONSULTA, thread_name_prefix="cluster")
+
+    def _pool(self, nodo):
+        pool = self.pools.get(nodo)
+        if pool is None:
+            with self.lock:
+                pool = self.pools.get(nodo)
+                if pool is None:
+                    host, port = self.nodos[nodo]
+                    pool = self.pools[nodo] = PoolClientes(host, port, CONEXIONES_POR_NODO, TIMEOUT_NODO)
+        return pool
+
+    def firmar(self, cmd):
+        return hmac.new(self.secreto, cmd.encode(), hashlib.sha256).hexdigest()
+
+    """
+        Comprueba un mensaje <firma>|<comando> de otro nodo y retorna el
+        comando, o None si no lo firmó un nodo con el mismo secreto.
+    """
+    def verificar(self, mensaje):
+        firma, _, cmd = mensaje.partition("|")
+        return cmd if hmac.compare_digest(firma.encode(), self.firmar(cmd).encode()) else None
+
+    """
+        Envía cmd firmado a otro nodo como NODO|<firma>|cmd y retorna el texto de su respuesta.
+        Si la conexión se cierra sin respuesta se reintenta una vez con otra:
+        el otro nodo cierra por inactividad las conexiones del pool, y puede
+        hacerlo justo cuando se usan, antes de leer el comando. Un timeout no
+        se reintenta, porque el comando puede haberse ejecutado.
+    """
+    def reenviar(self, nodo, cmd):
+        with self.lock:
+            self.reenviados[nodo] += 1
+        pool = self._pool(nodo)
+        mensaje = f"NODO|{self.firmar(cmd)}|{cmd}"
+        try:
+            try:
+                return pool.enviar(mensaje).texto
+            except ConnectionError:
+                return pool.enviar(mensaje).texto
+        except (OSError, ErrorServidor) as e:
+            registro.advertencia("nodo_no_disponible", nodo=nodo, error=str(e))
+            return formato_error(f"Nodo {nodo} no disponible: {e}")
+
+    """
+        Ejecuta cmd en un nodo (en local si es este) y retorna la respuesta.
+    """
+    def ejecutar(self, nodo, cmd):
+        if nodo == self.id:
+            return self.atender(cmd)
+        return self.reenviar(nodo, cmd)
+
+    """
+        Ejecuta cmd en todos los nodos a la vez: los otros en los hilos del
+        ejecutor y este en el hilo actual. Retorna [(nodo, respuesta)].
+    """
+    def consultar_todos(self, cmd):
+        remotos = [(nodo, self.ejecutor.submit(self.reenviar, nodo, cmd)) for nodo in self.nodos if nodo != self.id]
+        respuestas = [(self.id, self.atender(cmd))]
+        return respuestas + [(nodo, futuro.result()) for nodo, futuro in remotos]
+
+    """
+        Atiende un comando de otro nodo, ya verificado (o de este mismo, sin red).
+    """
+    def atender(self, cmd):
+        partes = cmd.strip().split("|")
+        accion = partes[0].lower()
+        if accion == "crear":
+            return self._crear_con_pid(partes)
+        if accion == "acoger":
+            return self._acoger(cmd.strip().partition("|")[2])
+        if accion == "unir":
+            if len(partes) != 3:
+                return COMANDOS["cluster_unir"].error_argumentos
+            return self.unir(partes[1], partes[2], propagar=False)
+        return command_handler.ejecutar_local(cmd)
+
+    def _crear_con_pid(self, partes):
+        if len(partes) not in (4, 5) or not partes[1].isdigit():
+            return COMANDOS["crear"].error_argumentos
+        ttl = process_manager.parsear_ttl(partes[4]) if len(partes) == 5 else None
+        if len(partes) == 5 and ttl is None:
+            return command_handler.ERROR_TTL
+        ok, msg = process_manager.acoger_proceso(partes[1], partes[2], partes[3], ttl=ttl)
+        return "OK|" + msg if ok else "ERROR|" + msg
+
+    """
+        Guarda los procesos que otro nodo traslada a este. Un PID que ya
+        existe se reemplaza (el otro nodo lo reenvía si cambió tras copiarlo).
+    """
+    def _acoger(self, datos):
+        try:
+            filas = json.loads(datos)
+        except ValueError:
+            return formato_error("NODO|ACOGER necesita una lista JSON de procesos.")
+        for pid, nombre, prioridad, estado, ttl in filas:
+            process_manager.acoger_proceso(str(pid), nombre, prioridad, estado, ttl, reemplazar=True)
+        return formato_ok(f"{len(filas)} procesos acogidos.")
+
+    # --- Manejadores de los comandos enrutados ---
+
+    def crear(self, partes, cmd):
+        if len(partes) not in (3, 4):
+            return COMANDOS["crear"].error_argumentos
+        if len(partes) == 4 and process_manager.parsear_ttl(partes[3]) is None:
+            return command_handler.ERROR_TTL
+        pid = process_manager.reservar_pid()
+        return self.ejecutar(self.anillo.dueno(pid), "|".join(["CREAR", pid, *partes[1:]]))
+
+    """
+        ELIMINAR, MODIFICAR y RENOVAR: al dueño del PID (partes[1]).
+    """
+    def enrutar(self, partes, cmd):
+        return self.ejecutar(self.anillo.dueno(partes[1]), cmd.strip())
+
+    def listar(self, partes, cmd):
+        args = partes[1:]
+        stream = bool(args) and args[0].lower() == "stream"
+        if stream:
+            args = args[1:]
+        filtros = []
+        while args and "=" in args[0]:
+            filtros.append(args.pop(0))
+        if len(args) not in (0, 2):
+            return COMANDOS["listar"].error_argumentos
+        offset, limit = 0, None
+        if args:
+            if not (args[0].isdigit() and args[1].isdigit()):
+                return command_handler.ERROR_PAGINACION
+            offset, limit = int(args[0]), int(args[1])
+        # Cada nodo envía sus primeras offset + limit filas, ya ordenadas por
+        # PID, y se mezclan sin reordenar todo.
+        pedido = ["LISTAR", *filtros]
+        if limit is not None:
+            pedido += ["0", str(offset + limit)]
+        listados = []
+        for _, respuesta in self.consultar_todos("|".join(pedido)):
+            if respuesta.startswith("ERROR|"):
+                return respuesta
+            listados.append(_filas(respuesta))
+        filas = itertools.islice(heapq.merge(*listados, key=_pid_fila), offset,
+                                 None if limit is None else offset + limit)
+        if stream:
+            return command_handler.stream_filas(filas)
+        return formato_datos("\n".join(filas) or "Sin procesos.")
+
+    def top(self, partes, cmd):
+        if not partes[1].isdigit():
+            return COMANDOS["top"].error_argumentos
+        filas = []
+        for _, respuesta in self.consultar_todos(cmd.strip()):
+            if respuesta.startswith("ERROR|"):
+                return respuesta
+            filas += _filas(respuesta)
+        filas = heapq.nsmallest(int(partes[1]), filas, key=_orden_prioridad)
+        return formato_datos("\n".join(filas) or "Sin procesos.")
+
+    """
+        SIGUIENTE: pide el mejor candidato a cada nodo y saca el proceso en
+        el nodo del mejor. Si otro cliente se lo ha llevado antes, ese nodo
+        saca su siguiente; si ya no le queda ninguno, se prueba el siguiente nodo.
+    """
+    def siguiente(self, partes, cmd):
+        candidatos = []
+        for nodo, respuesta in self.consultar_todos("TOP|1"):
+            if respuesta.startswith("ERROR|"):
+                return respuesta
+            candidatos += [(_orden_prioridad(fila), nodo) for fila in _filas(respuesta)]
+        for _, nodo in sorted(candidatos):
+            respuesta = self.ejecutar(nodo, "SIGUIENTE")
+            if respuesta != SIN_PROCESOS:
+                return respuesta
+        return SIN_PROCESOS
+
+    # --- Cambios del anillo ---
+
+    """
+        Añade un nodo al anillo y traslada en segundo plano los procesos que
+        pasan a ser suyos.
+        propagar: True para avisar también a los demás nodos (CLUSTER_UNIR).
+    """
+    def unir(self, nodo, direccion, propagar):
+        direccion = parsear_direccion(direccion)
+        if not _id_valido(nodo) or direccion is None:
+            return COMANDOS["cluster_unir"].error_argumentos
+        nodo = str(int(nodo))
+        with self.lock:
+            actual = self.nodos.get(nodo)
+            if actual is not None and actual != direccion:
+                return formato_error(f"El nodo {nodo} ya existe con otra dirección.")
+            if actual is None:
+                self.nodos = {**self.nodos, nodo: direccion}
+                self.anillo = Anillo(self.nodos)
+        fallidos = []
+        if propagar:
+            aviso = f"UNIR|{nodo}|{direccion[0]}:{direccion[1]}"
+            for otro in self.nodos:
+                if otro != self.id and self.reenviar(otro, aviso).startswith("ERROR|"):
+                    fallidos.append(otro)
+        if actual is None:
+            registro.info("nodo_unido", nodo=nodo, nodos=len(self.nodos))
+            with self.lock:
+                self.trasladando += 1
+            threading.Thread(target=self.rebalancear, name="cluster-traslado", daemon=True).start()
+        if fallidos:
+            return formato_error(f"Nodo {nodo} añadido, pero no se pudo avisar a los nodos {', '.join(fallidos)}.")
+        return formato_ok(f"Nodo {nodo} en el cluster ({len(self.nodos)} nodos).")
+
+    """
+        Envía a su nuevo dueño los procesos de este nodo que ya no le
+        corresponden según el anillo actual.
+    """
+    def rebalancear(self):
+        try:
+            self._rebalancear()
+        finally:
+            with self.lock:
+                self.trasladando -= 1
+
+    def _rebalancear(self):
+        for _ in range(PASADAS_TRASLADO):
+            anillo = self.anillo
+            ajenos = collections.defaultdict(list)
+            for pid, proceso in process_manager.snapshot_procesos():
+                dueno = anillo.dueno(pid)
+                if dueno != self.id:
+                    ajenos[dueno].append((pid, proceso))
+            if not ajenos:
+                return
+            for nodo, procesos in ajenos.items():
+                self._trasladar(nodo, procesos)
+        registro.advertencia("traslado_incompleto", nodo=self.id)
+
+    def _trasladar(self, nodo, procesos):
+        lote, filas, tamano = [], [], 0
+        for i, (pid, proceso) in enumerate(procesos):
+            texto = json.dumps([int(pid), proceso.nombre, proceso.prioridad, proceso.estado,
+                                process_manager.plazo_restante(pid)], separators=(",", ":"))
+            lote.append((pid, proceso))
+            filas.append(texto)
+            tamano += len(texto) + 1
+            if tamano < MAX_ACOGER and i < len(procesos) - 1:
+                continue
+            respuesta = self.reenviar(nodo, f"ACOGER|[{','.join(filas)}]")
+            if respuesta.startswith("ERROR|"):
+                registro.advertencia("traslado_fallido", nodo=nodo, error=respuesta)
+                return
+            # Solo se borra lo que no ha cambiado desde la copia; el resto
+            # se reenvía en la siguiente pasada.
+            cedidos = sum(process_manager.ceder_proceso(p, copia) for p, copia in lote)
+            with self.lock:
+                self.migrados += cedidos
+            lote, filas, tamano = [], [], 0
+
+    def estado(self):
+        procesos = sum(len(shard) for shard in process_manager.shards)
+        lineas = [f"nodo={self.id} nodos={len(self.nodos)} procesos={procesos} migrados={self.migrados} "
+                  f"trasladando={'si' if self.trasladando else 'no'}"]
+        for nodo, (host, port) in sorted(self.nodos.items(), key=lambda item: int(item[0])):
+            local = " (este)" if nodo == self.id else f" reenviados={self.reenviados[nodo]}"
+            lineas.append(f"nodo={nodo} direccion={host}:{port}{local}")
+        return lineas
+
+    def cerrar(self):
+        self.ejecutor.shutdown(wait=False)
+        for pool in self.pools.values():
+            pool.cerrar()
+
+"""
+    Convierte este servidor en el nodo id_local del cluster: desde ahora
+    asigna PIDs con su resto módulo MAX_NODOS y enruta los comandos.
+    nodos: dict id -> (host, puerto) de todos los nodos (ver parsear_nodos).
+    secreto: Secreto compartido por todos los nodos.
+    Con persistencia, se llama después de recuperar el almacén.
+"""
+def activar(id_local, nodos, secreto):
+    global _cluster
+    if _cluster is None:
+        _cluster = Cluster(str(int(id_local)), nodos, secreto)
+        siguiente = int(process_manager.reservar_pid())
+        siguiente += (int(id_local) - siguiente) % MAX_NODOS
+        process_manager.fijar_siguiente_pid(siguiente, MAX_NODOS)
+        for nombre, funcion in (("crear", _cluster.crear), ("eliminar", _cluster.enrutar),
+                                ("modificar", _cluster.enrutar), ("renovar", _cluster.enrutar),
+                                ("listar", _cluster.listar), ("top", _cluster.top),
+                                ("siguiente", _cluster.siguiente), ("lote", lambda partes, cmd: ERROR_LOTE)):
+            command_handler.fijar_manejador(nombre, funcion)
+        protocolo_binario.fijar_no_disponible(MENSAJE_BINARIO)
+        registro.info("cluster_activado", nodo=_cluster.id, nodos=len(nodos))
+    return _cluster
+
+"""
+    Sale del cluster: restaura los manejadores y la asignación de PIDs. Útil en tests.
+"""
+def desactivar():
+    global _cluster
+    if _cluster is not None:
+        for nombre in ("crear", "eliminar", "modificar", "renovar", "listar", "top", "siguiente", "lote"):
+            command_handler.fijar_manejador(nombre, None)
+        protocolo_binario.fijar_no_disponible(None)
+        process_manager.fijar_siguiente_pid(int(process_manager.reservar_pid()))
+        _cluster.cerrar()
+        _cluster = None
+
+"""
+    Líneas de estado de CLUSTER.
+"""
+def estado():
+    return _cluster.estado() if _cluster is not None else ["cluster=no"]
+
+@command_handler.registrar_comando("cluster", 1, "CLUSTER",
+                                   ("CLUSTER - Muestra los nodos del cluster y los procesos de este nodo.",))
+def _cmd_cluster(partes, cmd):
+    return formato_datos("\n".join(estado()))
+
+@command_handler.registrar_comando("cluster_unir", 3, "CLUSTER_UNIR|id|host:puerto",
+                                   ("CLUSTER_UNIR|<id>|<host>:<puerto> - Añade un nodo al cluster y le traslada sus procesos.",))
+def _cmd_cluster_unir(partes, cmd):
+    if _cluster is None:
+        return ERROR_NO_CLUSTER
+    return _cluster.unir(partes[1], partes[2], propagar=True)
+
+# Comando entre nodos; no aparece en AYUDA.
+@command_handler.registrar_comando("nodo")
+def _cmd_nodo(partes, cmd):
+    if _cluster is None:
+        return ERROR_NO_CLUSTER
+    verificado = _cluster.verificar(cmd.strip().partition("|")[2])
+    if verificado is None:
+        registro.advertencia("nodo_no_autorizado")
+        return ERROR_NODO_NO_AUTORIZADO
+    return _cluster.atender(verificado)
@@ -2,7 +2,28 @@
 # Author: Joan Cobeña
 # Description: Módulo para manejar comandos relacionados con procesos.
 
-from process_manager import crear_proceso, listar_procesos, eliminar_proceso, modificar_proceso
+import time
+import eventos
+import metricas
+import planificador
+import registro
+from process_manager import CAMPOS_PROCESO, crear_proceso, listar_procesos, eliminar_proceso, modificar_proceso, iterar_filas, ejecutar_lote, top_procesos, siguiente_proceso, renovar_proceso, parsear_ttl, fila
+
+# Filas enviadas por bloque en LISTAR|STREAM.
+FILAS_POR_BLOQUE = 500
+
+# Máximo de comandos en un LOTE.
+MAX_LOTE = 100000
+
+# Máximo de tics por SIMULAR y de CPUs simuladas.
+MAX_PASOS = 1000000
+MAX_CPUS = 1024
+
+# Comandos permitidos dentro de un LOTE y su aridad (CREAR sin TTL).
+COMANDOS_LOTE = {"crear": 3, "eliminar": 2, "modificar": 4}
+
+# Comandos que modifican el almacén; una réplica de solo lectura los rechaza.
+COMANDOS_ESCRITURA = ("crear", "eliminar", "modificar", "renovar", "lote", "siguiente", "simular")
 
 # Definición de los formatos de respuesta del protocolo
 def formato_ok(mensaje):
@@ -14,66 +35,384 @@ def formato_error(mensaje):
 def formato_datos(datos):
     return f"DATOS|{datos}"
 
+# Línea centinela que cierra un listado en streaming: FIN|<filas enviadas>
+def formato_fin(total):
+    return f"FIN|{total}"
+
+# Respuestas fijas, construidas una sola vez.
+ERROR_NO_RECONOCIDO = formato_error("Comando no reconocido.")
+ERROR_PAGINACION = formato_error("offset y limit deben ser enteros no negativos.")
+ERROR_FILTRO = formato_error(f"Filtro inválido. Se necesita: campo=valor con campo en {', '.join(CAMPOS_PROCESO)}.")
+ERROR_TTL = formato_error("ttl debe ser un número de segundos mayor que 0.")
+RESPUESTA_SALIR = "SALIR|Desconectando."
+RESPUESTA_PING = formato_ok("PONG")
+
+"""
+    Comando registrado en el despachador.
+    nombre: Acción en minúsculas (primera parte del comando).
+    funcion: Manejador funcion(partes, cmd) que retorna la respuesta.
+    aridad: Número exacto de partes (incluida la acción), o None si el
+    manejador valida sus propios argumentos.
+    uso: Forma esperada, usada en el mensaje de argumentos inválidos.
+    ayuda: Líneas "uso - descripción" que se muestran en AYUDA.
+"""
+class Comando:
+    __slots__ = ("nombre", "funcion", "aridad", "error_argumentos", "ayuda")
+
+    def __init__(self, nombre, funcion, aridad, uso, ayuda):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.aridad = aridad
+        self.error_argumentos = formato_error(f"Argumentos inválidos para {nombre.upper()}. Se necesita: {uso}")
+        self.ayuda = ayuda
+
+# Registro de comandos: acción -> Comando. Se recorre en orden para AYUDA.
+COMANDOS = {}
+
+# Tabla de despacho: acción en minúsculas y en mayúsculas ->
+# (funcion, aridad, error_argumentos, metrica). Evita llamar a lower() en
+# el caso habitual (CREAR, LISTAR, ...) y los accesos a atributos por comando.
+_DESPACHO = {}
+
+# Acciones no registradas se cuentan juntas, sin crear una métrica por texto recibido.
+_METRICA_DESCONOCIDO = metricas.metrica_comando("desconocido")
+
+# Respuesta de AYUDA ya formateada; se reconstruye al registrar un comando.
+_respuesta_ayuda = formato_datos("Comandos disponibles:")
+
+"""
+    Decorador que registra un manejador de comando.
+    nombre: Acción en minúsculas.
+    aridad: Número exacto de partes, o None para validar en el manejador.
+    uso: Forma esperada del comando.
+    ayuda: Líneas de ayuda del comando (tupla de cadenas).
+    Los comandos nuevos se añaden sin tocar procesar_comando.
+"""
+def registrar_comando(nombre, aridad=None, uso="", ayuda=()):
+    def decorador(funcion):
+        global _respuesta_ayuda
+        comando = Comando(nombre, funcion, aridad, uso, ayuda)
+        COMANDOS[nombre] = comando
+        entrada = (funcion, aridad, comando.error_argumentos, metricas.metrica_comando(nombre))
+        _DESPACHO[nombre] = entrada
+        _DESPACHO[nombre.upper()] = entrada
+        lineas = ["Comandos disponibles:"]
+        lineas += [linea for c in COMANDOS.values() for linea in c.ayuda]
+        _respuesta_ayuda = formato_datos("\n".join(lineas))
+        return funcion
+    return decorador
+
+"""
+    Pone el servidor en solo lectura (una réplica): los comandos de
+    COMANDOS_ESCRITURA responden ERROR|<mensaje> sin tocar el almacén.
+    Cambia la tabla de despacho, así no cuesta nada en cada comando.
+    mensaje: Texto del error, o None para volver a aceptar escrituras.
+"""
+def fijar_solo_lectura(mensaje):
+    error = None if mensaje is None else formato_error(mensaje)
+    for nombre in COMANDOS_ESCRITURA:
+        comando = COMANDOS[nombre]
+        metrica = _DESPACHO[nombre][3]
+        if error is None:
+            entrada = (comando.funcion, comando.aridad, comando.error_argumentos, metrica)
+        else:
+            entrada = (lambda partes, cmd: error, None, comando.error_argumentos, metrica)
+        _DESPACHO[nombre] = _DESPACHO[nombre.upper()] = entrada
+
+"""
+    Reemplaza el manejador de un comando registrado (por ejemplo, el modo
+    cluster enruta CREAR, ELIMINAR... al nodo dueño). Se mantienen la
+    aridad, el mensaje de uso y la métrica del comando.
+    funcion: Nuevo manejador funcion(partes, cmd), o None para restaurar
+    el registrado.
+"""
+def fijar_manejador(nombre, funcion):
+    comando = COMANDOS[nombre]
+    entrada = (funcion or comando.funcion, comando.aridad, comando.error_argumentos, _DESPACHO[nombre][3])
+    _DESPACHO[nombre] = _DESPACHO[nombre.upper()] = entrada
+
+"""
+    Ejecuta un comando con el manejador registrado, sin pasar por la tabla
+    de despacho: lo que haya cambiado fijar_manejador no se aplica. Así un
+    nodo del cluster atiende localmente lo que otro nodo le reenvía.
+    Las métricas y la auditoría son las del comando que lo llama.
+"""
+def ejecutar_local(cmd):
+    partes = cmd.strip().split('|')
+    comando = COMANDOS.get(partes[0].lower())
+    if comando is None:
+        return ERROR_NO_RECONOCIDO
+    if comando.aridad is not None and len(partes) != comando.aridad:
+        return comando.error_argumentos
+    return comando.funcion(partes, cmd)
+
+"""
+    Genera la respuesta de LISTAR|STREAM por bloques de texto.
+    Envía una cabecera DATOS|STREAM, las filas en bloques de
+    FILAS_POR_BLOQUE líneas y termina con la línea FIN|<total>.
+    Cada bloque ya incluye sus saltos de línea.
+"""
+def stream_listado(offset=0, limit=None, filtros=None):
+    return stream_filas(iterar_filas(offset, limit, filtros))
+
+"""
+    Igual que stream_listado, con las filas ("pid: info") ya dadas.
+"""
+def stream_filas(filas):
+    yield formato_datos("STREAM") + "\n"
+    bloque = []
+    total = 0
+    for texto in filas:
+        bloque.append(texto)
+        total += 1
+        if len(bloque) == FILAS_POR_BLOQUE:
+            yield "\n".join(bloque) + "\n"
+            bloque = []
+    if bloque:
+        yield "\n".join(bloque) + "\n"
+    yield formato_fin(total) + "\n"
+
+"""
+    Retorna n si la línea es una cabecera LOTE|n válida, o None si no lo es.
+    linea: Primera línea de un posible lote.
+"""
+def tamano_lote(linea):
+    partes = linea.strip().split('|')
+    if len(partes) != 2 or partes[0].lower() != "lote" or not partes[1].isdigit():
+        return None
+    n = int(partes[1])
+    return n if n <= MAX_LOTE else None
+
+"""
+    Retorna cuántas líneas anuncia una cabecera LOTE|n (aunque sea inválida,
+    por ejemplo con n > MAX_LOTE o con más campos), o None si la línea no
+    empieza por LOTE|<número>. El framer descarta esas líneas si la
+    cabecera es inválida, en vez de ejecutarlas una a una.
+"""
+def lineas_anunciadas_lote(linea):
+    partes = linea.strip().split('|')
+    if len(partes) < 2 or partes[0].lower() != "lote" or not partes[1].isdigit():
+        return None
+    return int(partes[1])
+
+"""
+    Ejecuta un LOTE de forma atómica.
+    lineas: Cabecera LOTE|n seguida de n comandos CREAR, ELIMINAR o MODIFICAR.
+    Todos los comandos se validan antes de ejecutar ninguno y se aplican
+    con una sola adquisición de los locks del almacén; si uno falla no se
+    aplica ninguno.
+    Retorna DATOS| con una línea OK|... por comando, o un ERROR|.
+"""
+def procesar_lote_atomico(lineas):
+    n = tamano_lote(lineas[0])
+    if n is None:
+        return formato_error(f"Argumentos inválidos para LOTE. Se necesita: LOTE|n (n <= {MAX_LOTE}) seguido de n comandos")
+    comandos = lineas[1:]
+    if len(comandos) != n:
+        return formato_error(f"Lote incompleto: se esperaban {n} comandos y llegaron {len(comandos)}.")
+
+    operaciones = []
+    for k, comando in enumerate(comandos, 1):
+        partes = comando.strip().split('|')
+        accion = partes[0].lower()
+        if accion not in COMANDOS_LOTE:
+            return formato_error(f"Comando {k} no permitido en LOTE: solo CREAR, ELIMINAR y MODIFICAR.")
+        if len(partes) != COMANDOS_LOTE[accion]:
+            return formato_error(f"Argumentos inválidos en el comando {k} del LOTE.")
+        operaciones.append((accion, *partes[1:]))
+
+    ok, resultado = ejecutar_lote(operaciones)
+    if not ok:
+        return formato_error(resultado)
+    return formato_datos("\n".join(formato_ok(msg) for msg in resultado))
+
+"""
+    Convierte los argumentos offset y limit de LISTAR en enteros.
+    Retorna (offset, limit) o None si no son enteros no negativos.
+"""
+def _parsear_paginacion(offset, limit):
+    if not (offset.isdigit() and limit.isdigit()):
+        return None
+    return int(offset), int(limit)
+
+@registrar_comando("crear", None, "CREAR|nombre|prioridad[|ttl]",
+                   ("CREAR|<nombre>|<prioridad> - Crea un nuevo proceso.",
+                    "CREAR|<nombre>|<prioridad>|<ttl> - Crea un proceso que se elimina solo tras <ttl> segundos sin RENOVAR."))
+def _cmd_crear(partes, cmd):
+    if len(partes) == 3:
+        ok, msg = crear_proceso(partes[1], partes[2])
+    elif len(partes) == 4:
+        ttl = parsear_ttl(partes[3])
+        if ttl is None:
+            return ERROR_TTL
+        ok, msg = crear_proceso(partes[1], partes[2], ttl)
+    else:
+        return COMANDOS["crear"].error_argumentos
+    return "OK|" + msg if ok else "ERROR|" + msg
+
+@registrar_comando("listar", None, "LISTAR[|STREAM][|campo=valor...][|offset|limit]",
+                   ("LISTAR - Lista todos los procesos.",
+                    "LISTAR|<offset>|<limit> - Lista una página de procesos.",
+                    "LISTAR|<campo>=<valor> - Lista los procesos con ese valor (se pueden combinar varios).",
+                    "LISTAR|STREAM - Lista en bloques, terminando con FIN|<total>."))
+def _cmd_listar(partes, cmd):
+    args = partes[1:]
+    stream = bool(args) and args[0].lower() == "stream"
+    if stream:
+        args = args[1:]
+    filtros = []
+    while args and "=" in args[0]:
+        campo, _, valor = args.pop(0).partition("=")
+        campo = campo.lower()
+        if campo not in CAMPOS_PROCESO:
+            return ERROR_FILTRO
+        filtros.append((campo, valor))
+    if len(args) not in (0, 2):
+        return COMANDOS["listar"].error_argumentos
+    offset, limit = 0, None
+    if args:
+        paginacion = _parsear_paginacion(*args)
+        if paginacion is None:
+            return ERROR_PAGINACION
+        offset, limit = paginacion
+    if stream:
+        return stream_listado(offset, limit, filtros)
+    return formato_datos(listar_procesos(offset, limit, filtros))
+
+@registrar_comando("eliminar", 2, "ELIMINAR|id",
+                   ("ELIMINAR|<id> - Elimina un proceso por su ID.",))
+def _cmd_eliminar(partes, cmd):
+    ok, msg = eliminar_proceso(partes[1])
+    return "OK|" + msg if ok else "ERROR|" + msg
+
+@registrar_comando("modificar", 4, "MODIFICAR|id|campo|valor",
+                   ("MODIFICAR|<id>|<campo>|<valor> - Modifica un campo de un proceso.",))
+def _cmd_modificar(partes, cmd):
+    ok, msg = modificar_proceso(partes[1], partes[2], partes[3])
+    return "OK|" + msg if ok else "ERROR|" + msg
+
+@registrar_comando("renovar", 3, "RENOVAR|id|ttl",
+                   ("RENOVAR|<id>|<ttl> - El proceso caducará <ttl> segundos después de ahora.",))
+def _cmd_renovar(partes, cmd):
+    ttl = parsear_ttl(partes[2])
+    if ttl is None:
+        return ERROR_TTL
+    ok, msg = renovar_proceso(partes[1], ttl)
+    return "OK|" + msg if ok else "ERROR|" + msg
+
+@registrar_comando("lote", None, "",
+                   ("LOTE|<n> - Ejecuta los n comandos siguientes (CREAR/ELIMINAR/MODIFICAR) de forma atómica.",))
+def _cmd_lote(partes, cmd):
+    return procesar_lote_atomico(cmd.strip().split('\n'))
+
+@registrar_comando("top", 2, "TOP|k",
+                   ("TOP|<k> - Lista los k procesos listos (activos) de mayor prioridad.",))
+def _cmd_top(partes, cmd):
+    if not partes[1].isdigit():
+        return COMANDOS["top"].error_argumentos
+    procesos = top_procesos(int(partes[1]))
+    return formato_datos("\n".join([fila(pid, info) for pid, info in procesos]) or "Sin procesos.")
+
+@registrar_comando("siguiente", 1, "SIGUIENTE",
+                   ("SIGUIENTE - Saca el proceso listo de mayor prioridad y lo marca como ejecutando.",))
+def _cmd_siguiente(partes, cmd):
+    siguiente = siguiente_proceso()
+    if siguiente is None:
+        return formato_datos("Sin procesos.")
+    pid, info = siguiente
+    return formato_datos(fila(pid, info))
+
+@registrar_comando("suscribir", None, "SUSCRIBIR[|seq]",
+                   ("SUSCRIBIR[|<seq>] - Recibe eventos EVENTO|... de cada cambio (desde <seq> si se indica) hasta desconectar.",))
+def _cmd_suscribir(partes, cmd):
+    if len(partes) > 2 or (len(partes) == 2 and not partes[1].isdigit()):
+        return COMANDOS["suscribir"].error_argumentos
+    return eventos.suscribir(int(partes[1]) if len(partes) == 2 else None)
+
+@registrar_comando("simular", None, f"SIMULAR|pasos[|algoritmo[|cpus]] (pasos <= {MAX_PASOS}, algoritmo en {', '.join(planificador.ALGORITMOS)})",
+                   ("SIMULAR|<pasos>[|<algoritmo>[|<cpus>]] - Avanza la simulación de planificación sobre los procesos activos.",))
+def _cmd_simular(partes, cmd):
+    algoritmo = partes[2].lower() if len(partes) > 2 else None
+    cpus = partes[3] if len(partes) > 3 else "1"
+    if (not 2 <= len(partes) <= 4 or not partes[1].isdigit() or int(partes[1]) > MAX_PASOS
+            or (algoritmo is not None and algoritmo not in planificador.ALGORITMOS)
+            or not cpus.isdigit() or not 1 <= int(cpus) <= MAX_CPUS):
+        return COMANDOS["simular"].error_argumentos
+    actual, despachos, terminados = planificador.simular(int(partes[1]), algoritmo, int(cpus) if len(partes) > 3 else None)
+    return formato_ok(f"Tiempo {actual.tiempo}: {despachos} despachos, {terminados} terminados.")
+
+@registrar_comando("estado_planificador", 1, "ESTADO_PLANIFICADOR",
+                   ("ESTADO_PLANIFICADOR - Muestra el algoritmo, el reloj y las estadísticas de la simulación.",))
+def _cmd_estado_planificador(partes, cmd):
+    lineas = planificador.resumen()
+    return formato_datos("\n".join(lineas) if lineas else "Sin simulación.")
+
+@registrar_comando("estadisticas", 1, "ESTADISTICAS",
+                   ("ESTADISTICAS - Muestra contadores y latencias por comando, uso de locks, conexiones y bytes.",))
+def _cmd_estadisticas(partes, cmd):
+    return formato_datos("\n".join(metricas.resumen()))
+
+@registrar_comando("ping", 1, "PING",
+                   ("PING - Responde OK|PONG (los clientes lo usan para delimitar respuestas de varias líneas).",))
+def _cmd_ping(partes, cmd):
+    return RESPUESTA_PING
+
+@registrar_comando("ayuda")
+def _cmd_ayuda(partes, cmd):
+    return _respuesta_ayuda
+
+@registrar_comando("salir", None, "", ("SALIR - Desconecta del servidor.",))
+def _cmd_salir(partes, cmd):
+    return RESPUESTA_SALIR
+
 """
     Procesa un comando de gestión de procesos.
     cmd: Comando a procesar.
-    Retorna un mensaje indicando el resultado de la operación.
+    Retorna un mensaje indicando el resultado de la operación, un
+    generador de bloques de texto para LISTAR|STREAM o un
+    eventos.Suscriptor para SUSCRIBIR.
+    La acción se busca en el registro COMANDOS, que valida la aridad
+    antes de llamar al manejador.
     Los comandos válidos son:
-    - CREAR|<nombre>|<prioridad>
+    - CREAR|<nombre>|<prioridad>[|<ttl>]
     - LISTAR
+    - LISTAR|<offset>|<limit>
+    - LISTAR|<campo>=<valor>[|<campo>=<valor>...][|<offset>|<limit>]
+    - LISTAR|STREAM[|<campo>=<valor>...][|<offset>|<limit>]
     - ELIMINAR|<id>
     - MODIFICAR|<id>|<campo>|<valor>
+    - RENOVAR|<id>|<ttl>
+    - LOTE|<n> seguido de n comandos, uno por línea (en el mismo cmd)
+    - TOP|<k>
+    - SIGUIENTE
+    - SUSCRIBIR[|<seq>]
+    - SIMULAR|<pasos>[|<algoritmo>[|<cpus>]]
+    - ESTADO_PLANIFICADOR
+    - ESTADISTICAS
+    - PING
 """
 def procesar_comando(cmd):
-    # 1. Usamos el delimitador |
+    inicio = time.perf_counter_ns()
+    # 1. Usamos el delimitador |. En un LOTE multilínea solo importa
+    # partes[0] (la acción), que va antes del primer | y del primer salto.
     partes = cmd.strip().split('|')
-    if not partes:
-        return formato_error("Comando vacío.")
-
-    accion = partes[0].lower()
-    
-    try:
-        if accion == "crear":
-            if len(partes) != 3:
-                return formato_error("Argumentos inválidos para CREAR. Se necesita: CREAR|nombre|prioridad")
-            _, nombre, prioridad = partes
-            ok, msg = crear_proceso(nombre, prioridad)
-            return formato_ok(msg) if ok else formato_error(msg)
-
-        elif accion == "listar":
-            datos_procesos = listar_procesos()
-            return formato_datos(datos_procesos)
-
-        elif accion == "eliminar":
-            if len(partes) != 2:
-                return formato_error("Argumentos inválidos para ELIMINAR. Se necesita: ELIMINAR|id")
-            _, id_ = partes
-            ok, msg = eliminar_proceso(id_)
-            return formato_ok(msg) if ok else formato_error(msg)
-            
-        elif accion == "modificar":
-            if len(partes) != 4:
-                return formato_error("Argumentos inválidos para MODIFICAR. Se necesita: MODIFICAR|id|campo|valor")
-            _, id_, campo, valor = partes
-            ok, msg = modificar_proceso(id_, campo, valor)
-            return formato_ok(msg) if ok else formato_error(msg)
-        
-        elif accion == "ayuda":
-            ayuda = (
-                "Comandos disponibles:\n"
-                "CREAR|<nombre>|<prioridad> - Crea un nuevo proceso.\n"
-                "LISTAR - Lista todos los procesos.\n"
-                "ELIMINAR|<id> - Elimina un proceso por su ID.\n"
-                "MODIFICAR|<id>|<campo>|<valor> - Modifica un campo de un proceso.\n"
-                "SALIR - Desconecta del servidor."
-            )
-            return formato_datos(ayuda)
-
-        elif accion == "salir":
-            return "SALIR|Desconectando."
-
+    entrada = _DESPACHO.get(partes[0]) or _DESPACHO.get(partes[0].lower())
+    if entrada is None:
+        metrica, respuesta = _METRICA_DESCONOCIDO, ERROR_NO_RECONOCIDO
+    else:
+        funcion, aridad, error_argumentos, metrica = entrada
+        if aridad is not None and len(partes) != aridad:
+            respuesta = error_argumentos
         else:
-            return formato_error("Comando no reconocido.")
-            
-    except Exception as e:
-        return formato_error(f"Error inesperado en el servidor: {str(e)}")
\ No newline at end of file
+            try:
+                respuesta = funcion(partes, cmd)
+            except Exception as e:
+                registro.error("comando_fallido", traza=True, accion=metrica.nombre, comando=cmd[:registro.MAX_COMANDO])
+                respuesta = formato_error(f"Error inesperado en el servidor: {str(e)}")
+
+    # En LISTAR|STREAM se mide hasta tener el generador, no el envío de las filas.
+    error = respuesta.__class__ is str and respuesta.startswith("ERROR|")
+    duracion = metrica.observar(inicio, error)
+    if registro.auditoria:
+        registro.auditar(metrica.nombre, cmd, duracion, error)
+    return respuesta
@@ -0,0 +1,194 @@
+# eventos.py
+# Description: Eventos del ciclo de vida de los procesos y suscripciones
+# (SUSCRIBIR). Las mutaciones del almacén se convierten en eventos con un
+# número de secuencia global y se reparten a los suscriptores, en lugar de
+# que los clientes sondeen LISTAR.
+#
+# Cada suscriptor tiene una cola acotada que agrupa los eventos pendientes
+# por PID (varias modificaciones seguidas llegan como una sola, y un
+# proceso creado y eliminado antes de enviarse no llega). Si un
+# suscriptor lento acumula más PIDs pendientes que el límite, se descartan
+# y recibe un evento "desbordado": debe resincronizar con LISTAR.
+#
+# Formato de cada evento (una línea):
+#   EVENTO|<seq>|creado|<pid>|nombre=<n>|prioridad=<p>|estado=<e>
+#   EVENTO|<seq>|modificado|<pid>|<campo>=<valor>[|<campo>=<valor>...]
+#   EVENTO|<seq>|eliminado|<pid>
+#   EVENTO|<seq>|reiniciado
+#   EVENTO|<seq>|desbordado
+#   EVENTO|<seq>|latido            (sin eventos en LATIDO segundos)
+
+import collections
+import threading
+import process_manager
+
+# Eventos recientes que se guardan para reanudar con SUSCRIBIR|<seq>.
+HISTORIAL = 10000
+
+# PIDs distintos pendientes por suscriptor antes de desbordar.
+MAX_PENDIENTES = 1000
+
+# Segundos sin eventos tras los que se envía un latido (también sirve
+# para detectar que el cliente se ha ido).
+LATIDO = 15.0
+
+# Protege la secuencia, el historial y las colas de los suscriptores. Se
+# toma dentro del lock de la partición (el observador se llama con él).
+_lock = threading.Lock()
+_secuencia = 0
+_historial = collections.deque(maxlen=HISTORIAL)
+_suscriptores = set()
+_activo = False
+
+_CAMPOS_CREADO = ("nombre", "prioridad", "estado")
+
+"""
+    Convierte una mutación del almacén en eventos (tipo, pid, campos).
+"""
+def _traducir(mutacion):
+    tipo = mutacion[0]
+    if tipo == "c":
+        _, pid, nombre, prioridad = mutacion
+        yield "creado", pid, dict(zip(_CAMPOS_CREADO, (nombre, prioridad, process_manager.ESTADO_LISTO)))
+    elif tipo == "m":
+        _, pid, campo, valor = mutacion
+        yield "modificado", pid, {campo: valor}
+    elif tipo == "e":
+        yield "eliminado", mutacion[1], {}
+    elif tipo == "l":
+        for interna in mutacion[1]:
+            yield from _traducir(interna)
+    elif tipo == "r":
+        yield "reiniciado", None, {}
+
+"""
+    Observador del almacén: numera cada evento, lo guarda en el historial
+    y lo encola en cada suscriptor.
+"""
+def _al_mutar(mutacion):
+    global _secuencia
+    with _lock:
+        for tipo, pid, campos in _traducir(mutacion):
+            _secuencia += 1
+            evento = (_secuencia, tipo, pid, campos)
+            _historial.append(evento)
+            for suscriptor in _suscriptores:
+                suscriptor._encolar(evento)
+
+def _formatear(evento):
+    seq, tipo, pid, campos = evento
+    if pid is None:
+        return f"EVENTO|{seq}|{tipo}\n"
+    return f"EVENTO|{seq}|{tipo}|{pid}" + "".join([f"|{c}={v}" for c, v in campos.items()]) + "\n"
+
+"""
+    Suscripción de una conexión. La crea suscribir(); la conexión envía
+    inicial y después los bloques de esperar() (hilos) o extraer()
+    (asyncio) hasta que el cliente se desconecta, y llama a cancelar().
+"""
+class Suscriptor:
+    def __init__(self, max_pendientes):
+        self.max_pendientes = max_pendientes
+        # pid -> evento agrupado, en orden de su último cambio.
+        self.pendientes = collections.OrderedDict()
+        self.desbordado = None
+        self.condicion = threading.Condition(_lock)
+        # Función sin argumentos que avisa a un bucle asyncio; se llama con
+        # _lock tomado, así que debe ser inmediata (call_soon_threadsafe).
+        self.despertador = None
+        self.avisado = False
+        self.inicial = ""
+
+    # Llamar con _lock tomado.
+    def _encolar(self, evento):
+        seq, tipo, pid, campos = evento
+        if tipo == "reiniciado":
+            self.pendientes.clear()
+            self.pendientes[None] = evento
+        else:
+            anterior = self.pendientes.pop(pid, None)
+            if anterior is None or anterior[1] == "reiniciado":
+                nuevo = evento
+            elif tipo == "modificado":
+                nuevo = (seq, anterior[1], pid, {**anterior[3], **campos})
+            elif tipo == "eliminado" and anterior[1] == "creado":
+                nuevo = None
+            else:
+                nuevo = evento
+            if nuevo is not None:
+                self.pendientes[pid] = nuevo
+            if len(self.pendientes) > self.max_pendientes:
+                self.pendientes.clear()
+                self.desbordado = seq
+        self.condicion.notify()
+        if self.despertador is not None and not self.avisado:
+            self.avisado = True
+            self.despertador()
+
+    # Llamar con _lock tomado.
+    def _tomar(self):
+        eventos = list(self.pendientes.values())
+        self.pendientes.clear()
+        desbordado, self.desbordado = self.desbordado, None
+        self.avisado = False
+        return desbordado, eventos
+
+    @staticmethod
+    def _bloque(desbordado, eventos):
+        lineas = [f"EVENTO|{desbordado}|desbordado\n"] if desbordado is not None else []
+        lineas += [_formatear(evento) for evento in eventos]
+        return "".join(lineas)
+
+    """
+        Retorna los eventos pendientes como un bloque de texto, o "" si no hay.
+    """
+    def extraer(self):
+        with _lock:
+            desbordado, eventos = self._tomar()
+        return self._bloque(desbordado, eventos)
+
+    """
+        Espera hasta timeout segundos a que haya eventos y los retorna como
+        un bloque de texto; si no llega ninguno, retorna un latido.
+    """
+    def esperar(self, timeout=LATIDO):
+        with _lock:
+            if not self.pendientes and self.desbordado is None:
+                self.condicion.wait(timeout)
+            desbordado, eventos = self._tomar()
+            secuencia = _secuencia
+        return self._bloque(desbordado, eventos) or f"EVENTO|{secuencia}|latido\n"
+
+"""
+    Crea una suscripción a los eventos del almacén.
+    desde: Último número de secuencia recibido para reanudar (None = solo
+    eventos nuevos). Si los eventos posteriores ya no están en el
+    historial, la suscripción empieza con un evento "desbordado".
+    Retorna el Suscriptor, con inicial = "OK|Suscrito desde <seq>.\n".
+"""
+def suscribir(desde=None, max_pendientes=MAX_PENDIENTES):
+    global _activo
+    suscriptor = Suscriptor(max_pendientes)
+    with _lock:
+        if not _activo:
+            # El observador solo se registra con la primera suscripción, así
+            # sin suscriptores las mutaciones no pagan el coste de los eventos.
+            process_manager.registrar_observador(_al_mutar)
+            _activo = True
+        if desde is not None and desde != _secuencia:
+            if desde < _secuencia and _historial and _historial[0][0] <= desde + 1:
+                for evento in _historial:
+                    if evento[0] > desde:
+                        suscriptor._encolar(evento)
+            else:
+                suscriptor.desbordado = _secuencia
+        _suscriptores.add(suscriptor)
+        suscriptor.inicial = f"OK|Suscrito desde {desde if desde is not None else _secuencia}.\n"
+    return suscriptor
+
+"""
+    Da de baja una suscripción.
+"""
+def cancelar(suscriptor):
+    with _lock:
+        _suscriptores.discard(suscriptor)
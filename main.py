@@ -2,48 +2,441 @@
 # Author: Joan Cobeña
 # Description: Servidor de procesos que maneja comandos de gestión de procesos.
 
+import argparse
+import asyncio
+import functools
+import select
 import socket
-import threading
-from command_handler import procesar_comando
+import cluster
+import eventos
+import metricas
+import persistencia
+import registro
+import replicacion
+import supervisor
+from pool_conexiones import PoolConexiones
+from protocolo import Sesion
+from servidor_multiproceso import iniciar_servidor_multiproceso
+
+# Modos de servidor disponibles al arrancar.
+MODO_HILOS = "hilos"
+MODO_ASYNC = "async"
+MODO_MULTIPROCESO = "multiproceso"
+MODOS = (MODO_HILOS, MODO_ASYNC, MODO_MULTIPROCESO)
+
+MENSAJE_BIENVENIDA = b"Servidor de procesos conectado.\n"
+
+# Bytes leídos por llamada a recv; varios comandos pueden llegar juntos.
+TAM_LECTURA = 65536
+
+# Límites por defecto: conexiones atendidas a la vez, conexiones aceptadas
+# que pueden esperar turno, segundos sin recibir datos antes de cerrar y
+# segundos que una conexión puede esperar turno antes de responderle ERROR|Ocupado.
+HILOS_POR_DEFECTO = 128
+COLA_POR_DEFECTO = 256
+TIMEOUT_INACTIVIDAD = 300.0
+ESPERA_COLA = 10.0
+
+RESPUESTA_OCUPADO = b"ERROR|Ocupado\n"
+RESPUESTA_INACTIVIDAD = b"ERROR|Tiempo de inactividad agotado.\n"
+
+"""
+    Rechaza una conexión con el servidor saturado: envía ERROR|Ocupado y la cierra.
+"""
+def rechazar_conexion(conn):
+    try:
+        conn.sendall(RESPUESTA_OCUPADO)
+    except OSError:
+        pass
+    conn.close()
 
 """
     Maneja la conexión de un cliente y procesa sus comandos.
     conn: Socket de conexión del cliente.
     addr: Dirección del cliente.
     Envía respuestas al cliente según los comandos recibidos.
+    Los comandos se separan por '\n'; si una lectura trae varios, sus
+    respuestas se envían en orden con un único sendall (salvo los
+    listados en streaming, que se envían por bloques).
+    Si la primera línea es BINARIO, la conexión pasa al protocolo binario.
+    Con persistencia activa, las respuestas se envían cuando las
+    mutaciones que confirman ya están en el WAL en disco.
+    crear_sesion: Fábrica de la Sesion de protocolo de la conexión.
+    Si el socket tiene timeout y vence sin recibir datos, se avisa al
+    cliente y se cierra la conexión.
 """
-def manejar_cliente(conn, addr):
-    print(f"[+] Conexión establecida con {addr}")
-    conn.sendall(b"Servidor de procesos conectado.\n")
+def manejar_cliente(conn, addr, crear_sesion=Sesion):
+    registro.info("conexion_abierta", cliente=addr)
+    metricas.conexion_abierta()
+    try:
+        _atender_conexion(conn, crear_sesion)
+    finally:
+        metricas.conexion_cerrada()
+        registro.info("conexion_cerrada", cliente=addr)
+        conn.close()
+
+def _atender_conexion(conn, crear_sesion):
+    try:
+        conn.sendall(MENSAJE_BIENVENIDA)
+    except OSError:
+        return
+    sesion = crear_sesion()
+    # Buffer de lectura de la conexión: recv_into escribe en él y el framer
+    # recibe una vista, sin crear un bytes por lectura.
+    entrada = bytearray(TAM_LECTURA)
+    vista = memoryview(entrada)
 
     while True:
         try:
-            data = conn.recv(1024).decode(errors='ignore')
-            if not data:
+            n = conn.recv_into(entrada)
+            metricas.recibidos(n)
+            bloques = sesion.recibir(vista[:n]) if n else sesion.cerrar()
+            for bloque in bloques:
+                if bloque.__class__ is eventos.Suscriptor:
+                    servir_suscripcion(conn, bloque)
+                    return
+                persistencia.esperar_durable()
+                conn.sendall(bloque)
+                metricas.enviados(len(bloque))
+            if not n:
                 break
-            respuesta = procesar_comando(data)
-            conn.sendall((respuesta + '\n').encode())
-        except ConnectionResetError:
+        except ValueError as e:
+            try:
+                conn.sendall(sesion.respuesta_error(e))
+            except OSError:
+                pass
+            break
+        except TimeoutError:
+            try:
+                conn.sendall(RESPUESTA_INACTIVIDAD)
+            except OSError:
+                pass
+            break
+        except OSError:
+            # Conexión reiniciada, tubería rota o socket inválido: no hay a quién responder.
             break
 
-    print(f"[-] Conexión cerrada con {addr}")
-    conn.close()
+"""
+    Envía los eventos de una suscripción (SUSCRIBIR) hasta que el cliente
+    se desconecta. Lo que envíe el cliente mientras tanto se descarta.
+    conn: Socket (o cualquier objeto con sendall/recv/fileno).
+    suscriptor: eventos.Suscriptor creado por el comando.
+"""
+def servir_suscripcion(conn, suscriptor):
+    try:
+        bloque = suscriptor.inicial
+        while True:
+            datos = bloque.encode()
+            conn.sendall(datos)
+            metricas.enviados(len(datos))
+            if select.select([conn], [], [], 0)[0] and not conn.recv(TAM_LECTURA):
+                return
+            bloque = suscriptor.esperar()
+    except OSError:
+        pass
+    finally:
+        eventos.cancelar(suscriptor)
+
+"""
+    Versión asyncio de servir_suscripcion: espera a la vez nuevos eventos
+    (avisados desde los hilos que mutan el almacén) y el cierre del cliente.
+"""
+async def servir_suscripcion_async(reader, writer, suscriptor):
+    bucle = asyncio.get_running_loop()
+    aviso = asyncio.Event()
+    suscriptor.despertador = lambda: bucle.call_soon_threadsafe(aviso.set)
+    lectura = asyncio.ensure_future(reader.read(TAM_LECTURA))
+    try:
+        bloque = suscriptor.inicial
+        while True:
+            if bloque:
+                datos = bloque.encode()
+                writer.write(datos)
+                await writer.drain()
+                metricas.enviados(len(datos))
+            aviso.clear()
+            bloque = suscriptor.extraer()
+            if bloque:
+                continue
+            espera = asyncio.ensure_future(aviso.wait())
+            hechas, _ = await asyncio.wait({espera, lectura}, timeout=eventos.LATIDO,
+                                           return_when=asyncio.FIRST_COMPLETED)
+            espera.cancel()
+            if lectura in hechas:
+                if not lectura.result():
+                    return
+                lectura = asyncio.ensure_future(reader.read(TAM_LECTURA))
+            if not hechas:
+                bloque = suscriptor.esperar(0)
+    finally:
+        lectura.cancel()
+        eventos.cancelar(suscriptor)
+
+"""
+    Versión asyncio de manejar_cliente.
+    reader: StreamReader de la conexión del cliente.
+    writer: StreamWriter de la conexión del cliente.
+    Usa el mismo protocolo y procesar_comando que el modo con hilos,
+    pero sin bloquear un hilo por cliente mientras espera datos.
+    timeout: Segundos sin recibir datos antes de cerrar (None = sin límite).
+"""
+async def manejar_cliente_async(reader, writer, timeout=None):
+    addr = writer.get_extra_info("peername")
+    registro.info("conexion_abierta", cliente=addr)
+    metricas.conexion_abierta()
+    sesion = Sesion()
+
+    try:
+        writer.write(MENSAJE_BIENVENIDA)
+        await writer.drain()
+        while True:
+            try:
+                data = await asyncio.wait_for(reader.read(TAM_LECTURA), timeout)
+            except TimeoutError:
+                writer.write(RESPUESTA_INACTIVIDAD)
+                await writer.drain()
+                break
+            metricas.recibidos(len(data))
+            if not data:
+                bloques = sesion.cerrar()
+            else:
+                try:
+                    bloques = sesion.recibir(data)
+                except ValueError as e:
+                    writer.write(sesion.respuesta_error(e))
+                    await writer.drain()
+                    break
+            for bloque in bloques:
+                if bloque.__class__ is eventos.Suscriptor:
+                    await servir_suscripcion_async(reader, writer, bloque)
+                    data = None
+                    break
+                try:
+                    await esperar_durable_async()
+                except ValueError as e:
+                    writer.write(sesion.respuesta_error(e))
+                    await writer.drain()
+                    data = None
+                    break
+                # El transporte puede guardar sin copiar lo que no envíe ya,
+                # y el buffer de salida se reutiliza en el siguiente bloque.
+                writer.write(bytes(bloque) if bloque.__class__ is bytearray else bloque)
+                await writer.drain()
+                metricas.enviados(len(bloque))
+            if not data:
+                break
+    except (ConnectionResetError, BrokenPipeError):
+        pass
+    finally:
+        metricas.conexion_cerrada()
+
+    registro.info("conexion_cerrada", cliente=addr)
+    writer.close()
+
+"""
+    Espera a que las mutaciones anotadas en el WAL sean durables sin
+    bloquear el bucle de eventos: la espera (y el fsync del lote, si le
+    toca a este cliente) se hace en un hilo del executor, mientras el bucle
+    sigue atendiendo a otros clientes cuyas mutaciones entran en el
+    siguiente lote.
+"""
+async def esperar_durable_async():
+    hasta = persistencia.secuencia_pendiente()
+    if hasta is not None:
+        await asyncio.get_running_loop().run_in_executor(None, persistencia.esperar_durable, hasta)
+
+"""
+    Crea el servidor asyncio con control de admisión opcional.
+    max_clientes: Conexiones atendidas a la vez; por encima se responde
+    ERROR|Ocupado y se cierra (None = sin límite: una conexión inactiva
+    solo cuesta su socket y su corrutina, no un hilo).
+    timeout: Segundos de inactividad antes de cerrar una conexión.
+"""
+async def crear_servidor_async(host, port, max_conexiones=1024, max_clientes=None, timeout=TIMEOUT_INACTIVIDAD):
+    activas = 0
+
+    async def atender(reader, writer):
+        nonlocal activas
+        if max_clientes is not None and activas >= max_clientes:
+            writer.write(RESPUESTA_OCUPADO)
+            writer.close()
+            return
+        activas += 1
+        try:
+            await manejar_cliente_async(reader, writer, timeout)
+        finally:
+            activas -= 1
+
+    return await asyncio.start_server(atender, host, port, backlog=max_conexiones, reuse_address=True)
+
+"""
+    Inicia el servidor asyncio (selector/epoll) y atiende conexiones
+    en un único hilo con un bucle de eventos.
+    host: Dirección IP del servidor.
+    port: Puerto en el que el servidor escucha.
+    max_conexiones: Tamaño de la cola de conexiones pendientes (backlog).
+    max_clientes, timeout: Ver crear_servidor_async.
+"""
+async def iniciar_servidor_async(host="0.0.0.0", port=12345, max_conexiones=1024, max_clientes=None,
+                                 timeout=TIMEOUT_INACTIVIDAD):
+    servidor = await crear_servidor_async(host, port, max_conexiones, max_clientes, timeout)
+    registro.info("servidor_iniciado", modo=MODO_ASYNC, host=host, port=port)
+    async with servidor:
+        await servidor.serve_forever()
 
 """
     Inicia el servidor y escucha conexiones entrantes.
     host: Dirección IP del servidor.
     port: Puerto en el que el servidor escucha.
+    max_conexiones: Tamaño de la cola de conexiones pendientes (backlog).
+    modo: "hilos" (un hilo por conexión), "async" (bucle de eventos asyncio)
+    o "multiproceso" (trabajadores con SO_REUSEPORT y un proceso dueño del almacén).
+    trabajadores: Número de procesos en modo multiproceso (None = uno por núcleo).
+    hilos: Conexiones atendidas a la vez (por proceso en modo multiproceso).
+    cola: Conexiones aceptadas que esperan turno; más allá se responde ERROR|Ocupado.
+    hilos y cola no aplican en modo async, que no usa un pool de hilos.
+    timeout: Segundos sin recibir datos antes de cerrar una conexión (None = sin límite).
+    espera_cola: Segundos que una conexión puede esperar turno en la cola;
+    después se responde ERROR|Ocupado (None = sin límite). No aplica en modo async.
+    max_clientes_async: Conexiones simultáneas en modo async (None = sin límite).
 """
-def iniciar_servidor(host="0.0.0.0", port=12345, max_conexiones=5):
+def iniciar_servidor(host="0.0.0.0", port=12345, max_conexiones=5, modo=MODO_HILOS, trabajadores=None,
+                     hilos=HILOS_POR_DEFECTO, cola=COLA_POR_DEFECTO, timeout=TIMEOUT_INACTIVIDAD,
+                     espera_cola=ESPERA_COLA, max_clientes_async=None):
+    if modo == MODO_ASYNC:
+        asyncio.run(iniciar_servidor_async(host, port, max(max_conexiones, 1024), max_clientes_async, timeout))
+        return
+    if modo == MODO_MULTIPROCESO:
+        servir = functools.partial(servir_hilos, hilos=hilos, cola=cola, timeout=timeout, espera_cola=espera_cola)
+        iniciar_servidor_multiproceso(host, port, max(max_conexiones, 1024), servir, trabajadores)
+        return
+    if modo != MODO_HILOS:
+        raise ValueError(f"Modo de servidor inválido: {modo}")
+
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_socket.bind((host, port))
     server_socket.listen(max_conexiones)
-    print(f"Servidor escuchando en {host}:{port}")
+    registro.info("servidor_iniciado", modo=MODO_HILOS, host=host, port=port)
+    servir_hilos(server_socket, hilos=hilos, cola=cola, timeout=timeout, espera_cola=espera_cola)
 
+"""
+    Acepta conexiones de un socket de escucha y las atiende con un pool
+    fijo de hilos. Con el pool saturado responde ERROR|Ocupado y cierra,
+    en vez de crear un hilo más por conexión; también a las conexiones que
+    llevan espera_cola segundos en la cola sin que se libere un hilo.
+    server_socket: Socket ya enlazado y escuchando.
+    crear_sesion: Fábrica de la Sesion de protocolo de cada conexión.
+    hilos, cola, timeout, espera_cola: Ver iniciar_servidor.
+"""
+def servir_hilos(server_socket, crear_sesion=Sesion, hilos=HILOS_POR_DEFECTO, cola=COLA_POR_DEFECTO,
+                 timeout=TIMEOUT_INACTIVIDAD, espera_cola=ESPERA_COLA):
+    pool = PoolConexiones(lambda conn, addr: manejar_cliente(conn, addr, crear_sesion), hilos, cola,
+                          espera_cola, rechazar_conexion)
     while True:
         conn, addr = server_socket.accept()
-        hilo = threading.Thread(target=manejar_cliente, args=(conn, addr))
-        hilo.start()
+        # Sin Nagle: los listados en streaming se envían en varios sendall
+        # y no deben esperar al ACK retardado del cliente (asyncio ya lo hace).
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn.settimeout(timeout)
+        if not pool.enviar(conn, addr):
+            rechazar_conexion(conn)
+
+"""
+    Lee los argumentos de línea de comandos del servidor.
+    argv: Lista de argumentos (None para usar sys.argv).
+"""
+def parsear_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor TCP de gestión de procesos.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=12345)
+    parser.add_argument("--max-conexiones", type=int, default=5)
+    parser.add_argument("--modo", choices=MODOS, default=MODO_HILOS,
+                        help="hilos: un hilo por conexión; async: bucle de eventos asyncio; "
+                             "multiproceso: varios procesos con SO_REUSEPORT.")
+    parser.add_argument("--trabajadores", type=int, default=None,
+                        help="Procesos trabajadores en modo multiproceso (por defecto, uno por núcleo).")
+    parser.add_argument("--hilos", type=int, default=HILOS_POR_DEFECTO,
+                        help="Conexiones atendidas a la vez (tamaño del pool de hilos).")
+    parser.add_argument("--cola", type=int, default=COLA_POR_DEFECTO,
+                        help="Conexiones que pueden esperar un hilo libre; más allá se responde ERROR|Ocupado.")
+    parser.add_argument("--timeout-inactividad", type=float, default=TIMEOUT_INACTIVIDAD,
+                        help="Segundos sin recibir datos antes de cerrar una conexión (0 = sin límite).")
+    parser.add_argument("--max-clientes-async", type=int, default=None,
+                        help="Conexiones simultáneas en modo async; más allá se responde ERROR|Ocupado "
+                             "(por defecto, sin límite).")
+    parser.add_argument("--espera-cola", type=float, default=ESPERA_COLA,
+                        help="Segundos que una conexión puede esperar un hilo libre antes de "
+                             "responderle ERROR|Ocupado (0 = sin límite).")
+    parser.add_argument("--metricas-puerto", type=int, default=None,
+                        help="Puerto local (127.0.0.1) donde servir /metrics en formato Prometheus.")
+    parser.add_argument("--log-nivel", default="INFO", choices=("DEBUG", "INFO", "WARNING", "ERROR"),
+                        help="Nivel mínimo del registro JSON (DEBUG incluye la auditoría de cada comando).")
+    parser.add_argument("--log-muestreo", type=float, default=1.0,
+                        help="Fracción de comandos auditados en nivel DEBUG (0..1).")
+    parser.add_argument("--log-archivo", default=None,
+                        help="Archivo donde añadir el registro (por defecto, salida estándar).")
+    parser.add_argument("--datos", default=None,
+                        help="Directorio para el WAL y los snapshots (sin él, los procesos solo viven en memoria).")
+    parser.add_argument("--snapshot-cada", type=int, default=persistencia.SNAPSHOT_CADA,
+                        help="Mutaciones del WAL entre snapshots.")
+    parser.add_argument("--supervisar", action="store_true",
+                        help="CREAR lanza <nombre> como proceso hijo real (ver supervisor.py). "
+                             "Ejecuta comandos recibidos por red: usar solo en redes de confianza.")
+    parser.add_argument("--replicar-puerto", type=int, default=None,
+                        help="Puerto donde este servidor (primario) envía sus mutaciones a las réplicas. "
+                             "El flujo no se autentica: cualquiera que conecte recibe todo el almacén, "
+                             "por eso escucha en --replicar-host (127.0.0.1 por defecto).")
+    parser.add_argument("--replicar-host", default="127.0.0.1",
+                        help="Interfaz del puerto de replicación; abrirla a otras máquinas solo en "
+                             "redes de confianza.")
+    parser.add_argument("--seguir", default=None, metavar="HOST:PUERTO",
+                        help="Arranca como réplica de solo lectura del primario que replica en HOST:PUERTO.")
+    parser.add_argument("--cluster", default=None, metavar="ID=HOST:PUERTO,...",
+                        help="Nodos del cluster (incluido este); los procesos se reparten entre ellos.")
+    parser.add_argument("--cluster-id", default=None,
+                        help="Id de este servidor en la lista de --cluster.")
+    parser.add_argument("--cluster-secreto", default=None,
+                        help="Secreto compartido por todos los nodos con el que se firman los comandos "
+                             "entre nodos (NODO|).")
+    args = parser.parse_args(argv)
+    if args.cluster is not None:
+        try:
+            args.cluster = cluster.parsear_nodos(args.cluster)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.cluster_id is not None and args.cluster_id.isdigit():
+            args.cluster_id = str(int(args.cluster_id))
+        if args.cluster_id not in args.cluster:
+            parser.error("--cluster necesita --cluster-id con el id de este servidor en la lista.")
+        if not args.cluster_secreto:
+            parser.error("--cluster necesita --cluster-secreto, el mismo en todos los nodos.")
+        if args.modo == MODO_ASYNC or args.seguir is not None or args.supervisar:
+            parser.error("--cluster no se puede combinar con --modo async (el reenvío entre nodos "
+                         "bloquea), --seguir ni --supervisar.")
+    if args.seguir is not None:
+        host, _, puerto = args.seguir.rpartition(":")
+        if not host or not puerto.isdigit():
+            parser.error("--seguir necesita HOST:PUERTO.")
+        if args.datos or args.supervisar or args.replicar_puerto is not None:
+            parser.error("--seguir no se puede combinar con --datos, --supervisar ni --replicar-puerto.")
+        args.seguir = (host, int(puerto))
+    return args
 
 if __name__ == "__main__":
-    iniciar_servidor()
+    args = parsear_argumentos()
+    registro.configurar(args.log_nivel, args.log_muestreo, args.log_archivo)
+    if args.datos:
+        persistencia.activar(args.datos, args.snapshot_cada)
+    if args.supervisar:
+        supervisor.activar()
+    if args.replicar_puerto is not None:
+        replicacion.activar_primario(args.replicar_puerto, args.replicar_host)
+    if args.seguir is not None:
+        replicacion.seguir(*args.seguir)
+    if args.cluster is not None:
+        cluster.activar(args.cluster_id, args.cluster, args.cluster_secreto)
+    if args.metricas_puerto is not None:
+        metricas.servir_http(args.metricas_puerto)
+    iniciar_servidor(args.host, args.port, args.max_conexiones, args.modo, args.trabajadores,
+                     args.hilos, args.cola, args.timeout_inactividad or None, args.espera_cola or None,
+                     args.max_clientes_async)
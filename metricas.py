@@ -0,0 +1,280 @@
+# metricas.py
+# Description: Instrumentación del servidor en tiempo de ejecución:
+# contadores y histogramas de latencia por comando, tiempo de espera y de
+# retención de los locks del almacén, conexiones activas y bytes
+# recibidos/enviados. Se consulta con el comando ESTADISTICAS o, si se
+# activa, en formato de texto de Prometheus por HTTP local.
+#
+# El coste por comando son dos lecturas de reloj y unos incrementos de
+# enteros en contadores propios del hilo, sin locks, para poder dejarlo
+# activo en producción.
+
+import threading
+from threading import get_ident
+from time import perf_counter_ns
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Cubos del histograma de latencia: potencias de 2 en ns, de 2^13 (~8 us)
+# a 2^30 (~1 s), para calcular el cubo con bit_length() sin buscar.
+# Las observaciones mayores van al cubo +Inf.
+_BITS_MIN = 13
+_BITS_MAX = 30
+LIMITES_NS = tuple(1 << bits for bits in range(_BITS_MIN, _BITS_MAX + 1))
+_CUBO_INF = 3 + len(LIMITES_NS)
+
+PERCENTILES = (("p50", 0.50), ("p99", 0.99))
+
+"""
+    Contadores e histograma de latencia de una acción del protocolo.
+    Cada hilo acumula en su propia lista [total, errores, suma_ns, cubos...],
+    así observar no toma ningún lock; leer suma las listas de todos los hilos.
+"""
+class MetricaComando:
+    __slots__ = ("nombre", "_por_hilo")
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self._por_hilo = {}
+
+    """
+        Anota una ejecución que empezó en inicio (perf_counter_ns).
+        Retorna la duración en ns.
+    """
+    def observar(self, inicio, error):
+        duracion = perf_counter_ns() - inicio
+        contadores = self._por_hilo.get(get_ident())
+        if contadores is None:
+            contadores = self._por_hilo[get_ident()] = [0] * (_CUBO_INF + 1)
+        contadores[0] += 1
+        contadores[1] += error
+        contadores[2] += duracion
+        # duracion <= 2^k  <=>  (duracion - 1).bit_length() <= k
+        bits = (duracion - 1).bit_length()
+        if bits <= _BITS_MIN:
+            contadores[3] += 1
+        elif bits <= _BITS_MAX:
+            contadores[3 + bits - _BITS_MIN] += 1
+        else:
+            contadores[_CUBO_INF] += 1
+        return duracion
+
+    """
+        Retorna (total, errores, suma_ns, cubos) sumando todos los hilos.
+        Un hilo puede estar a mitad de una observación: la lectura es
+        aproximada, pero nunca bloquea a los que escriben.
+    """
+    def leer(self):
+        sumas = [sum(columna) for columna in zip(*list(self._por_hilo.values()))]
+        if not sumas:
+            return 0, 0, 0, [0] * (len(LIMITES_NS) + 1)
+        return sumas[0], sumas[1], sumas[2], sumas[3:]
+
+"""
+    Lock que mide cuánto se espera para adquirirlo y cuánto se retiene.
+    Los acumuladores se actualizan con el propio lock tomado, así no
+    necesitan otro lock.
+"""
+class LockMedido:
+    __slots__ = ("_lock", "_adquirido", "adquisiciones", "contenciones", "espera_ns", "retencion_ns")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._adquirido = 0
+        self.adquisiciones = 0
+        self.contenciones = 0
+        self.espera_ns = 0
+        self.retencion_ns = 0
+
+    def acquire(self):
+        # Sin contención no hay espera que medir: basta el intento sin bloqueo.
+        if not self._lock.acquire(False):
+            inicio = perf_counter_ns()
+            self._lock.acquire()
+            self.espera_ns += perf_counter_ns() - inicio
+            self.contenciones += 1
+        self._adquirido = perf_counter_ns()
+        self.adquisiciones += 1
+        return True
+
+    def release(self):
+        self.retencion_ns += perf_counter_ns() - self._adquirido
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+# Métricas por acción, creadas al registrar cada comando.
+_comandos = {}
+_lock_comandos = threading.Lock()
+
+# Locks cuyo uso se reporta (las particiones del almacén).
+_locks = []
+
+# Conexiones y tráfico del proceso.
+_lock_red = threading.Lock()
+conexiones_activas = 0
+conexiones_totales = 0
+bytes_recibidos = 0
+bytes_enviados = 0
+
+# Procesos eliminados por caducar su TTL. Solo lo incrementa el hilo
+# recolector, así que no necesita lock.
+procesos_caducados = 0
+
+"""
+    Retorna la métrica de una acción, creándola si no existe.
+"""
+def metrica_comando(nombre):
+    with _lock_comandos:
+        metrica = _comandos.get(nombre)
+        if metrica is None:
+            metrica = _comandos[nombre] = MetricaComando(nombre)
+        return metrica
+
+"""
+    Registra los locks cuyo tiempo de espera y retención se reporta.
+"""
+def registrar_locks(locks):
+    _locks.extend(locks)
+
+def conexion_abierta():
+    global conexiones_activas, conexiones_totales
+    with _lock_red:
+        conexiones_activas += 1
+        conexiones_totales += 1
+
+def conexion_cerrada():
+    global conexiones_activas
+    with _lock_red:
+        conexiones_activas -= 1
+
+def recibidos(n):
+    global bytes_recibidos
+    with _lock_red:
+        bytes_recibidos += n
+
+def enviados(n):
+    global bytes_enviados
+    with _lock_red:
+        bytes_enviados += n
+
+def caducados(n):
+    global procesos_caducados
+    procesos_caducados += n
+
+"""
+    Estima un percentil a partir de los cubos: retorna el límite superior
+    (en us) del cubo donde cae, o None si cae en +Inf o no hay datos.
+"""
+def _percentil(cubos, total, q):
+    if not total:
+        return None
+    objetivo = q * total
+    acumulado = 0
+    for limite, n in zip(LIMITES_NS, cubos):
+        acumulado += n
+        if acumulado >= objetivo:
+            return limite / 1000
+    return None
+
+def _lecturas_locks():
+    # Lectura sin lock: son contadores informativos.
+    return (sum(l.adquisiciones for l in _locks),
+            sum(l.contenciones for l in _locks),
+            sum(l.espera_ns for l in _locks),
+            sum(l.retencion_ns for l in _locks))
+
+"""
+    Resumen legible de todas las métricas, una línea por elemento.
+"""
+def resumen():
+    lineas = [f"conexiones activas={conexiones_activas} totales={conexiones_totales}",
+              f"bytes recibidos={bytes_recibidos} enviados={bytes_enviados}",
+              f"procesos caducados={procesos_caducados}"]
+    adquisiciones, contenciones, espera, retencion = _lecturas_locks()
+    lineas.append(f"locks adquisiciones={adquisiciones} contenciones={contenciones} espera_ms={espera / 1e6:.3f} retencion_ms={retencion / 1e6:.3f}")
+    for nombre, metrica in sorted(_comandos.items()):
+        total, errores, suma_ns, cubos = metrica.leer()
+        if not total:
+            continue
+        texto = f"comando {nombre} total={total} errores={errores} media_us={suma_ns / total / 1000:.1f}"
+        for etiqueta, q in PERCENTILES:
+            valor = _percentil(cubos, total, q)
+            texto += f" {etiqueta}_us<={valor:g}" if valor is not None else f" {etiqueta}_us>{LIMITES_NS[-1] // 1000}"
+        lineas.append(texto)
+    return lineas
+
+"""
+    Todas las métricas en el formato de texto de Prometheus.
+"""
+def texto_prometheus():
+    lineas = [
+        "# TYPE tcprocesses_conexiones_activas gauge",
+        f"tcprocesses_conexiones_activas {conexiones_activas}",
+        "# TYPE tcprocesses_conexiones_total counter",
+        f"tcprocesses_conexiones_total {conexiones_totales}",
+        "# TYPE tcprocesses_bytes_recibidos_total counter",
+        f"tcprocesses_bytes_recibidos_total {bytes_recibidos}",
+        "# TYPE tcprocesses_bytes_enviados_total counter",
+        f"tcprocesses_bytes_enviados_total {bytes_enviados}",
+        "# TYPE tcprocesses_procesos_caducados_total counter",
+        f"tcprocesses_procesos_caducados_total {procesos_caducados}",
+    ]
+    adquisiciones, contenciones, espera, retencion = _lecturas_locks()
+    lineas += [
+        "# TYPE tcprocesses_lock_adquisiciones_total counter",
+        f"tcprocesses_lock_adquisiciones_total {adquisiciones}",
+        "# TYPE tcprocesses_lock_contenciones_total counter",
+        f"tcprocesses_lock_contenciones_total {contenciones}",
+        "# TYPE tcprocesses_lock_espera_segundos_total counter",
+        f"tcprocesses_lock_espera_segundos_total {espera / 1e9}",
+        "# TYPE tcprocesses_lock_retencion_segundos_total counter",
+        f"tcprocesses_lock_retencion_segundos_total {retencion / 1e9}",
+        "# TYPE tcprocesses_comandos_total counter",
+        "# TYPE tcprocesses_comandos_errores_total counter",
+        "# TYPE tcprocesses_comando_segundos histogram",
+    ]
+    for nombre, metrica in sorted(_comandos.items()):
+        total, errores, suma_ns, cubos = metrica.leer()
+        etiqueta = f'accion="{nombre}"'
+        lineas.append(f"tcprocesses_comandos_total{{{etiqueta}}} {total}")
+        lineas.append(f"tcprocesses_comandos_errores_total{{{etiqueta}}} {errores}")
+        acumulado = 0
+        for limite, n in zip(LIMITES_NS, cubos):
+            acumulado += n
+            lineas.append(f'tcprocesses_comando_segundos_bucket{{{etiqueta},le="{limite / 1e9:g}"}} {acumulado}')
+        lineas.append(f'tcprocesses_comando_segundos_bucket{{{etiqueta},le="+Inf"}} {total}')
+        lineas.append(f"tcprocesses_comando_segundos_sum{{{etiqueta}}} {suma_ns / 1e9}")
+        lineas.append(f"tcprocesses_comando_segundos_count{{{etiqueta}}} {total}")
+    return "\n".join(lineas) + "\n"
+
+class _ManejadorHTTP(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        cuerpo = texto_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+"""
+    Sirve /metrics en formato Prometheus en un hilo daemon.
+    host: Por defecto solo local (127.0.0.1).
+    Retorna el servidor HTTP (server_address tiene el puerto real si port=0).
+"""
+def servir_http(port, host="127.0.0.1"):
+    servidor = ThreadingHTTPServer((host, port), _ManejadorHTTP)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
@@ -0,0 +1,377 @@
+# persistencia.py
+# Description: Persistencia opcional del almacén de procesos: registro de
+# escritura anticipada (WAL) con group commit y snapshots compactos.
+#
+# Ficheros en el directorio de datos:
+#   wal.<n>.log    Segmentos del WAL. Cada registro es u32 longitud,
+#                  u32 crc32 y la mutación en JSON (ver process_manager).
+#   snapshot.bin   Último snapshot: cabecera (magic, siguiente_pid, primer
+#                  segmento del WAL posterior, número de procesos) y un
+#                  registro binario por proceso con su plazo (TTL) en
+#                  tiempo de reloj, 0 si no tiene. Se lee con mmap.
+#
+# Al arrancar se carga el snapshot y solo se reproducen los segmentos del
+# WAL posteriores a él. Los plazos del snapshot y de las mutaciones "p" se
+# vuelven a armar al final, así un proceso con TTL sigue caducando tras un
+# reinicio (y el que venció con el servidor parado caduca al arrancar).
+
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+import process_manager
+from process_manager import Proceso
+
+MAGIC_SNAPSHOT = b"TCPSNAP2"
+# Snapshots anteriores, sin plazos; se siguen pudiendo leer.
+MAGIC_SNAPSHOT_V1 = b"TCPSNAP1"
+NOMBRE_SNAPSHOT = "snapshot.bin"
+
+# Mutaciones en el WAL tras las que se toma un snapshot nuevo.
+SNAPSHOT_CADA = 100000
+
+# Segundos entre comprobaciones del hilo compactador.
+INTERVALO_COMPACTADOR = 1.0
+
+_CABECERA_SNAPSHOT = struct.Struct("!8sQQQ")
+_REGISTRO_SNAPSHOT = struct.Struct("!QIIId")
+_REGISTRO_SNAPSHOT_V1 = struct.Struct("!QIII")
+_CABECERA_WAL = struct.Struct("!II")
+
+# WAL activo y control del hilo compactador (None si la persistencia está desactivada).
+_wal = None
+_parar = None
+_compactador = None
+
+def _ruta_segmento(directorio, segmento):
+    return os.path.join(directorio, f"wal.{segmento}.log")
+
+"""
+    Retorna los números de segmento del WAL presentes en el directorio, ordenados.
+"""
+def _segmentos(directorio):
+    numeros = []
+    for nombre in os.listdir(directorio):
+        partes = nombre.split(".")
+        if len(partes) == 3 and partes[0] == "wal" and partes[2] == "log" and partes[1].isdigit():
+            numeros.append(int(partes[1]))
+    return sorted(numeros)
+
+def _fsync_directorio(directorio):
+    fd = os.open(directorio, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+"""
+    Registro de escritura anticipada con group commit.
+    anotar() solo añade la mutación a un buffer en memoria. esperar() la
+    hace durable: el primer hilo que espera escribe y sincroniza (fsync) de
+    una vez todo lo acumulado, y los demás hilos que llegan mientras tanto
+    esperan a ese fsync o al siguiente, en lugar de hacer uno cada uno.
+    Si una escritura o un fsync falla, el WAL queda fallido: el lote vuelve
+    a pendientes sin contarse como durable y toda espera posterior lanza
+    OSError, así ninguna respuesta confirma algo que no llegó al disco.
+"""
+class WAL:
+    """
+        directorio: Directorio de datos.
+        segmento: Número del segmento en el que se escribe.
+        fsync: False para solo vaciar al sistema operativo (más rápido, menos durable).
+    """
+    def __init__(self, directorio, segmento, fsync=True):
+        self.directorio = directorio
+        self.segmento = segmento
+        self.fsync = fsync
+        self.archivo = open(_ruta_segmento(directorio, segmento), "ab")
+        self.cond = threading.Condition()
+        self.pendientes = []
+        self.anotados = 0
+        self.durables = 0
+        self.escribiendo = False
+        self.desde_snapshot = 0
+        self.fallo = None
+
+    """
+        Añade una mutación al buffer. Es el observador de process_manager,
+        así que se llama con el lock de la partición tomado.
+    """
+    def anotar(self, mutacion):
+        datos = json.dumps(mutacion, separators=(",", ":")).encode()
+        registro = _CABECERA_WAL.pack(len(datos), zlib.crc32(datos)) + datos
+        with self.cond:
+            self.pendientes.append(registro)
+            self.anotados += 1
+            self.desde_snapshot += 1
+
+    """
+        Retorna la secuencia del último registro anotado si aún no es
+        durable, o None si no hay nada pendiente.
+    """
+    def secuencia_pendiente(self):
+        with self.cond:
+            return self.anotados if self.durables < self.anotados else None
+
+    """
+        Bloquea hasta que los registros anotados (hasta la secuencia hasta,
+        o todos si es None) están en disco.
+    """
+    def esperar(self, hasta=None):
+        with self.cond:
+            objetivo = self.anotados if hasta is None else hasta
+            while self.durables < objetivo:
+                if self.fallo is not None:
+                    raise OSError(f"WAL fallido: {self.fallo}")
+                if self.escribiendo:
+                    self.cond.wait()
+                else:
+                    self._escribir_lote()
+
+    """
+        Escribe y sincroniza todos los registros pendientes.
+        Se llama con self.cond tomado; lo suelta durante la E/S para que
+        otros hilos puedan seguir anotando (entrarán en el siguiente lote).
+    """
+    def _escribir_lote(self):
+        self.escribiendo = True
+        lote, self.pendientes = self.pendientes, []
+        hasta = self.anotados
+        archivo = self.archivo
+        self.cond.release()
+        try:
+            archivo.write(b"".join(lote))
+            archivo.flush()
+            if self.fsync:
+                os.fsync(archivo.fileno())
+        except Exception as e:
+            # No se reintenta: el fichero puede tener ya parte del lote, y
+            # un registro a medias en mitad del WAL cortaría la recuperación.
+            self.cond.acquire()
+            self.pendientes[:0] = lote
+            self.fallo = e
+            raise
+        else:
+            self.cond.acquire()
+            self.durables = hasta
+        finally:
+            self.escribiendo = False
+            self.cond.notify_all()
+
+    """
+        Cierra el segmento actual (tras hacer durable lo pendiente) y abre
+        el siguiente. Se llama desde process_manager.congelar, con todos los
+        locks del almacén tomados, para que el corte coincida con el snapshot.
+        Retorna el número del segmento nuevo.
+    """
+    def rotar(self):
+        with self.cond:
+            while self.escribiendo:
+                self.cond.wait()
+            if self.fallo is not None:
+                raise OSError(f"WAL fallido: {self.fallo}")
+            if self.pendientes:
+                self._escribir_lote()
+            self.archivo.close()
+            self.segmento += 1
+            self.archivo = open(_ruta_segmento(self.directorio, self.segmento), "ab")
+            self.desde_snapshot = 0
+            return self.segmento
+
+    def cerrar(self):
+        try:
+            self.esperar()
+        finally:
+            with self.cond:
+                self.archivo.close()
+
+"""
+    Lee las mutaciones de un segmento del WAL.
+    Si el final del fichero está incompleto o corrupto (escritura cortada
+    por una caída), se trunca en el último registro válido.
+"""
+def leer_wal(ruta):
+    with open(ruta, "r+b") as f:
+        datos = f.read()
+        mutaciones = []
+        pos = 0
+        while pos + _CABECERA_WAL.size <= len(datos):
+            n, crc = _CABECERA_WAL.unpack_from(datos, pos)
+            inicio = pos + _CABECERA_WAL.size
+            carga = datos[inicio:inicio + n]
+            if len(carga) < n or zlib.crc32(carga) != crc:
+                break
+            mutaciones.append(json.loads(carga))
+            pos = inicio + n
+        if pos < len(datos):
+            f.truncate(pos)
+    return mutaciones
+
+"""
+    Escribe un snapshot de forma atómica (fichero temporal + rename).
+    procesos: Lista de tuplas (pid, Proceso).
+    siguiente_pid: PID del próximo proceso.
+    segmento: Primer segmento del WAL no incluido en el snapshot.
+    plazos: dict pid -> caducidad en tiempo de reloj (ver process_manager.plazos_absolutos).
+"""
+def escribir_snapshot(directorio, procesos, siguiente_pid, segmento, plazos=None):
+    ruta = os.path.join(directorio, NOMBRE_SNAPSHOT)
+    temporal = ruta + ".tmp"
+    plazos = plazos or {}
+    with open(temporal, "wb") as f:
+        f.write(_CABECERA_SNAPSHOT.pack(MAGIC_SNAPSHOT, siguiente_pid, segmento, len(procesos)))
+        for pid, proceso in procesos:
+            nombre = proceso.nombre.encode()
+            prioridad = proceso.prioridad.encode()
+            estado = proceso.estado.encode()
+            f.write(_REGISTRO_SNAPSHOT.pack(int(pid), len(nombre), len(prioridad), len(estado), plazos.get(pid, 0.0)))
+            f.write(nombre + prioridad + estado)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta)
+    _fsync_directorio(directorio)
+
+"""
+    Lee un snapshot con mmap.
+    Retorna (procesos, siguiente_pid, segmento, plazos), o None si no existe.
+"""
+def leer_snapshot(directorio):
+    ruta = os.path.join(directorio, NOMBRE_SNAPSHOT)
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        magic, siguiente_pid, segmento, n = _CABECERA_SNAPSHOT.unpack_from(m, 0)
+        if magic not in (MAGIC_SNAPSHOT, MAGIC_SNAPSHOT_V1):
+            raise ValueError(f"Snapshot inválido: {ruta}")
+        estructura = _REGISTRO_SNAPSHOT if magic == MAGIC_SNAPSHOT else _REGISTRO_SNAPSHOT_V1
+        procesos = []
+        plazos = {}
+        pos = _CABECERA_SNAPSHOT.size
+        for _ in range(n):
+            pid, ln, lp, le, *plazo = estructura.unpack_from(m, pos)
+            pos += estructura.size
+            if plazo and plazo[0]:
+                plazos[str(pid)] = plazo[0]
+            nombre = m[pos:pos + ln].decode()
+            pos += ln
+            prioridad = m[pos:pos + lp].decode()
+            pos += lp
+            estado = m[pos:pos + le].decode()
+            pos += le
+            procesos.append((str(pid), Proceso(nombre, prioridad, estado)))
+    return procesos, siguiente_pid, segmento, plazos
+
+"""
+    Actualiza los plazos pendientes de armar con una mutación del WAL.
+"""
+def _seguir_plazos(plazos, mutacion):
+    tipo = mutacion[0]
+    if tipo == "p":
+        plazos[mutacion[1]] = mutacion[2]
+    elif tipo == "e":
+        plazos.pop(mutacion[1], None)
+    elif tipo == "l":
+        for interna in mutacion[1]:
+            _seguir_plazos(plazos, interna)
+    elif tipo == "r":
+        plazos.clear()
+
+"""
+    Reconstruye el almacén desde el directorio de datos: carga el snapshot
+    y reproduce los segmentos del WAL posteriores.
+    Retorna el número de segmento en el que seguir escribiendo.
+"""
+def recuperar(directorio):
+    snapshot = leer_snapshot(directorio)
+    procesos, siguiente_pid, primer_segmento, plazos = snapshot if snapshot else ([], 1, 0, {})
+    process_manager.cargar_procesos(procesos, siguiente_pid)
+
+    maximo = siguiente_pid - 1
+    segmentos = [s for s in _segmentos(directorio) if s >= primer_segmento]
+    for segmento in segmentos:
+        for mutacion in leer_wal(_ruta_segmento(directorio, segmento)):
+            if mutacion[0] == "r":
+                maximo = 0
+            _seguir_plazos(plazos, mutacion)
+            maximo = max(maximo, process_manager.aplicar_mutacion(mutacion))
+    process_manager.fijar_siguiente_pid(maximo + 1)
+    process_manager.restaurar_plazos(plazos)
+    return max(segmentos, default=primer_segmento - 1) + 1
+
+"""
+    Toma un snapshot del almacén y borra los segmentos del WAL que cubre.
+"""
+def compactar():
+    wal = _wal
+    # Los plazos se leen en el mismo corte, con todos los locks tomados.
+    procesos, siguiente_pid, (segmento, plazos) = process_manager.congelar(
+        lambda: (wal.rotar(), process_manager.plazos_absolutos()))
+    escribir_snapshot(wal.directorio, procesos, siguiente_pid, segmento, plazos)
+    for antiguo in _segmentos(wal.directorio):
+        if antiguo < segmento:
+            os.remove(_ruta_segmento(wal.directorio, antiguo))
+
+def _bucle_compactador(snapshot_cada, intervalo, parar):
+    while not parar.wait(intervalo):
+        if _wal.fallo is None and _wal.desde_snapshot >= snapshot_cada:
+            compactar()
+
+"""
+    Activa la persistencia en un directorio: recupera el estado guardado,
+    empieza a anotar cada mutación en el WAL y lanza el hilo compactador.
+    directorio: Directorio de datos (se crea si no existe).
+    snapshot_cada: Mutaciones entre snapshots.
+    fsync: False para no sincronizar cada lote con el disco.
+"""
+def activar(directorio, snapshot_cada=SNAPSHOT_CADA, intervalo=INTERVALO_COMPACTADOR, fsync=True):
+    global _wal, _parar, _compactador
+    os.makedirs(directorio, exist_ok=True)
+    segmento = recuperar(directorio)
+    _wal = WAL(directorio, segmento, fsync)
+    process_manager.registrar_observador(_wal.anotar)
+    _parar = threading.Event()
+    _compactador = threading.Thread(target=_bucle_compactador, args=(snapshot_cada, intervalo, _parar), daemon=True)
+    _compactador.start()
+
+"""
+    Desactiva la persistencia: para el compactador, vacía el WAL y lo cierra.
+    Lanza OSError si lo pendiente no se pudo escribir.
+"""
+def desactivar():
+    global _wal, _parar, _compactador
+    if _wal is None:
+        return
+    _parar.set()
+    _compactador.join()
+    process_manager.quitar_observador(_wal.anotar)
+    try:
+        _wal.cerrar()
+    finally:
+        _wal = _parar = _compactador = None
+
+"""
+    Retorna la secuencia pendiente de hacerse durable, o None si no hay
+    nada pendiente (o la persistencia está desactivada).
+"""
+def secuencia_pendiente():
+    wal = _wal
+    return wal.secuencia_pendiente() if wal is not None else None
+
+"""
+    Bloquea hasta que las mutaciones anotadas son durables. El servidor lo
+    llama antes de enviar las respuestas, así un OK implica que la
+    mutación está en disco. No hace nada si la persistencia está desactivada.
+    Lanza ValueError si el WAL ha fallado, para que el servidor responda
+    ERROR y cierre la conexión en lugar de confirmar.
+    hasta: Secuencia a esperar (None para todo lo anotado).
+"""
+def esperar_durable(hasta=None):
+    wal = _wal
+    if wal is not None:
+        try:
+            wal.esperar(hasta)
+        except OSError as e:
+            raise ValueError(f"No se pudo escribir en el WAL: {e}") from e
@@ -0,0 +1,443 @@
+# planificador.py
+# Description: Simulación de planificación de CPU sobre el almacén de
+# procesos (SIMULAR y ESTADO_PLANIFICADOR).
+#
+# Los procesos en estado "activo" son los listos. El planificador los
+# reparte entre cpus CPUs simuladas con un algoritmo intercambiable
+# (fifo, prioridad, rr, mlfq) y los pasa a "ejecutando" y, al acabar su
+# ráfaga de CPU, a "terminado"; un proceso expulsado al agotar su quantum
+# vuelve a "activo". La ráfaga de cada proceso se deriva de su PID, así una
+# simulación es reproducible.
+#
+# La simulación es por eventos: cada rodaja de CPU (hasta que el proceso
+# termina o agota el quantum) es un solo evento en un montículo, y el
+# tiempo salta directamente al siguiente evento. El coste es proporcional
+# al número de despachos y no a procesos por tics, de modo que un millón de
+# procesos listos no cuesta nada hasta que se despachan. Los cambios de
+# estado se acumulan y se escriben en el almacén al final de cada SIMULAR
+# en trozos, cada uno con una sola adquisición de los locks (fijar_estados).
+
+import collections
+import heapq
+import itertools
+import threading
+
+import process_manager
+from process_manager import ESTADO_EJECUTANDO, ESTADO_LISTO, clave_prioridad, obtener_proceso
+
+ESTADO_TERMINADO = "terminado"
+
+# Ráfagas de CPU simuladas: entre 1 y RAFAGA_MAXIMA tics según el PID.
+RAFAGA_MAXIMA = 20
+
+# Quantum (tics) de rr y del primer nivel de mlfq.
+QUANTUM = 4
+
+# Niveles de mlfq: el quantum se duplica en cada nivel.
+NIVELES_MLFQ = 4
+
+# Cada cuántos tics mlfq devuelve todos los procesos al primer nivel.
+PERIODO_BOOST = 200
+
+# Mutaciones observadas que se acumulan como mucho entre dos SIMULAR. Si se
+# superan se descartan y la cola se vuelve a cargar desde el almacén.
+MAX_ENTRANTES = 100000
+
+ALGORITMO_POR_DEFECTO = "fifo"
+
+"""
+    Ráfaga de CPU (tics) de un proceso, derivada de su PID (hash multiplicativo).
+"""
+def rafaga(pid):
+    return 1 + ((int(pid) * 2654435761) >> 8) % RAFAGA_MAXIMA
+
+"""
+    Ordena PIDs (cadenas de dígitos) numéricamente sin convertirlos:
+    a igual longitud el orden de las cadenas es el numérico.
+"""
+def ordenar_pids(pids):
+    pids = sorted(pids)
+    pids.sort(key=len)
+    return pids
+
+# Algoritmos disponibles: nombre -> clase.
+ALGORITMOS = {}
+
+"""
+    Decorador que registra un algoritmo de planificación.
+    La clase recibe el quantum base y define:
+    - cargar(grupos): añade de golpe los procesos listos al empezar
+      (dict prioridad -> PIDs, ver process_manager.observar_listos).
+    - agregar(pid, proceso, expulsado): añade un proceso listo.
+    - siguiente(tiempo): saca el próximo pid a ejecutar, o None.
+    - quantum(pid): tics de la rodaja del pid despachado (None = hasta acabar).
+    - vigente(pid, proceso): False si la entrada sacada quedó obsoleta.
+    - olvidar(pid): el proceso terminó.
+    - __len__(): entradas en cola (incluye las obsoletas).
+    y el atributo por_prioridad (True si un cambio de prioridad lo reordena).
+"""
+def registrar_algoritmo(nombre):
+    def decorador(clase):
+        clase.nombre = nombre
+        ALGORITMOS[nombre] = clase
+        return clase
+    return decorador
+
+@registrar_algoritmo("fifo")
+class Fifo:
+    por_prioridad = False
+
+    def __init__(self, quantum):
+        self.cola = collections.deque()
+
+    def cargar(self, grupos):
+        self.cola.extend(ordenar_pids(itertools.chain.from_iterable(grupos.values())))
+
+    def agregar(self, pid, proceso, expulsado=False):
+        self.cola.append(pid)
+
+    def siguiente(self, tiempo):
+        return self.cola.popleft() if self.cola else None
+
+    def quantum(self, pid):
+        return None
+
+    def vigente(self, pid, proceso):
+        return True
+
+    def olvidar(self, pid):
+        pass
+
+    def __len__(self):
+        return len(self.cola)
+
+"""
+    Round-robin: FIFO con expulsión al agotar el quantum.
+"""
+@registrar_algoritmo("rr")
+class RoundRobin(Fifo):
+    def __init__(self, quantum):
+        super().__init__(quantum)
+        self.q = quantum
+
+    def quantum(self, pid):
+        return self.q
+
+"""
+    Prioridad sin expulsión: una cola FIFO por valor de prioridad y un
+    montículo con las prioridades que tienen cola. Si un proceso cambia de
+    prioridad se añade a su nueva cola y la entrada vieja se descarta al salir.
+"""
+@registrar_algoritmo("prioridad")
+class Prioridad:
+    por_prioridad = True
+
+    def __init__(self, quantum):
+        self.colas = {}
+        self.claves = []
+        self.clave = None
+        self.total = 0
+
+    def cargar(self, grupos):
+        for prioridad, pids in grupos.items():
+            clave = clave_prioridad(prioridad)
+            if clave not in self.colas:
+                self.colas[clave] = collections.deque()
+                heapq.heappush(self.claves, -clave)
+            self.colas[clave].extend(ordenar_pids(pids))
+            self.total += len(pids)
+
+    def agregar(self, pid, proceso, expulsado=False):
+        clave = clave_prioridad(proceso.prioridad)
+        cola = self.colas.get(clave)
+        if cola is None:
+            cola = self.colas[clave] = collections.deque()
+            heapq.heappush(self.claves, -clave)
+        cola.append(pid)
+        self.total += 1
+
+    def siguiente(self, tiempo):
+        while self.claves:
+            clave = -self.claves[0]
+            cola = self.colas[clave]
+            if cola:
+                self.clave = clave
+                self.total -= 1
+                return cola.popleft()
+            del self.colas[clave]
+            heapq.heappop(self.claves)
+        return None
+
+    def quantum(self, pid):
+        return None
+
+    def vigente(self, pid, proceso):
+        return clave_prioridad(proceso.prioridad) == self.clave
+
+    def olvidar(self, pid):
+        pass
+
+    def __len__(self):
+        return self.total
+
+"""
+    Colas multinivel con realimentación: un proceso que agota su quantum
+    baja de nivel (quantum doble, menos preferencia); cada PERIODO_BOOST
+    tics todos vuelven al primer nivel para que nadie muera de inanición.
+"""
+@registrar_algoritmo("mlfq")
+class MLFQ:
+    por_prioridad = False
+
+    def __init__(self, quantum):
+        self.q = quantum
+        self.niveles = [collections.deque() for _ in range(NIVELES_MLFQ)]
+        # pid -> nivel, solo para los que han bajado del primero.
+        self.nivel = {}
+        self.proximo_boost = PERIODO_BOOST
+
+    def cargar(self, grupos):
+        self.niveles[0].extend(ordenar_pids(itertools.chain.from_iterable(grupos.values())))
+
+    def agregar(self, pid, proceso, expulsado=False):
+        nivel = self.nivel.get(pid, 0)
+        if expulsado and nivel < NIVELES_MLFQ - 1:
+            nivel += 1
+            self.nivel[pid] = nivel
+        self.niveles[nivel].append(pid)
+
+    def siguiente(self, tiempo):
+        if tiempo >= self.proximo_boost:
+            primero = self.niveles[0]
+            for cola in self.niveles[1:]:
+                primero.extend(cola)
+                cola.clear()
+            self.nivel.clear()
+            self.proximo_boost = (tiempo // PERIODO_BOOST + 1) * PERIODO_BOOST
+        for cola in self.niveles:
+            if cola:
+                return cola.popleft()
+        return None
+
+    def quantum(self, pid):
+        return self.q << self.nivel.get(pid, 0)
+
+    def vigente(self, pid, proceso):
+        return True
+
+    def olvidar(self, pid):
+        self.nivel.pop(pid, None)
+
+    def __len__(self):
+        return sum(len(cola) for cola in self.niveles)
+
+"""
+    Estado de una simulación: reloj, CPUs, algoritmo y estadísticas.
+    Sigue el almacén con un observador: los procesos que se crean o pasan
+    a "activo" llegan a la cola en el tiempo simulado actual.
+"""
+class Planificador:
+    def __init__(self, algoritmo=ALGORITMO_POR_DEFECTO, cpus=1, quantum=QUANTUM):
+        self.cpus = cpus
+        self.quantum = quantum
+        self.lock = threading.Lock()
+        self.tiempo = 0
+        # Mutaciones observadas pendientes de procesar. El observador se
+        # llama con locks del almacén tomados, así que solo encola las que
+        # afectan a la cola; desbordado indica que se superó MAX_ENTRANTES.
+        self.entrantes = collections.deque()
+        self.desbordado = False
+        # Hilo que está escribiendo los cambios de la simulación; sus
+        # propias mutaciones no se observan.
+        self.escribiendo = None
+        self._reiniciar(algoritmo)
+        self.algoritmo.cargar(process_manager.observar_listos(self.al_mutar))
+
+    def _reiniciar(self, algoritmo):
+        self.algoritmo = ALGORITMOS[algoritmo](self.quantum)
+        self.inicio = self.tiempo
+        # Rodajas en curso: montículo de (fin, orden, pid, inicio).
+        self.ejecutando = []
+        self.orden = itertools.count()
+        # Solo se guardan los procesos que ya han corrido o que llegaron
+        # después de crear el planificador (los demás llegaron en inicio).
+        self.restante = {}
+        self.llegada = {}
+        self.despachos = self.expulsiones = self.terminados = 0
+        self.suma_espera = self.suma_retorno = self.ocupado = 0
+
+    def al_mutar(self, mutacion):
+        if self.escribiendo == threading.get_ident() or self.desbordado:
+            return
+        relevantes = [m for m in (mutacion[1] if mutacion[0] == "l" else (mutacion,)) if self._relevante(m)]
+        if len(self.entrantes) + len(relevantes) > MAX_ENTRANTES:
+            self.desbordado = True
+            self.entrantes.clear()
+        else:
+            self.entrantes.extend(relevantes)
+
+    """
+        True si la mutación puede cambiar la cola: altas, bajas, reinicios,
+        procesos que pasan a listos y, si el algoritmo ordena por
+        prioridad, cambios de prioridad.
+    """
+    def _relevante(self, mutacion):
+        tipo = mutacion[0]
+        if tipo == "m":
+            return mutacion[2:] == ("estado", ESTADO_LISTO) or (mutacion[2] == "prioridad" and self.algoritmo.por_prioridad)
+        return tipo in ("c", "e", "r")
+
+    """
+        Tras un desbordamiento, vuelve a cargar la cola desde los procesos
+        listos del almacén. Se conservan el reloj, las rodajas en curso y
+        las estadísticas; los procesos llegados mientras tanto cuentan como
+        llegados al inicio.
+    """
+    def _recargar(self):
+        process_manager.quitar_observador(self.al_mutar)
+        self.entrantes.clear()
+        self.desbordado = False
+        self.algoritmo = ALGORITMOS[self.algoritmo.nombre](self.quantum)
+        self.algoritmo.cargar(process_manager.observar_listos(self.al_mutar))
+
+    def _entrante(self, mutacion):
+        tipo = mutacion[0]
+        if tipo == "r":
+            self._reiniciar(self.algoritmo.nombre)
+        elif tipo == "e":
+            self.restante.pop(mutacion[1], None)
+            self.llegada.pop(mutacion[1], None)
+            self.algoritmo.olvidar(mutacion[1])
+        else:
+            pid = mutacion[1]
+            proceso = obtener_proceso(pid)
+            if proceso is not None and proceso.estado == ESTADO_LISTO:
+                if tipo == "c":
+                    self.llegada[pid] = self.tiempo
+                self.algoritmo.agregar(pid, proceso)
+
+    def _despachar(self, ahora, cambios):
+        while True:
+            pid = self.algoritmo.siguiente(ahora)
+            if pid is None:
+                return False
+            proceso = obtener_proceso(pid)
+            # Entradas obsoletas: eliminado, ya despachado o cambiado por otro cliente.
+            if proceso is None or cambios.get(pid, proceso.estado) != ESTADO_LISTO or not self.algoritmo.vigente(pid, proceso):
+                continue
+            restante = self.restante.get(pid) or rafaga(pid)
+            quantum = self.algoritmo.quantum(pid)
+            rodaja = restante if quantum is None else min(quantum, restante)
+            heapq.heappush(self.ejecutando, (ahora + rodaja, next(self.orden), pid, ahora))
+            cambios[pid] = ESTADO_EJECUTANDO
+            self.despachos += 1
+            return True
+
+    def _fin_rodaja(self, fin, pid, inicio, cambios):
+        self.ocupado += fin - inicio
+        proceso = obtener_proceso(pid)
+        if proceso is None or cambios.get(pid, proceso.estado) != ESTADO_EJECUTANDO:
+            # Eliminado o cambiado por otro cliente mientras corría.
+            self.restante.pop(pid, None)
+            return
+        restante = (self.restante.pop(pid, None) or rafaga(pid)) - (fin - inicio)
+        if restante > 0:
+            self.restante[pid] = restante
+            cambios[pid] = ESTADO_LISTO
+            self.expulsiones += 1
+            self.algoritmo.agregar(pid, proceso, expulsado=True)
+            return
+        cambios[pid] = ESTADO_TERMINADO
+        self.terminados += 1
+        retorno = fin - self.llegada.pop(pid, self.inicio)
+        self.suma_retorno += retorno
+        self.suma_espera += retorno - rafaga(pid)
+        self.algoritmo.olvidar(pid)
+
+    """
+        Avanza el reloj pasos tics y escribe los estados resultantes en el almacén.
+        Retorna (despachos, terminados) de este avance.
+    """
+    def simular(self, pasos):
+        with self.lock:
+            if self.desbordado:
+                self._recargar()
+            while self.entrantes:
+                self._entrante(self.entrantes.popleft())
+            despachos, terminados = self.despachos, self.terminados
+            fin = self.tiempo + pasos
+            ahora = self.tiempo
+            cambios = {}
+            while True:
+                while len(self.ejecutando) < self.cpus and self._despachar(ahora, cambios):
+                    pass
+                if not self.ejecutando or self.ejecutando[0][0] > fin:
+                    break
+                ahora, _, pid, inicio = heapq.heappop(self.ejecutando)
+                self._fin_rodaja(ahora, pid, inicio, cambios)
+            self.tiempo = fin
+            self.escribiendo = threading.get_ident()
+            try:
+                process_manager.fijar_estados(cambios, (ESTADO_LISTO, ESTADO_EJECUTANDO))
+            finally:
+                self.escribiendo = None
+            return self.despachos - despachos, self.terminados - terminados
+
+    """
+        Líneas de ESTADO_PLANIFICADOR.
+    """
+    def resumen(self):
+        with self.lock:
+            transcurrido = self.tiempo - self.inicio
+            # Las rodajas en curso cuentan hasta el tiempo actual.
+            ocupado = self.ocupado + sum(min(self.tiempo, fin) - inicio for fin, _, _, inicio in self.ejecutando)
+            uso = 100 * ocupado / (self.cpus * transcurrido) if transcurrido else 0.0
+            terminados = self.terminados or 1
+            return [
+                f"algoritmo={self.algoritmo.nombre} cpus={self.cpus} quantum={self.quantum} tiempo={self.tiempo}",
+                f"en_cola={len(self.algoritmo)} ejecutando={len(self.ejecutando)} pendientes={len(self.entrantes)}",
+                f"despachos={self.despachos} expulsiones={self.expulsiones} terminados={self.terminados}",
+                f"espera_media={self.suma_espera / terminados:.2f} retorno_medio={self.suma_retorno / terminados:.2f} uso_cpu={uso:.1f}%",
+            ]
+
+    """
+        Deja de observar el almacén.
+    """
+    def cerrar(self):
+        process_manager.quitar_observador(self.al_mutar)
+
+# Planificador activo; se crea con el primer SIMULAR.
+_planificador = None
+_lock = threading.Lock()
+
+"""
+    Avanza la simulación. Con un algoritmo o número de CPUs distinto del
+    actual empieza una simulación nueva desde el estado del almacén.
+    Retorna (planificador, despachos, terminados).
+"""
+def simular(pasos, algoritmo=None, cpus=None):
+    global _planificador
+    with _lock:
+        actual = _planificador
+        if actual is None or (algoritmo or actual.algoritmo.nombre) != actual.algoritmo.nombre or (cpus or actual.cpus) != actual.cpus:
+            if actual is not None:
+                actual.cerrar()
+            actual = _planificador = Planificador(algoritmo or ALGORITMO_POR_DEFECTO, cpus or 1)
+    return (actual, *actual.simular(pasos))
+
+"""
+    Líneas con el estado de la simulación, o None si no se ha simulado nada.
+"""
+def resumen():
+    actual = _planificador
+    return actual.resumen() if actual is not None else None
+
+"""
+    Descarta la simulación actual. Útil en tests.
+"""
+def descartar():
+    global _planificador
+    with _lock:
+        if _planificador is not None:
+            _planificador.cerrar()
+            _planificador = None
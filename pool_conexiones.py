@@ -0,0 +1,92 @@
+# pool_conexiones.py
+# Description: Pool fijo de hilos con una cola acotada de conexiones
+# pendientes. Sustituye al hilo por conexión del modo con hilos: con el
+# servidor saturado las conexiones nuevas se rechazan en vez de crear
+# hilos sin límite.
+
+import collections
+import threading
+import time
+import registro
+
+"""
+    Pool de hilos que atienden conexiones.
+    atender: Función atender(conn, addr) que gestiona una conexión completa.
+    hilos: Número fijo de hilos trabajadores (conexiones atendidas a la vez).
+    cola: Conexiones aceptadas que pueden esperar a que quede un hilo libre.
+    espera: Segundos máximos que una conexión espera en la cola (None = sin
+    límite). Si todos los hilos siguen ocupados (por ejemplo, con clientes
+    inactivos), al vencer se entrega a rechazar(conn) en vez de dejarla
+    colgada sin respuesta.
+    rechazar: Función rechazar(conn) que responde a la conexión y la cierra.
+"""
+class PoolConexiones:
+    def __init__(self, atender, hilos, cola, espera=None, rechazar=None):
+        if hilos < 1 or cola < 0:
+            raise ValueError("El pool necesita al menos un hilo y una cola no negativa.")
+        if espera is not None and rechazar is None:
+            raise ValueError("Con espera máxima en la cola hace falta una función rechazar.")
+        self.atender = atender
+        self.espera = espera
+        self.rechazar = rechazar
+        # Conexiones en espera (conn, addr, límite), en orden de llegada.
+        self.pendientes = collections.deque()
+        lock = threading.Lock()
+        self.hay_trabajo = threading.Condition(lock)
+        self.hay_cola = threading.Condition(lock)
+        # Una plaza por conexión atendida o en espera; la cola no crece más allá.
+        self.plazas = threading.BoundedSemaphore(hilos + cola)
+        for _ in range(hilos):
+            threading.Thread(target=self._trabajar, daemon=True).start()
+        if espera is not None:
+            threading.Thread(target=self._vigilar, daemon=True).start()
+
+    def _trabajar(self):
+        while True:
+            with self.hay_trabajo:
+                while not self.pendientes:
+                    self.hay_trabajo.wait()
+                conn, addr, _ = self.pendientes.popleft()
+            try:
+                self.atender(conn, addr)
+            except Exception as e:
+                # Un error de una conexión no debe reducir el pool.
+                registro.error("error_conexion", traza=True, cliente=addr)
+                conn.close()
+            finally:
+                self.plazas.release()
+
+    """
+        Rechaza las conexiones que llevan en la cola más de espera segundos.
+        La cola está en orden de llegada: basta mirar la primera.
+    """
+    def _vigilar(self):
+        while True:
+            with self.hay_cola:
+                ahora = time.monotonic()
+                caducadas = []
+                while self.pendientes and self.pendientes[0][2] <= ahora:
+                    caducadas.append(self.pendientes.popleft())
+                if not caducadas:
+                    self.hay_cola.wait(self.pendientes[0][2] - ahora if self.pendientes else None)
+            for conn, addr, _ in caducadas:
+                registro.advertencia("espera_cola_agotada", cliente=addr)
+                try:
+                    self.rechazar(conn)
+                finally:
+                    self.plazas.release()
+
+    """
+        Encola una conexión aceptada.
+        Retorna False si el pool está saturado (todos los hilos ocupados y
+        la cola llena); el llamador debe rechazar la conexión.
+    """
+    def enviar(self, conn, addr):
+        if not self.plazas.acquire(blocking=False):
+            return False
+        limite = time.monotonic() + self.espera if self.espera is not None else None
+        with self.hay_trabajo:
+            self.pendientes.append((conn, addr, limite))
+            self.hay_trabajo.notify()
+            self.hay_cola.notify()
+        return True
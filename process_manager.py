@@ -1,49 +1,684 @@
 # process_manager.py
 # Author: Joan Cobeña
 # Description: Módulo para gestionar procesos en memoria.
+import heapq
+import itertools
+import math
+import sys
 import threading
+import time
+import metricas
+import registro
 
-#Arreglo de procesos en memoria para simular un gestor de procesos.
-procesos = {}
+# Campos modificables de un proceso, en el orden en que se listan.
+CAMPOS_PROCESO = ("nombre", "prioridad", "estado")
 
-# ID del próximo proceso a crear.
-next_pid = 1
+"""
+    Registro compacto de un proceso.
+    Usa __slots__ en lugar de un dict por proceso y guarda los valores
+    internados (sys.intern), de modo que prioridades y estados repetidos
+    ("alta", "activo", ...) comparten una sola cadena en memoria.
+    Su repr es idéntico al del dict que se usaba antes, así que la salida
+    de LISTAR no cambia.
+    Los registros no se modifican una vez guardados: MODIFICAR guarda un
+    registro nuevo, por lo que un snapshot puede compartir referencias y
+    la fila renderizada de LISTAR se puede memorizar en el propio registro.
+"""
+class Proceso:
+    __slots__ = CAMPOS_PROCESO + ("_fila",)
+
+    def __init__(self, nombre, prioridad, estado="activo"):
+        self.nombre = sys.intern(nombre)
+        self.prioridad = sys.intern(prioridad)
+        self.estado = sys.intern(estado)
+        self._fila = None
+
+    """
+        Retorna la fila de LISTAR "pid: info" de este registro.
+        Se renderiza una sola vez; un registro modificado es un objeto
+        nuevo, así que la caché nunca queda obsoleta.
+        pid: ID bajo el que está guardado el registro.
+    """
+    def fila(self, pid):
+        if self._fila is None:
+            self._fila = f"{pid}: {self!r}"
+        return self._fila
+
+    """
+        Retorna un registro nuevo con un campo reemplazado.
+        campo: Uno de CAMPOS_PROCESO.
+        valor: Nuevo valor del campo.
+    """
+    def reemplazar(self, campo, valor):
+        nuevo = Proceso(self.nombre, self.prioridad, self.estado)
+        setattr(nuevo, campo, sys.intern(valor))
+        return nuevo
+
+    """
+        Retorna el registro como dict {campo: valor}.
+    """
+    def como_dict(self):
+        return {campo: getattr(self, campo) for campo in CAMPOS_PROCESO}
+
+    def __repr__(self):
+        return repr(self.como_dict())
+
+# Número de particiones (shards) del almacén de procesos.
+NUM_SHARDS = 16
+
+# Procesos en memoria repartidos en particiones independientes.
+# Cada PID vive en una sola partición, protegida por su propio lock,
+# así operaciones sobre PIDs distintos no compiten por el mismo mutex.
+# Los locks miden su tiempo de espera y de retención (ESTADISTICAS).
+shards = [{} for _ in range(NUM_SHARDS)]
+locks = [metricas.LockMedido() for _ in range(NUM_SHARDS)]
+metricas.registrar_locks(locks)
+
+# Próximo PID a asignar y distancia entre PIDs consecutivos. Se leen y
+# avanzan con _lock_pid, así congelar puede leer el próximo PID sin gastarlo.
+_siguiente_pid = 1
+_paso_pid = 1
+_lock_pid = threading.Lock()
+
+# Versión del almacén. Cada mutación le asigna un número nuevo (nunca
+# repetido) mientras tiene el lock de su partición; si la versión no cambió,
+# el listado completo en caché sigue siendo válido.
+_versiones = itertools.count(1)
+_version = 0
+
+# Último listado completo renderizado: (version, texto).
+_cache_listado = (None, None)
+
+# Funciones que reciben cada mutación aplicada (por ejemplo el WAL de
+# persistencia). Se llaman con el lock de la partición tomado, de modo que
+# ven las mutaciones de un mismo PID en el mismo orden que el almacén.
+# Cada mutación es una tupla:
+#   ("c", pid, nombre, prioridad)   proceso creado
+#   ("e", pid)                      proceso eliminado
+#   ("m", pid, campo, valor)        campo modificado
+#   ("l", [mutaciones])             lote atómico
+#   ("r",)                          almacén reiniciado
+#   ("p", pid, vence)               plazo (TTL) fijado o renovado; vence
+#                                   es el instante de caducidad (time.time)
+_observadores = []
+
+# Función opcional campos(pid) -> dict o None con campos que no guarda el
+# almacén y se añaden a las filas de LISTAR, TOP y SIGUIENTE (por ejemplo,
+# el estado real del proceso en supervisor.py). Con ella registrada no se
+# usa la caché del listado completo, porque esos campos cambian sin mutar
+# el almacén.
+_campos_en_vivo = None
+
+"""
+    Registra (o quita, con None) la función de campos en vivo de las filas.
+"""
+def registrar_campos_en_vivo(funcion):
+    global _campos_en_vivo
+    _campos_en_vivo = funcion
+
+"""
+    Retorna la fila de LISTAR "pid: info" de un proceso, con los campos en
+    vivo si hay una función registrada.
+"""
+def fila(pid, proceso):
+    campos = _campos_en_vivo
+    extra = campos(pid) if campos is not None else None
+    if not extra:
+        return proceso.fila(pid)
+    return f"{pid}: {({**proceso.como_dict(), **extra})!r}"
 
-# Lock para manejar concurrencia en el acceso a procesos
-# Esto es importante para evitar condiciones de carrera en un entorno multihilo.
-lock = threading.Lock()
+"""
+    Registra una función observador(mutacion) para cada mutación aplicada.
+"""
+def registrar_observador(observador):
+    _observadores.append(observador)
+
+def quitar_observador(observador):
+    _observadores.remove(observador)
+
+def _notificar(mutacion):
+    for observador in _observadores:
+        observador(mutacion)
+
+"""
+    Marca el almacén como modificado. Llamar con el lock de la partición.
+"""
+def _nueva_version():
+    global _version
+    _version = next(_versiones)
+
+# Índices secundarios: campo -> valor -> conjunto de PIDs con ese valor.
+# Se actualizan en cada mutación (con el lock de la partición tomado y
+# después _lock_indices), y permiten filtrar LISTAR por campo=valor con un
+# coste proporcional al número de resultados.
+indices = {campo: {} for campo in CAMPOS_PROCESO}
+_lock_indices = threading.Lock()
+
+def _indexar(pid, proceso):
+    with _lock_indices:
+        for campo in CAMPOS_PROCESO:
+            indices[campo].setdefault(getattr(proceso, campo), set()).add(pid)
+    _encolar(pid, proceso)
+
+def _desindexar(pid, proceso):
+    with _lock_indices:
+        for campo in CAMPOS_PROCESO:
+            _quitar_de_indice(campo, getattr(proceso, campo), pid)
+
+def _reindexar(pid, campo, anterior, nuevo):
+    with _lock_indices:
+        _quitar_de_indice(campo, anterior, pid)
+        indices[campo].setdefault(nuevo, set()).add(pid)
+
+# Llamar con _lock_indices tomado.
+def _quitar_de_indice(campo, valor, pid):
+    pids = indices[campo].get(valor)
+    if pids is not None:
+        pids.discard(pid)
+        if not pids:
+            del indices[campo][valor]
+
+def _limpiar_indices():
+    with _lock_indices:
+        for indice in indices.values():
+            indice.clear()
+    with _lock_cola:
+        _cola.clear()
+
+# Niveles de prioridad con nombre, en la misma escala que las numéricas
+# (mayor número = más prioridad).
+NIVELES_PRIORIDAD = {
+    "baja": 1,
+    "normal": 5,
+    "media": 5,
+    "alta": 10,
+    "critica": 20,
+    "crítica": 20,
+}
+
+# Estado de los procesos que están en la cola de prioridad (listos para ejecutar).
+ESTADO_LISTO = "activo"
+# Estado que SIGUIENTE asigna al proceso que saca de la cola.
+ESTADO_EJECUTANDO = "ejecutando"
+
+# Cambios de estado aplicados con cada adquisición de los locks en fijar_estados.
+TROZO_ESTADOS = 10000
+
+"""
+    Normaliza una prioridad a un número comparable.
+    prioridad: Valor numérico ("5", "2.5") o nivel con nombre ("alta", "baja").
+    Las prioridades desconocidas y las no finitas ("nan", "inf") quedan por
+    debajo de todas las demás: nan no es comparable y rompería el montículo.
+"""
+def clave_prioridad(prioridad):
+    nivel = NIVELES_PRIORIDAD.get(prioridad.strip().lower())
+    if nivel is not None:
+        return nivel
+    try:
+        clave = float(prioridad)
+    except ValueError:
+        return float("-inf")
+    return clave if math.isfinite(clave) else float("-inf")
+
+# Cola de prioridad de los procesos listos: montículo (heap) de entradas
+# (-prioridad, pid numérico, secuencia, pid, Proceso). A igual prioridad
+# sale antes el PID más antiguo. Las entradas no se borran al modificar o
+# eliminar un proceso: una entrada es válida solo si su Proceso sigue siendo
+# el registro actual del PID (los registros no se modifican en sitio) y se
+# descartan al encontrarlas; la cola se reconstruye cuando acumula
+# demasiadas entradas obsoletas.
+_cola = []
+_lock_cola = threading.Lock()
+_secuencia_cola = itertools.count()
+
+def _encolar(pid, proceso):
+    if proceso.estado != ESTADO_LISTO:
+        return
+    entrada = (-clave_prioridad(proceso.prioridad), int(pid), next(_secuencia_cola), pid, proceso)
+    with _lock_cola:
+        heapq.heappush(_cola, entrada)
+        if len(_cola) > 1024 and len(_cola) > 2 * len(indices["estado"].get(ESTADO_LISTO, ())):
+            _cola[:] = [e for e in _cola if _entrada_valida(e)]
+            heapq.heapify(_cola)
+
+def _entrada_valida(entrada):
+    pid, proceso = entrada[3], entrada[4]
+    return shards[_indice_shard(pid)].get(pid) is proceso
+
+# Caducidad (TTL) de los procesos creados con CREAR|...|<ttl>.
+# _vencimientos guarda el instante (time.monotonic) en que caduca cada PID
+# con plazo; _caducidades es un montículo de entradas (vence, pid) que el
+# recolector saca por orden de vencimiento, sin recorrer el almacén. Como
+# en la cola de prioridad, renovar no borra la entrada anterior: una
+# entrada es válida solo si su vencimiento sigue siendo el del PID.
+# Los plazos se cambian con el lock de la partición tomado y después
+# _lock_caducidad. Cada plazo fijado se notifica como ("p", pid, vence) en
+# tiempo de reloj, para que la persistencia lo guarde y lo vuelva a armar
+# con restaurar_plazos al recuperar.
+_vencimientos = {}
+_caducidades = []
+_lock_caducidad = threading.Lock()
+
+# Segundos máximos entre dos pasadas del recolector.
+INTERVALO_RECOLECTOR = 0.5
+
+# Hilo recolector; se arranca con el primer plazo, así sin TTL no hay hilo.
+_recolector = None
+_despertar_recolector = threading.Event()
+
+"""
+    Fija el plazo de un PID. Retorna el instante de caducidad en tiempo de
+    reloj (time.time), el que se notifica en la mutación "p".
+"""
+def _arrendar(pid, ttl):
+    _vencer_en(pid, time.monotonic() + ttl)
+    return time.time() + ttl
+
+"""
+    Fija el vencimiento de un PID en un instante de time.monotonic().
+"""
+def _vencer_en(pid, vence):
+    global _recolector
+    with _lock_caducidad:
+        adelanta = not _caducidades or vence < _caducidades[0][0]
+        _vencimientos[pid] = vence
+        heapq.heappush(_caducidades, (vence, pid))
+        if len(_caducidades) > 1024 and len(_caducidades) > 2 * len(_vencimientos):
+            _caducidades[:] = [e for e in _caducidades if _vencimientos.get(e[1]) == e[0]]
+            heapq.heapify(_caducidades)
+        if _recolector is None:
+            _recolector = threading.Thread(target=_recolectar, name="recolector-ttl", daemon=True)
+            _recolector.start()
+    if adelanta:
+        _despertar_recolector.set()
+
+def _desarrendar(pid):
+    # Lectura sin lock: los procesos sin plazo no pagan el lock.
+    if pid in _vencimientos:
+        with _lock_caducidad:
+            _vencimientos.pop(pid, None)
+
+def _limpiar_caducidades():
+    with _lock_caducidad:
+        _vencimientos.clear()
+        _caducidades.clear()
+
+"""
+    Normaliza un TTL recibido como texto.
+    Retorna los segundos (float) o None si no es un número positivo y finito.
+"""
+def parsear_ttl(ttl):
+    try:
+        segundos = float(ttl)
+    except ValueError:
+        return None
+    return segundos if 0 < segundos < float("inf") else None
+
+"""
+    Retorna el registro actual de un PID, o None si no existe. No toma
+    locks: los registros no se modifican en sitio.
+"""
+def obtener_proceso(pid):
+    return shards[_indice_shard(pid)].get(pid)
+
+"""
+    Retorna el índice de la partición que corresponde a un PID.
+    pid: ID del proceso (cadena).
+"""
+def _indice_shard(pid):
+    return hash(pid) % NUM_SHARDS
 
 """    
     Crea un nuevo proceso.
     nombre: Nombre del proceso.
     prioridad: Prioridad del proceso.
+    ttl: Segundos tras los que el proceso se elimina solo si nadie lo
+    renueva (renovar_proceso), o None para que no caduque.
     Retorna una tupla (exito, mensaje).
     Si el proceso ya existe, retorna False y un mensaje de Proceso ya existe.
     Si el proceso se crea correctamente, retorna True y un mensaje de Proceso creado.
 """
-def crear_proceso(nombre, prioridad):
-    global next_pid
-    with lock:
-        pid = str(next_pid)
-        
-        procesos[pid] = {
-            "nombre": nombre,
-            "prioridad": prioridad,
-            "estado": "activo"
-        }
-        next_pid += 1
-        return True, f"Proceso {pid} creado."
+def crear_proceso(nombre, prioridad, ttl=None):
+    pid = _asignar_pid()
+    with locks[_indice_shard(pid)]:
+        resultado = _crear(pid, nombre, prioridad)
+        _notificar(("c", pid, nombre, prioridad))
+        if ttl is not None:
+            _notificar(("p", pid, _arrendar(pid, ttl)))
+        return resultado
+
+"""
+    Igual que crear_proceso, pero retorna el PID asignado en lugar del
+    mensaje: (True, pid). Útil para protocolos que no envían texto.
+"""
+def registrar_proceso(nombre, prioridad):
+    pid = _asignar_pid()
+    with locks[_indice_shard(pid)]:
+        _crear(pid, nombre, prioridad)
+        _notificar(("c", pid, nombre, prioridad))
+    return True, pid
+
+"""
+    Reserva el siguiente PID sin crear ningún proceso (en modo cluster, el
+    nodo que recibe CREAR elige el PID y lo crea el nodo dueño).
+"""
+def reservar_pid():
+    return _asignar_pid()
+
+"""
+    Asigna el próximo PID y avanza el contador.
+"""
+def _asignar_pid():
+    global _siguiente_pid
+    with _lock_pid:
+        pid = _siguiente_pid
+        _siguiente_pid += _paso_pid
+    return str(pid)
+
+"""
+    Crea un proceso con un PID ya elegido, por ejemplo uno reservado en
+    otro nodo o uno que llega de otro nodo al rebalancear el cluster.
+    estado: Estado inicial; si no es el de listo se notifica como MODIFICAR.
+    ttl: Segundos de plazo (None = sin plazo).
+    reemplazar: True para sustituir el registro si el PID ya existe; se
+    elimina y se crea con el mismo lock, así nadie ve el PID ausente.
+    Retorna (exito, mensaje); sin reemplazar, falla si el PID ya existe.
+"""
+def acoger_proceso(pid, nombre, prioridad, estado=ESTADO_LISTO, ttl=None, reemplazar=False):
+    with locks[_indice_shard(pid)]:
+        if pid in shards[_indice_shard(pid)]:
+            if not reemplazar:
+                return False, f"Proceso {pid} ya existe."
+            _eliminar(pid)
+            _notificar(("e", pid))
+        resultado = _crear(pid, nombre, prioridad)
+        _notificar(("c", pid, nombre, prioridad))
+        if estado != ESTADO_LISTO:
+            _modificar(pid, "estado", estado)
+            _notificar(("m", pid, "estado", estado))
+        if ttl is not None:
+            _notificar(("p", pid, _arrendar(pid, ttl)))
+        return resultado
+
+# Versiones sin lock de crear/eliminar/modificar. Se deben llamar con el
+# lock de la partición del PID tomado (o con todos, como en ejecutar_lote).
+def _crear(pid, nombre, prioridad):
+    proceso = Proceso(nombre, prioridad)
+    shards[_indice_shard(pid)][pid] = proceso
+    _indexar(pid, proceso)
+    _nueva_version()
+    return True, f"Proceso {pid} creado."
+
+def _eliminar(pid):
+    procesos = shards[_indice_shard(pid)]
+    if pid in procesos:
+        _desindexar(pid, procesos.pop(pid))
+        _desarrendar(pid)
+        _nueva_version()
+        return True, f"Proceso {pid} eliminado."
+    return False, "Proceso no encontrado."
+
+def _modificar(pid, campo, valor):
+    procesos = shards[_indice_shard(pid)]
+    if pid not in procesos:
+        return False, "Proceso no encontrado."
+    if campo not in CAMPOS_PROCESO:
+        return False, "Campo inválido."
+    anterior = procesos[pid]
+    procesos[pid] = nuevo = anterior.reemplazar(campo, valor)
+    _reindexar(pid, campo, getattr(anterior, campo), getattr(nuevo, campo))
+    _encolar(pid, nuevo)
+    _nueva_version()
+    return True, f"Proceso {pid} actualizado."
+
+# Operaciones permitidas dentro de ejecutar_lote.
+_OPERACIONES_LOTE = {
+    "crear": _crear,
+    "eliminar": _eliminar,
+    "modificar": _modificar,
+}
+
+"""
+    Adquiere los locks de todas las particiones, siempre en el mismo orden
+    para evitar interbloqueos entre llamadas concurrentes.
+"""
+def _adquirir_todos():
+    for l in locks:
+        l.acquire()
+
+def _liberar_todos():
+    for l in reversed(locks):
+        l.release()
+
+"""
+    Ejecuta varias operaciones de forma atómica con una sola adquisición
+    de los locks del almacén.
+    operaciones: Lista de tuplas (accion, *args) con accion en
+    "crear" (nombre, prioridad), "eliminar" (pid) o
+    "modificar" (pid, campo, valor).
+    Retorna una tupla (exito, resultados).
+    Si todas las operaciones tienen éxito, retorna True y la lista de mensajes.
+    Si alguna falla, deshace las anteriores y retorna False y un mensaje
+    indicando la operación que falló. Los PIDs asignados no se reutilizan.
+"""
+def ejecutar_lote(operaciones):
+    _adquirir_todos()
+    try:
+        resultados = []
+        anteriores = []
+        mutaciones = []
+        for n, (accion, *args) in enumerate(operaciones, 1):
+            if accion == "crear":
+                args = [_asignar_pid()] + args
+            pid = args[0]
+            anteriores.append((pid, shards[_indice_shard(pid)].get(pid), _vencimientos.get(pid)))
+            ok, msg = _OPERACIONES_LOTE[accion](*args)
+            if not ok:
+                _deshacer(anteriores)
+                return False, f"Lote abortado en la operación {n}: {msg}"
+            resultados.append(msg)
+            mutaciones.append((accion[0], *args))
+        _notificar(("l", mutaciones))
+        return True, resultados
+    finally:
+        _liberar_todos()
+
+"""
+    Restaura los registros previos de un lote fallido, en orden inverso,
+    con su plazo.
+    anteriores: Lista de tuplas (pid, Proceso o None si no existía,
+    vencimiento o None si no tenía plazo).
+"""
+def _deshacer(anteriores):
+    for pid, anterior, vence in reversed(anteriores):
+        procesos = shards[_indice_shard(pid)]
+        actual = procesos.pop(pid, None)
+        if actual is not None:
+            _desindexar(pid, actual)
+            _desarrendar(pid)
+        if anterior is not None:
+            procesos[pid] = anterior
+            _indexar(pid, anterior)
+            if vence is not None:
+                _vencer_en(pid, vence)
+    _nueva_version()
 
 """ 
-    Lista todos los procesos existentes.
+    Lista los procesos existentes.
+    offset: Número de procesos a saltar (ordenados por PID).
+    limit: Máximo de procesos a listar (None para todos).
+    filtros: Lista opcional de tuplas (campo, valor); solo se listan los
+    procesos que cumplen todas (se resuelven con los índices secundarios).
     Retorna una cadena con la lista de procesos o 
     un mensaje indicando que no hay procesos.
 """
-def listar_procesos():
-    with lock:
-        if not procesos:
-            return "Sin procesos."
-        return "\n".join([f"{pid}: {info}" for pid, info in procesos.items()])
+def listar_procesos(offset=0, limit=None, filtros=None):
+    global _cache_listado
+    if filtros:
+        fin = None if limit is None else offset + limit
+        filas = itertools.islice(buscar_procesos(filtros), offset, fin)
+        return "\n".join([fila(pid, info) for pid, info in filas]) or "Sin procesos."
+    completo = offset == 0 and limit is None and _campos_en_vivo is None
+    if completo and _cache_listado[0] == _version:
+        return _cache_listado[1]
+    version, procesos = _snapshot_versionado()
+    fin = None if limit is None else offset + limit
+    filas = itertools.islice(procesos, offset, fin)
+    listado = "\n".join([fila(pid, info) for pid, info in filas]) or "Sin procesos."
+    if completo:
+        _cache_listado = (version, listado)
+    return listado
+
+"""
+    Genera las filas de LISTAR ("pid: info") una a una, sin construir
+    la respuesta completa en memoria.
+    offset: Número de procesos a saltar (ordenados por PID).
+    limit: Máximo de procesos a generar (None para todos).
+    filtros: Lista opcional de tuplas (campo, valor), como en listar_procesos.
+"""
+def iterar_filas(offset=0, limit=None, filtros=None):
+    procesos = buscar_procesos(filtros) if filtros else snapshot_procesos()
+    fin = None if limit is None else offset + limit
+    for pid, info in itertools.islice(procesos, offset, fin):
+        yield fila(pid, info)
+
+"""
+    Busca los procesos que cumplen todos los filtros usando los índices.
+    filtros: Lista de tuplas (campo, valor) con campo en CAMPOS_PROCESO.
+    Se recorre solo el conjunto de PIDs más pequeño de los filtros, así el
+    coste es proporcional al número de resultados y no al del almacén.
+    Cada registro se comprueba de nuevo al leerlo, por si cambió después
+    de consultar los índices.
+    Retorna una lista de tuplas (pid, Proceso) ordenada por PID.
+"""
+def buscar_procesos(filtros):
+    with _lock_indices:
+        conjuntos = [indices[campo].get(valor, ()) for campo, valor in filtros]
+        menor = min(conjuntos, key=len)
+        pids = [pid for pid in menor if all(pid in c for c in conjuntos)]
+    pids.sort(key=int)
+    resultado = []
+    for pid in pids:
+        proceso = shards[_indice_shard(pid)].get(pid)
+        if proceso is not None and all(getattr(proceso, campo) == valor for campo, valor in filtros):
+            resultado.append((pid, proceso))
+    return resultado
+
+"""
+    Retorna los k procesos listos de mayor prioridad sin sacarlos de la cola.
+    Recorre el montículo en orden (búsqueda best-first sobre sus hijos),
+    así el coste es O(k log k) más las entradas obsoletas que encuentre,
+    sin ordenar todo el almacén.
+    Retorna una lista de tuplas (pid, Proceso).
+"""
+def top_procesos(k):
+    resultado = []
+    vistos = set()
+    with _lock_cola:
+        candidatos = [(_cola[0], 0)] if _cola else []
+        while candidatos and len(resultado) < k:
+            entrada, i = heapq.heappop(candidatos)
+            pid = entrada[3]
+            if pid not in vistos and _entrada_valida(entrada):
+                vistos.add(pid)
+                resultado.append((pid, entrada[4]))
+            for hijo in (2 * i + 1, 2 * i + 2):
+                if hijo < len(_cola):
+                    heapq.heappush(candidatos, (_cola[hijo], hijo))
+    return resultado
+
+"""
+    Saca de la cola el proceso listo de mayor prioridad y lo marca como
+    "ejecutando" (con MODIFICAR, así índices, WAL y observadores lo ven).
+    Retorna una tupla (pid, Proceso actualizado), o None si no hay procesos listos.
+"""
+def siguiente_proceso():
+    while True:
+        with _lock_cola:
+            while _cola and not _entrada_valida(_cola[0]):
+                heapq.heappop(_cola)
+            if not _cola:
+                return None
+            pid, proceso = _cola[0][3], _cola[0][4]
+        # El lock de la partición se toma sin el de la cola (mismo orden que
+        # las mutaciones); si el proceso cambió mientras tanto, se reintenta.
+        with locks[_indice_shard(pid)]:
+            if shards[_indice_shard(pid)].get(pid) is not proceso:
+                continue
+            _modificar(pid, "estado", ESTADO_EJECUTANDO)
+            _notificar(("m", pid, "estado", ESTADO_EJECUTANDO))
+            return pid, shards[_indice_shard(pid)][pid]
+
+"""
+    Registra un observador y retorna los procesos listos en ese mismo
+    instante (con todos los locks tomados), así el observador ve todas las
+    mutaciones posteriores y ninguna anterior. Con los locks solo se
+    cruzan los índices (operaciones de conjuntos), sin recorrer los registros.
+    Retorna un dict prioridad -> conjunto de PIDs listos con esa prioridad.
+"""
+def observar_listos(observador):
+    _adquirir_todos()
+    try:
+        registrar_observador(observador)
+        with _lock_indices:
+            listos = indices["estado"].get(ESTADO_LISTO, set())
+            grupos = {valor: pids & listos for valor, pids in indices["prioridad"].items()}
+    finally:
+        _liberar_todos()
+    return {valor: pids for valor, pids in grupos.items() if pids}
+
+"""
+    Cambia el estado de varios procesos en trozos de TROZO_ESTADOS: cada
+    trozo se aplica con una sola adquisición de los locks y se notifica
+    como un lote, y entre trozos los demás clientes pueden avanzar.
+    cambios: Dict pid -> estado nuevo.
+    esperados: Estados actuales que se pueden sobrescribir; los procesos
+    eliminados o que otro cliente pasó a otro estado se dejan como están.
+    Retorna el número de procesos cambiados.
+"""
+def fijar_estados(cambios, esperados):
+    items = iter(cambios.items())
+    total = 0
+    while trozo := list(itertools.islice(items, TROZO_ESTADOS)):
+        _adquirir_todos()
+        try:
+            mutaciones = []
+            for pid, estado in trozo:
+                proceso = shards[_indice_shard(pid)].get(pid)
+                if proceso is not None and proceso.estado != estado and proceso.estado in esperados:
+                    _modificar(pid, "estado", estado)
+                    mutaciones.append(("m", pid, "estado", estado))
+            if mutaciones:
+                _notificar(("l", mutaciones))
+        finally:
+            _liberar_todos()
+        total += len(mutaciones)
+    return total
+
+"""
+    Toma una vista consistente de todos los procesos.
+    Se adquieren todos los locks (siempre en el mismo orden) solo mientras
+    se copian las referencias a los registros; como los registros no se
+    modifican en sitio, no hace falta copiarlos. El orden y el formateo
+    se hacen fuera de los locks.
+    Retorna una lista de tuplas (pid, Proceso) ordenada por PID.
+"""
+def snapshot_procesos():
+    return _snapshot_versionado()[1]
+
+"""
+    Igual que snapshot_procesos, pero retorna también la versión del
+    almacén leída con todos los locks tomados: (version, procesos).
+"""
+def _snapshot_versionado():
+    _adquirir_todos()
+    try:
+        version = _version
+        copia = [item for shard in shards for item in shard.items()]
+    finally:
+        _liberar_todos()
+    copia.sort(key=lambda item: int(item[0]))
+    return version, copia
 
 """
     Elimina un proceso existente.
@@ -53,11 +688,25 @@ def listar_procesos():
     Si el proceso se elimina correctamente, retorna True y un mensaje de Proceso eliminado.
 """
 def eliminar_proceso(pid):
-    with lock:
-        if pid in procesos:
-            del procesos[pid]
-            return True, f"Proceso {pid} eliminado."
-        return False, "Proceso no encontrado."
+    with locks[_indice_shard(pid)]:
+        ok, msg = _eliminar(pid)
+        if ok:
+            _notificar(("e", pid))
+        return ok, msg
+
+"""
+    Elimina un proceso solo si su registro sigue siendo proceso, es decir,
+    si nadie lo ha modificado desde que se leyó (los registros no se
+    modifican en sitio). Se usa al pasar un proceso a otro nodo.
+    Retorna True si se eliminó.
+"""
+def ceder_proceso(pid, proceso):
+    with locks[_indice_shard(pid)]:
+        if shards[_indice_shard(pid)].get(pid) is not proceso:
+            return False
+        _eliminar(pid)
+        _notificar(("e", pid))
+        return True
 
 """
     Modifica un campo de un proceso existente.
@@ -71,18 +720,233 @@ def eliminar_proceso(pid):
     retorna True y un mensaje de Proceso actualizado.
 """
 def modificar_proceso(pid, campo, valor):
-    with lock:
-        if pid not in procesos:
+    with locks[_indice_shard(pid)]:
+        ok, msg = _modificar(pid, campo, valor)
+        if ok:
+            _notificar(("m", pid, campo, valor))
+        return ok, msg
+
+"""
+    Renueva el plazo de un proceso: caducará ttl segundos después de ahora.
+    También da plazo a un proceso creado sin TTL.
+    pid: ID del proceso.
+    ttl: Segundos (ver parsear_ttl).
+    Retorna una tupla (exito, mensaje).
+"""
+def renovar_proceso(pid, ttl):
+    with locks[_indice_shard(pid)]:
+        if pid not in shards[_indice_shard(pid)]:
             return False, "Proceso no encontrado."
-        if campo not in procesos[pid]:
-            return False, "Campo inválido."
-        procesos[pid][campo] = valor
-        return True, f"Proceso {pid} actualizado."
+        _notificar(("p", pid, _arrendar(pid, ttl)))
+        return True, f"Proceso {pid} renovado."
+
+"""
+    Retorna los segundos que le quedan al plazo de un proceso, o None si
+    no tiene plazo.
+"""
+def plazo_restante(pid):
+    vence = _vencimientos.get(pid)
+    return None if vence is None else max(vence - time.monotonic(), 0.0)
+
+"""
+    Retorna los plazos actuales como dict pid -> instante de caducidad en
+    tiempo de reloj (time.time). Para un snapshot coherente con el almacén
+    se llama con todos los locks tomados (dentro de congelar).
+"""
+def plazos_absolutos():
+    desfase = time.time() - time.monotonic()
+    with _lock_caducidad:
+        return {pid: vence + desfase for pid, vence in _vencimientos.items()}
+
+"""
+    Vuelve a armar plazos guardados (por ejemplo, al recuperar desde
+    disco). Los vencidos mientras el servidor estaba parado caducan en la
+    siguiente pasada del recolector. No notifica: las mutaciones "p" ya
+    están en el WAL.
+    plazos: dict pid -> instante de caducidad en tiempo de reloj.
+"""
+def restaurar_plazos(plazos):
+    ahora = time.time()
+    for pid, vence in plazos.items():
+        with locks[_indice_shard(pid)]:
+            if pid in shards[_indice_shard(pid)]:
+                _arrendar(pid, max(vence - ahora, 0.0))
+
+"""
+    Elimina los procesos cuyo plazo ha vencido. La llama el recolector.
+    Saca del montículo solo las entradas vencidas, así el coste es
+    proporcional a los procesos que caducan y no al tamaño del almacén.
+    Cada proceso se elimina como con ELIMINAR (WAL, eventos, índices).
+    ahora: Instante de time.monotonic() con el que comparar (por defecto, el actual).
+    Retorna el número de procesos eliminados.
+"""
+def caducar_procesos(ahora=None):
+    if ahora is None:
+        ahora = time.monotonic()
+    vencidas = []
+    with _lock_caducidad:
+        while _caducidades and _caducidades[0][0] <= ahora:
+            vence, pid = heapq.heappop(_caducidades)
+            if _vencimientos.get(pid) == vence:
+                vencidas.append((vence, pid))
+    eliminados = 0
+    for vence, pid in vencidas:
+        with locks[_indice_shard(pid)]:
+            # Se comprueba de nuevo con el lock de la partición, que es el
+            # que toma renovar_proceso: un plazo renovado ya no caduca.
+            if _vencimientos.get(pid) != vence:
+                continue
+            ok, _ = _eliminar(pid)
+            if ok:
+                _notificar(("e", pid))
+                eliminados += 1
+    if eliminados:
+        metricas.caducados(eliminados)
+    return eliminados
+
+"""
+    Retorna los segundos hasta el próximo vencimiento, o None si no hay plazos.
+"""
+def proximo_vencimiento():
+    with _lock_caducidad:
+        while _caducidades and _vencimientos.get(_caducidades[0][1]) != _caducidades[0][0]:
+            heapq.heappop(_caducidades)
+        if not _caducidades:
+            return None
+        return max(0.0, _caducidades[0][0] - time.monotonic())
+
+"""
+    Bucle del hilo recolector: caduca los procesos vencidos y duerme hasta
+    el próximo vencimiento (como mucho INTERVALO_RECOLECTOR, y menos si
+    llega un plazo más corto).
+"""
+def _recolectar():
+    while True:
+        try:
+            caducar_procesos()
+        except Exception:
+            registro.error("recolector_fallido", traza=True)
+        espera = proximo_vencimiento()
+        _despertar_recolector.wait(INTERVALO_RECOLECTOR if espera is None else min(espera, INTERVALO_RECOLECTOR))
+        _despertar_recolector.clear()
 
 """
     Utilidad para limpiar todos los procesos. Útil en tests.
 """
 def reiniciar_procesos():
-    procesos.clear()
-    global next_pid
-    next_pid = 1
+    _adquirir_todos()
+    try:
+        for shard in shards:
+            shard.clear()
+        _limpiar_indices()
+        _limpiar_caducidades()
+        _nueva_version()
+        fijar_siguiente_pid(1)
+        _notificar(("r",))
+    finally:
+        _liberar_todos()
+
+"""
+    Aplica una mutación (ver _observadores) sin notificar a los
+    observadores. Se usa al recuperar el almacén desde disco o desde otro
+    servidor; el llamador debe garantizar que no hay accesos concurrentes.
+    Los plazos ("p") no se arman: en una réplica los caduca el primario, y
+    al recuperar desde disco se arman después con restaurar_plazos.
+    Retorna el PID numérico más alto creado por la mutación, o 0.
+"""
+def aplicar_mutacion(mutacion):
+    tipo = mutacion[0]
+    if tipo == "c":
+        _crear(*mutacion[1:])
+        return int(mutacion[1])
+    if tipo == "e":
+        _eliminar(mutacion[1])
+    elif tipo == "m":
+        _modificar(*mutacion[1:])
+    elif tipo == "l":
+        return max([aplicar_mutacion(m) for m in mutacion[1]], default=0)
+    elif tipo == "r":
+        for shard in shards:
+            shard.clear()
+        _limpiar_indices()
+        _limpiar_caducidades()
+        _nueva_version()
+        fijar_siguiente_pid(1)
+    return 0
+
+"""
+    Aplica una mutación recibida de otro servidor (una réplica recibe así
+    las del primario): toma los locks que necesita y la notifica a los
+    observadores como si se hubiera hecho aquí.
+    mutacion: Tupla como las de _observadores.
+"""
+def replicar_mutacion(mutacion):
+    if mutacion[0] in ("c", "e", "m", "p"):
+        with locks[_indice_shard(mutacion[1])]:
+            aplicar_mutacion(mutacion)
+            _notificar(mutacion)
+        return
+    _adquirir_todos()
+    try:
+        aplicar_mutacion(mutacion)
+        _notificar(mutacion)
+    finally:
+        _liberar_todos()
+
+"""
+    Reemplaza el contenido del almacén.
+    procesos: Iterable de tuplas (pid, Proceso).
+    siguiente_pid: PID que recibirá el próximo proceso creado.
+    notificar: True para que los observadores vean un reinicio ("r",)
+    antes de la carga (por ejemplo, una réplica que recibe un snapshot).
+    Igual que fijar_siguiente_pid, solo es seguro sin otros hilos creando procesos.
+"""
+def cargar_procesos(procesos, siguiente_pid, notificar=False):
+    _adquirir_todos()
+    try:
+        for shard in shards:
+            shard.clear()
+        _limpiar_indices()
+        _limpiar_caducidades()
+        if notificar:
+            _notificar(("r",))
+        for pid, proceso in procesos:
+            shards[_indice_shard(pid)][pid] = proceso
+            _indexar(pid, proceso)
+        _nueva_version()
+        fijar_siguiente_pid(siguiente_pid)
+    finally:
+        _liberar_todos()
+
+"""
+    Fija el PID que recibirá el próximo proceso creado. Puede hacer
+    retroceder el contador, así que solo es seguro sin otros hilos creando
+    procesos (por ejemplo, durante la recuperación al arrancar).
+    paso: Distancia entre PIDs consecutivos (en modo cluster cada nodo usa
+    los PIDs de su resto módulo paso, así no se repiten entre nodos).
+"""
+def fijar_siguiente_pid(siguiente, paso=1):
+    global _siguiente_pid, _paso_pid
+    with _lock_pid:
+        _siguiente_pid, _paso_pid = siguiente, paso
+
+"""
+    Toma una vista consistente para persistir el almacén.
+    al_congelar: Función que se ejecuta con todos los locks tomados (por
+    ejemplo, para rotar el WAL exactamente en ese punto).
+    Retorna (procesos, siguiente_pid, resultado de al_congelar).
+    siguiente_pid se lee sin avanzar el contador. Un PID asignado antes
+    que aún espera el lock de su partición queda por debajo, y su creación
+    va al WAL posterior al corte.
+"""
+def congelar(al_congelar):
+    _adquirir_todos()
+    try:
+        procesos = [item for shard in shards for item in shard.items()]
+        with _lock_pid:
+            siguiente = _siguiente_pid
+        resultado = al_congelar()
+    finally:
+        _liberar_todos()
+    procesos.sort(key=lambda item: int(item[0]))
+    return procesos, siguiente, resultado
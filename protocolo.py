@@ -0,0 +1,261 @@
+# protocolo.py
+# Description: Utilidades de encuadre (framing) del protocolo de texto del servidor.
+
+import functools
+import os
+from command_handler import procesar_comando, formato_ok, formato_error, tamano_lote, lineas_anunciadas_lote
+from eventos import Suscriptor
+from protocolo_binario import FramerBinario, generar_respuestas_binarias, respuesta_error_binaria
+
+# Longitud máxima de una línea sin terminar antes de descartar la conexión.
+MAX_LINEA = 64 * 1024
+
+# Bytes máximos de un LOTE en curso (cabecera y comandos) antes de
+# descartar la conexión.
+MAX_BYTES_LOTE = 16 * 1024 * 1024
+
+# Primer comando con el que un cliente pide el protocolo binario.
+COMANDO_BINARIO = b"binario"
+
+# Máximo de segmentos por llamada a sendmsg (IOV_MAX del sistema).
+MAX_SEGMENTOS = os.sysconf("SC_IOV_MAX") if "SC_IOV_MAX" in os.sysconf_names else 1024
+
+"""
+    Acumula bytes recibidos y los separa en comandos terminados en '\n'.
+    Permite recibir varios comandos en una misma lectura (pipelining)
+    y comandos partidos entre varios segmentos TCP.
+    Una cabecera LOTE|n y sus n líneas siguientes se entregan juntas como
+    un único comando multilínea. Si la cabecera es inválida (n > MAX_LOTE,
+    campos de más) se entrega sola, para que responda un único ERROR, y sus
+    n líneas se descartan: nunca se ejecutan una a una.
+"""
+class FramerLineas:
+    """
+        max_linea: Tamaño máximo permitido para una línea incompleta.
+        max_bytes_lote: Tamaño máximo de un LOTE en curso.
+    """
+    def __init__(self, max_linea=MAX_LINEA, max_bytes_lote=MAX_BYTES_LOTE):
+        self.buffer = bytearray()
+        self.max_linea = max_linea
+        self.max_bytes_lote = max_bytes_lote
+        # Líneas acumuladas del LOTE en curso, cuántas faltan y sus bytes.
+        self.lote = None
+        self.faltan = 0
+        self.bytes_lote = 0
+        # Líneas que quedan por descartar de un LOTE con cabecera inválida.
+        self.descartar = 0
+
+    """
+        Añade bytes al buffer y retorna la lista de líneas completas.
+        data: Bytes recibidos del socket (bytes, bytearray o memoryview).
+        Los saltos se buscan sobre los bytes y todas las líneas completas
+        se decodifican de una vez (sin un bytearray por línea). Las líneas vacías se ignoran. Lanza ValueError si la
+        línea pendiente supera max_linea o el LOTE en curso max_bytes_lote.
+    """
+    def alimentar(self, data):
+        buffer = self.buffer
+        nuevos = len(data)
+        buffer += data
+        # Solo puede haber saltos nuevos en lo recién recibido.
+        fin = buffer.rfind(b"\n", len(buffer) - nuevos)
+        if fin < 0:
+            if len(buffer) > self.max_linea:
+                raise ValueError("Línea demasiado larga.")
+            return []
+        if fin == len(buffer) - 1:
+            # Caso habitual: la lectura termina en un salto de línea.
+            texto = buffer.decode("utf-8", "ignore")
+            buffer.clear()
+        else:
+            with memoryview(buffer) as vista:
+                texto = str(vista[:fin], "utf-8", "ignore")
+            del buffer[:fin + 1]
+        if len(buffer) > self.max_linea:
+            raise ValueError("Línea demasiado larga.")
+        return self._agrupar(l for l in texto.split("\n") if l.strip())
+
+    """
+        Agrupa las líneas de cada LOTE|n con su cabecera.
+        lineas: Líneas completas en orden de llegada.
+    """
+    def _agrupar(self, lineas):
+        comandos = []
+        for linea in lineas:
+            if self.descartar:
+                self.descartar -= 1
+                continue
+            if self.lote is not None:
+                self.lote.append(linea)
+                self.faltan -= 1
+                self.bytes_lote += len(linea) + 1
+                if self.bytes_lote > self.max_bytes_lote:
+                    self.lote = None
+                    raise ValueError("Lote demasiado grande.")
+                if self.faltan == 0:
+                    comandos.append("\n".join(self.lote))
+                    self.lote = None
+                continue
+            n = lineas_anunciadas_lote(linea)
+            if n and tamano_lote(linea) is None:
+                # Cabecera inválida: un solo ERROR y sus n líneas fuera.
+                comandos.append(linea)
+                self.descartar = n
+            elif n:
+                self.lote = [linea]
+                self.faltan = n
+                self.bytes_lote = len(linea) + 1
+            else:
+                comandos.append(linea)
+        return comandos
+
+    """
+        Retorna y vacía el contenido pendiente sin '\n' final.
+        Útil al cerrar la conexión para procesar el último comando.
+    """
+    def vaciar(self):
+        resto = self.buffer.decode(errors='ignore')
+        self.buffer.clear()
+        if self.lote is not None:
+            lote = self.lote + ([resto] if resto.strip() else [])
+            self.lote = None
+            return "\n".join(lote)
+        return resto if resto.strip() else None
+
+"""
+    Procesa un lote de comandos en orden y genera los bloques a enviar.
+    Las respuestas normales se codifican una a una directamente en el
+    bytearray salida (el de la conexión, sin concatenar cadenas ni un
+    join/encode final) y se generan juntas como ese mismo bytearray, que
+    solo es válido hasta pedir el siguiente bloque: hay que enviarlo (o
+    copiarlo) antes. Una respuesta en streaming (LISTAR|STREAM) vacía lo
+    acumulado y se envía bloque a bloque (bytes) para no construirla entera
+    en memoria.
+    Tras SUSCRIBIR se genera el eventos.Suscriptor: la conexión pasa a
+    recibir eventos y los comandos siguientes se ignoran.
+    lineas: Lista de comandos (sin '\n').
+    salida: Buffer de salida de la conexión (uno nuevo si es None).
+"""
+def generar_respuestas(lineas, salida=None):
+    if salida is None:
+        salida = bytearray()
+    elif salida:
+        salida.clear()
+    for linea in lineas:
+        respuesta = procesar_comando(linea)
+        if respuesta.__class__ is str:
+            salida += respuesta.encode()
+            salida += b"\n"
+            continue
+        if salida:
+            yield salida
+            salida.clear()
+        if isinstance(respuesta, Suscriptor):
+            yield respuesta
+            return
+        for bloque in respuesta:
+            yield bloque.encode()
+    if salida:
+        yield salida
+
+"""
+    Procesa un lote de comandos y retorna todas las respuestas
+    concatenadas en un único bloque de bytes.
+    lineas: Lista de comandos (sin '\n').
+"""
+def procesar_lote(lineas):
+    respuestas = bytearray()
+    for bloque in generar_respuestas(lineas):
+        respuestas += bloque
+    return bytes(respuestas)
+
+"""
+    Envía varios segmentos con una sola llamada sendmsg (writev), sin
+    juntarlos en un bytes nuevo.
+    conn: Socket conectado.
+    segmentos: Lista de objetos bytes-like.
+    Un envío parcial (buffer del socket lleno) se completa con sendall.
+"""
+def enviar_segmentos(conn, segmentos):
+    for inicio in range(0, len(segmentos), MAX_SEGMENTOS):
+        grupo = segmentos[inicio:inicio + MAX_SEGMENTOS]
+        enviados = conn.sendmsg(grupo)
+        for segmento in grupo:
+            largo = len(segmento)
+            if enviados < largo:
+                with memoryview(segmento) as vista:
+                    conn.sendall(vista[enviados:])
+            enviados = max(enviados - largo, 0)
+
+"""
+    Respuesta enviada antes de cerrar una conexión cuya línea excede MAX_LINEA.
+"""
+def respuesta_linea_larga(error):
+    return (formato_error(str(error)) + "\n").encode()
+
+
+"""
+    Estado del protocolo de una conexión.
+    La primera línea recibida decide el protocolo: si es BINARIO, el resto
+    de la conexión usa tramas binarias (ver protocolo_binario); en otro
+    caso se usa el protocolo de texto y esa línea es un comando normal.
+    responder_texto / responder_binario: Funciones que reciben la lista de
+    comandos (o tramas) completos y generan los bloques de respuesta. Por
+    defecto se procesan en este proceso; el modo multiproceso las sustituye
+    por otras que reenvían los comandos al proceso dueño del almacén.
+"""
+class Sesion:
+    def __init__(self, responder_texto=generar_respuestas, responder_binario=generar_respuestas_binarias):
+        self.framer = FramerLineas()
+        # Buffer de salida propio de la conexión, reutilizado en cada lote.
+        self.salida = bytearray()
+        if responder_texto is generar_respuestas:
+            responder_texto = functools.partial(generar_respuestas, salida=self.salida)
+        self.responder = responder_texto
+        self.responder_binario = responder_binario
+        self.binario = False
+        # Bytes recibidos antes de completar la primera línea.
+        self.inicio = bytearray()
+
+    """
+        Procesa bytes recibidos y retorna un iterable de bloques a enviar
+        (bytes o bytearray, ver generar_respuestas). Lanza ValueError
+        si la entrada excede los límites del protocolo; en ese caso se
+        debe enviar respuesta_error y cerrar.
+        data: Bytes recibidos del socket (bytes, bytearray o memoryview).
+    """
+    def recibir(self, data):
+        if self.inicio is None:
+            return self.responder(self.framer.alimentar(data))
+        self.inicio += data
+        if b"\n" not in self.inicio:
+            if len(self.inicio) > MAX_LINEA:
+                raise ValueError("Línea demasiado larga.")
+            return ()
+        inicio, self.inicio = self.inicio, None
+        linea, _, resto = inicio.partition(b"\n")
+        if linea.strip().lower() != COMANDO_BINARIO:
+            return self.responder(self.framer.alimentar(inicio))
+        self.binario = True
+        self.framer = FramerBinario()
+        self.responder = self.responder_binario
+        aceptado = (formato_ok("Protocolo binario activado.") + "\n").encode()
+        return [aceptado, *self.responder(self.framer.alimentar(bytes(resto)))]
+
+    """
+        Procesa lo que quede pendiente al cerrar el cliente su envío.
+        Retorna un iterable de bloques a enviar.
+    """
+    def cerrar(self):
+        if self.inicio is not None:
+            self.framer.buffer += self.inicio
+            self.inicio = None
+        ultimo = self.framer.vaciar()
+        return self.responder([ultimo]) if ultimo else ()
+
+    """
+        Respuesta a enviar antes de cerrar por una entrada inválida.
+    """
+    def respuesta_error(self, error):
+        if self.binario:
+            return respuesta_error_binaria(error)
+        return respuesta_linea_larga(error)
@@ -0,0 +1,269 @@
+# protocolo_binario.py
+# Description: Protocolo binario compacto (opcional) del servidor de procesos.
+#
+# Se activa enviando la línea "BINARIO" como primer comando de la conexión.
+# A partir de ahí cada petición y cada respuesta es una trama:
+#
+#   u32 longitud | carga (longitud bytes)
+#
+# Carga de una petición: u8 opcode + campos. Los textos van como
+# u32 longitud + UTF-8 y los PIDs como u32 (big-endian en todo el protocolo).
+#
+#   CREAR      (1): texto nombre, texto prioridad
+#   LISTAR     (2): u32 offset, u32 limit (0 = sin límite)
+#   ELIMINAR   (3): u32 pid
+#   MODIFICAR  (4): u32 pid, u8 campo (índice en CAMPOS_PROCESO), texto valor
+#
+# Carga de una respuesta: u8 estado + datos.
+#
+#   OK    (0): CREAR -> u32 pid; ELIMINAR y MODIFICAR -> vacío
+#   ERROR (1): mensaje UTF-8
+#   DATOS (2): u32 n + n registros (u32 pid, texto nombre, texto prioridad, texto estado)
+
+import itertools
+import struct
+import time
+import metricas
+import registro
+from process_manager import CAMPOS_PROCESO, registrar_proceso, snapshot_procesos, eliminar_proceso, modificar_proceso
+
+OP_CREAR = 1
+OP_LISTAR = 2
+OP_ELIMINAR = 3
+OP_MODIFICAR = 4
+
+ESTADO_OK = 0
+ESTADO_ERROR = 1
+ESTADO_DATOS = 2
+
+# Tamaño máximo de la carga de una trama.
+MAX_TRAMA = 64 * 1024
+
+_U8 = struct.Struct("!B")
+_U32 = struct.Struct("!I")
+_U32_U32 = struct.Struct("!II")
+_U32_U8 = struct.Struct("!IB")
+
+"""
+    Separa el flujo de bytes en tramas u32 longitud + carga.
+    Misma interfaz que FramerLineas (alimentar/vaciar).
+"""
+class FramerBinario:
+    """
+        max_trama: Tamaño máximo permitido para la carga de una trama.
+    """
+    def __init__(self, max_trama=MAX_TRAMA):
+        self.buffer = bytearray()
+        self.max_trama = max_trama
+
+    """
+        Añade bytes al buffer y retorna la lista de cargas completas.
+        data: Bytes recibidos del socket.
+        Lanza ValueError si una trama anuncia más de max_trama bytes.
+    """
+    def alimentar(self, data):
+        self.buffer += data
+        tramas = []
+        pos = 0
+        while len(self.buffer) - pos >= 4:
+            n = _U32.unpack_from(self.buffer, pos)[0]
+            if n > self.max_trama:
+                raise ValueError("Trama demasiado larga.")
+            if len(self.buffer) - pos - 4 < n:
+                break
+            tramas.append(bytes(self.buffer[pos + 4:pos + 4 + n]))
+            pos += 4 + n
+        del self.buffer[:pos]
+        return tramas
+
+    """
+        Descarta cualquier trama incompleta al cerrar la conexión.
+    """
+    def vaciar(self):
+        self.buffer = bytearray()
+        return None
+
+"""
+    Construye una trama a partir de su carga.
+"""
+def _trama(carga):
+    return _U32.pack(len(carga)) + carga
+
+def _texto(valor):
+    datos = valor.encode()
+    return _U32.pack(len(datos)) + datos
+
+def _leer_texto(carga, pos):
+    n = _U32.unpack_from(carga, pos)[0]
+    pos += 4
+    if pos + n > len(carga):
+        raise ValueError("Texto truncado.")
+    return carga[pos:pos + n].decode(), pos + n
+
+def _respuesta_ok(datos=b""):
+    return _trama(_U8.pack(ESTADO_OK) + datos)
+
+def _respuesta_error(mensaje):
+    return _trama(_U8.pack(ESTADO_ERROR) + mensaje.encode())
+
+# Respuestas constantes, construidas una sola vez.
+_OK_VACIO = _respuesta_ok()
+_ERROR_MAL_FORMADA = _respuesta_error("Trama mal formada.")
+_ERROR_OPCODE = _respuesta_error("Opcode no reconocido.")
+
+_U32_U8_U32 = struct.Struct("!IBI")
+
+def _crear(carga):
+    nombre, pos = _leer_texto(carga, 1)
+    prioridad, pos = _leer_texto(carga, pos)
+    if pos != len(carga):
+        return _ERROR_MAL_FORMADA
+    _, pid = registrar_proceso(nombre, prioridad)
+    return _respuesta_ok(_U32.pack(int(pid)))
+
+def _listar(carga):
+    if len(carga) != 1 + _U32_U32.size:
+        return _ERROR_MAL_FORMADA
+    offset, limit = _U32_U32.unpack_from(carga, 1)
+    # islice recorre la página sin copiar el resto de la vista.
+    procesos = list(itertools.islice(snapshot_procesos(), offset, offset + limit if limit else None))
+    datos = bytearray(_U8.pack(ESTADO_DATOS))
+    datos += _U32.pack(len(procesos))
+    for pid, info in procesos:
+        datos += _U32.pack(int(pid))
+        datos += _texto(info.nombre)
+        datos += _texto(info.prioridad)
+        datos += _texto(info.estado)
+    return _trama(bytes(datos))
+
+def _eliminar(carga):
+    if len(carga) != 1 + _U32.size:
+        return _ERROR_MAL_FORMADA
+    ok, msg = eliminar_proceso(str(_U32.unpack_from(carga, 1)[0]))
+    return _OK_VACIO if ok else _respuesta_error(msg)
+
+def _modificar(carga):
+    pid, indice, n = _U32_U8_U32.unpack_from(carga, 1)
+    if len(carga) != 1 + _U32_U8_U32.size + n:
+        return _ERROR_MAL_FORMADA
+    valor = carga[1 + _U32_U8_U32.size:].decode()
+    campo = CAMPOS_PROCESO[indice] if indice < len(CAMPOS_PROCESO) else ""
+    ok, msg = modificar_proceso(str(pid), campo, valor)
+    return _OK_VACIO if ok else _respuesta_error(msg)
+
+# Manejador de cada opcode. Cada uno recibe la carga completa.
+# Opcode -> (manejador, métrica). Las métricas son las mismas que las de
+# los comandos de texto equivalentes.
+_MANEJADORES = {
+    OP_CREAR: (_crear, metricas.metrica_comando("crear")),
+    OP_LISTAR: (_listar, metricas.metrica_comando("listar")),
+    OP_ELIMINAR: (_eliminar, metricas.metrica_comando("eliminar")),
+    OP_MODIFICAR: (_modificar, metricas.metrica_comando("modificar")),
+}
+
+# Opcodes que modifican el almacén y sus manejadores (ver fijar_solo_lectura).
+_ESCRITURA = {opcode: _MANEJADORES[opcode] for opcode in (OP_CREAR, OP_ELIMINAR, OP_MODIFICAR)}
+
+"""
+    Pone el protocolo binario en solo lectura (una réplica): las tramas
+    que modifican el almacén responden ERROR con el mensaje.
+    mensaje: Texto del error, o None para volver a aceptar escrituras.
+"""
+def fijar_solo_lectura(mensaje):
+    error = None if mensaje is None else _respuesta_error(mensaje)
+    for opcode, (manejador, metrica) in _ESCRITURA.items():
+        _MANEJADORES[opcode] = (manejador if error is None else lambda carga: error, metrica)
+
+# Manejadores registrados de todos los opcodes (ver fijar_no_disponible).
+_REGISTRADOS = dict(_MANEJADORES)
+
+"""
+    Hace que todas las tramas respondan ERROR con el mensaje (en modo
+    cluster el protocolo binario no enruta al nodo dueño).
+    mensaje: Texto del error, o None para volver a atenderlas.
+"""
+def fijar_no_disponible(mensaje):
+    error = None if mensaje is None else _respuesta_error(mensaje)
+    for opcode, (manejador, metrica) in _REGISTRADOS.items():
+        _MANEJADORES[opcode] = (manejador if error is None else lambda carga: error, metrica)
+
+"""
+    Procesa la carga de una petición binaria y retorna la trama de respuesta.
+    carga: Bytes de la petición (opcode + campos).
+"""
+def procesar_trama(carga):
+    if not carga:
+        return _ERROR_MAL_FORMADA
+    inicio = time.perf_counter_ns()
+    entrada = _MANEJADORES.get(carga[0])
+    if entrada is None:
+        return _ERROR_OPCODE
+    manejador, metrica = entrada
+    try:
+        respuesta = manejador(carga)
+    except (IndexError, ValueError, struct.error):
+        # UnicodeDecodeError es subclase de ValueError.
+        respuesta = _ERROR_MAL_FORMADA
+    except Exception as e:
+        registro.error("comando_fallido", traza=True, accion=metrica.nombre, comando=f"<binario {len(carga)} bytes>")
+        respuesta = _respuesta_error(f"Error inesperado en el servidor: {str(e)}")
+    # respuesta[4] es el byte de estado de la trama.
+    error = respuesta[4] == ESTADO_ERROR
+    duracion = metrica.observar(inicio, error)
+    if registro.auditoria:
+        registro.auditar(metrica.nombre, f"<binario {len(carga)} bytes>", duracion, error)
+    return respuesta
+
+"""
+    Procesa un lote de tramas y genera un único bloque con todas las
+    respuestas, en orden.
+    tramas: Lista de cargas de petición.
+"""
+def generar_respuestas_binarias(tramas):
+    if tramas:
+        yield b"".join([procesar_trama(t) for t in tramas])
+
+"""
+    Respuesta enviada antes de cerrar una conexión binaria inválida.
+"""
+def respuesta_error_binaria(error):
+    return _respuesta_error(str(error))
+
+# Codificadores de peticiones para clientes.
+
+def trama_crear(nombre, prioridad):
+    return _trama(_U8.pack(OP_CREAR) + _texto(nombre) + _texto(prioridad))
+
+def trama_listar(offset=0, limit=0):
+    return _trama(_U8.pack(OP_LISTAR) + _U32_U32.pack(offset, limit))
+
+def trama_eliminar(pid):
+    return _trama(_U8.pack(OP_ELIMINAR) + _U32.pack(int(pid)))
+
+def trama_modificar(pid, campo, valor):
+    return _trama(_U8.pack(OP_MODIFICAR) + _U32_U8.pack(int(pid), CAMPOS_PROCESO.index(campo)) + _texto(valor))
+
+"""
+    Decodifica la carga de una respuesta binaria.
+    carga: Bytes de la respuesta (sin el prefijo de longitud).
+    Retorna una tupla (estado, datos) donde datos es:
+    - OK: el PID (int) si lo hay, o None.
+    - ERROR: el mensaje.
+    - DATOS: lista de tuplas (pid, nombre, prioridad, estado).
+"""
+def decodificar_respuesta(carga):
+    estado = carga[0]
+    if estado == ESTADO_OK:
+        return estado, _U32.unpack_from(carga, 1)[0] if len(carga) == 5 else None
+    if estado == ESTADO_ERROR:
+        return estado, carga[1:].decode()
+    n = _U32.unpack_from(carga, 1)[0]
+    pos = 5
+    registros = []
+    for _ in range(n):
+        pid = _U32.unpack_from(carga, pos)[0]
+        nombre, pos = _leer_texto(carga, pos + 4)
+        prioridad, pos = _leer_texto(carga, pos)
+        estado_proceso, pos = _leer_texto(carga, pos)
+        registros.append((pid, nombre, prioridad, estado_proceso))
+    return estado, registros
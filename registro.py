@@ -0,0 +1,138 @@
+# registro.py
+# Description: Registro estructurado del servidor (una línea JSON por
+# evento). Los hilos que atienden clientes solo encolan el registro; un
+# hilo aparte lo formatea y lo escribe, así la E/S de logs nunca queda en
+# el camino de una petición. Si la cola se llena, los eventos se descartan
+# (y se cuentan) en lugar de bloquear.
+#
+# Niveles: eventos de conexión y arranque en INFO, auditoría de cada
+# comando en DEBUG (con muestreo), errores de procesar_comando en ERROR.
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+registrador = logging.getLogger("tcprocesses")
+
+# Eventos que caben en la cola antes de empezar a descartar.
+TAM_COLA = 10000
+
+# Caracteres de un comando que se incluyen en la auditoría.
+MAX_COMANDO = 200
+
+# True si hay que auditar comandos (nivel DEBUG y muestreo > 0). Se
+# comprueba en el camino de cada comando, así que es un simple booleano.
+auditoria = False
+
+# Fracción de comandos auditados (1.0 = todos).
+muestreo = 1.0
+
+# Eventos descartados por tener la cola llena.
+descartados = 0
+
+# Argumentos de la última llamada a configurar, para repetirla en
+# otros procesos (trabajadores del modo multiproceso).
+configuracion = None
+
+_escritor = None
+
+"""
+    Formatea cada registro como un objeto JSON en una línea:
+    {"ts", "nivel", "evento", ...campos}.
+"""
+class FormatoJSON(logging.Formatter):
+    def format(self, record):
+        linea = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "evento": record.msg,
+        }
+        linea.update(getattr(record, "campos", {}))
+        if record.exc_info:
+            linea["traza"] = self.formatException(record.exc_info)
+        return json.dumps(linea, ensure_ascii=False, default=str)
+
+"""
+    QueueHandler que no formatea en el hilo que registra y que descarta
+    el evento si la cola está llena.
+"""
+class _ManejadorCola(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        global descartados
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            descartados += 1
+
+"""
+    Configura el registro. Se puede llamar de nuevo para cambiarlo.
+    nivel: Nombre del nivel mínimo ("DEBUG", "INFO", "WARNING", "ERROR").
+    fraccion_auditada: Fracción de comandos auditados en nivel DEBUG.
+    archivo: Ruta donde añadir las líneas (None = salida estándar).
+"""
+def configurar(nivel="INFO", fraccion_auditada=1.0, archivo=None):
+    global _escritor, auditoria, muestreo, configuracion
+    detener()
+    configuracion = (nivel, fraccion_auditada, archivo)
+    destino = logging.FileHandler(archivo, encoding="utf-8") if archivo else logging.StreamHandler(sys.stdout)
+    destino.setFormatter(FormatoJSON())
+    cola = queue.Queue(TAM_COLA)
+    registrador.handlers = [_ManejadorCola(cola)]
+    registrador.setLevel(nivel.upper())
+    registrador.propagate = False
+    _escritor = logging.handlers.QueueListener(cola, destino)
+    _escritor.start()
+    atexit.register(detener)
+    muestreo = fraccion_auditada
+    auditoria = registrador.isEnabledFor(logging.DEBUG) and fraccion_auditada > 0
+
+"""
+    Vacía la cola, escribe lo pendiente y para el hilo escritor.
+"""
+def detener():
+    global _escritor, auditoria
+    auditoria = False
+    atexit.unregister(detener)
+    if _escritor is not None:
+        _escritor.stop()
+        for manejador in _escritor.handlers:
+            manejador.close()
+        _escritor = None
+
+def _registrar(nivel, evento, campos, exc_info=None):
+    if registrador.isEnabledFor(nivel):
+        registrador.log(nivel, evento, exc_info=exc_info, extra={"campos": campos})
+
+def info(evento, **campos):
+    _registrar(logging.INFO, evento, campos)
+
+def advertencia(evento, **campos):
+    _registrar(logging.WARNING, evento, campos)
+
+"""
+    Registra un error; con traza=True incluye la excepción en curso.
+"""
+def error(evento, traza=False, **campos):
+    _registrar(logging.ERROR, evento, campos, exc_info=traza)
+
+"""
+    Línea de auditoría de un comando (nivel DEBUG, con muestreo).
+    Solo se debe llamar si auditoria es True.
+"""
+def auditar(accion, comando, duracion_ns, error):
+    if muestreo < 1.0 and random.random() >= muestreo:
+        return
+    _registrar(logging.DEBUG, "comando", {
+        "accion": accion,
+        "comando": comando[:MAX_COMANDO],
+        "duracion_us": duracion_ns // 1000,
+        "error": error,
+    })
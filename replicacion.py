@@ -0,0 +1,379 @@
+# replicacion.py
+# Description: Réplicas de solo lectura alimentadas por un flujo de
+# replicación. El servidor primario numera cada mutación del almacén con un
+# LSN (número de secuencia del registro) y la envía por TCP, en orden, a
+# los servidores seguidores; cada seguidor la aplica en su propio almacén y
+# atiende LISTAR, TOP, SUSCRIBIR, ESTADISTICAS... localmente, así la carga
+# de lectura se reparte entre varias instancias. Los seguidores rechazan
+# los comandos de escritura (command_handler.COMANDOS_ESCRITURA).
+#
+# Protocolo:
+#   seguidor -> primario, al conectar:  REPLICAR|<epoca>|<lsn>
+#       época y LSN de lo último aplicado ("-" y 0 la primera vez).
+#   primario -> seguidor, una línea JSON por mensaje:
+#       ["i", <epoca>, <lsn>]                           empieza un snapshot
+#       ["p", [[pid, nombre, prioridad, estado], ...]]  del almacén tal como
+#       ["f"]                                           estaba en <lsn>
+#       ["h", <lsn>, <marca>]                           LSN del primario al
+#                                                       enviar (cabecera de
+#                                                       cada lote y latido)
+#       [<lsn>, <marca>, <mutacion>]                    mutación (ver
+#                                                       process_manager)
+#   <marca> es el time.time() del primario.
+#
+# El primario guarda las últimas HISTORIAL mutaciones: un seguidor que se
+# reconecta con la misma época retoma desde su LSN; si se ha quedado más
+# atrás, o el primario se ha reiniciado (época nueva), recibe un snapshot.
+
+import collections
+import itertools
+import json
+import os
+import socket
+import threading
+import time
+
+import command_handler
+import process_manager
+import protocolo_binario
+import registro
+from process_manager import Proceso
+from protocolo import enviar_segmentos
+
+# Mutaciones recientes que guarda el primario para que un seguidor retome.
+HISTORIAL = 100000
+
+# Segundos sin mutaciones tras los que el primario envía un latido.
+LATIDO = 1.0
+
+# Latidos sin recibir nada tras los que se da la conexión por caída.
+LATIDOS_PERDIDOS = 5
+
+# Segundos máximos entre reintentos de conexión del seguidor.
+REINTENTO_MAXIMO = 5.0
+
+# Procesos por mensaje "p" de un snapshot.
+FILAS_POR_MENSAJE = 1000
+
+MENSAJE_SOLO_LECTURA = "Réplica de solo lectura: envía las escrituras al primario {}."
+
+# Roles activos (None si este servidor no replica).
+_primario = None
+_seguidor = None
+
+def _mensaje(valor):
+    return json.dumps(valor, separators=(",", ":")).encode() + b"\n"
+
+"""
+    Convierte una mutación decodificada de JSON (listas) en las tuplas que
+    usan process_manager y sus observadores.
+"""
+def _tupla(mutacion):
+    if mutacion[0] == "l":
+        return ("l", [tuple(interna) for interna in mutacion[1]])
+    return tuple(mutacion)
+
+"""
+    Lado primario: observa el almacén y sirve el flujo de replicación a
+    cada seguidor desde su propio hilo.
+"""
+class Primario:
+    def __init__(self, host, port):
+        # Cambia en cada arranque: los LSN de otro arranque no son comparables.
+        self.epoca = os.urandom(8).hex()
+        self.cond = threading.Condition()
+        self.lsn = 0
+        # (lsn, mensaje ya codificado) de las últimas HISTORIAL mutaciones.
+        self.historial = collections.deque(maxlen=HISTORIAL)
+        # Dirección del seguidor -> último LSN enviado.
+        self.seguidores = {}
+        self.conexiones = set()
+        self.abierto = True
+        self.servidor = socket.create_server((host, port))
+        self.puerto = self.servidor.getsockname()[1]
+        threading.Thread(target=self._aceptar, name="replicacion", daemon=True).start()
+
+    """
+        Observador del almacén. Se llama con el lock de la partición, así
+        que todo lo que ve congelar() ya tiene su LSN.
+    """
+    def al_mutar(self, mutacion):
+        carga = json.dumps(mutacion, separators=(",", ":"))
+        marca = time.time()
+        with self.cond:
+            self.lsn += 1
+            self.historial.append((self.lsn, f"[{self.lsn},{marca!r},{carga}]\n".encode()))
+            self.cond.notify_all()
+
+    def _aceptar(self):
+        while True:
+            try:
+                conn, direccion = self.servidor.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._atender, args=(conn, f"{direccion[0]}:{direccion[1]}"), daemon=True).start()
+
+    def _atender(self, conn, direccion):
+        with self.cond:
+            self.conexiones.add(conn)
+        try:
+            # Un seguidor que no lee durante varios latidos se desconecta.
+            conn.settimeout(LATIDO * LATIDOS_PERDIDOS)
+            epoca, lsn = self._saludo(conn)
+            registro.info("seguidor_conectado", seguidor=direccion, lsn=lsn)
+            if not self._reanudable(epoca, lsn):
+                lsn = self._enviar_snapshot(conn)
+            self._transmitir(conn, direccion, lsn)
+        except (OSError, ValueError) as e:
+            if self.abierto:
+                registro.info("seguidor_desconectado", seguidor=direccion, error=str(e))
+        finally:
+            with self.cond:
+                self.conexiones.discard(conn)
+                self.seguidores.pop(direccion, None)
+            conn.close()
+
+    """
+        Lee la línea REPLICAR|<epoca>|<lsn> del seguidor.
+    """
+    def _saludo(self, conn):
+        datos = b""
+        while b"\n" not in datos:
+            parte = conn.recv(256)
+            if not parte or len(datos) > 256:
+                raise ValueError("Saludo de replicación inválido.")
+            datos += parte
+        partes = datos.partition(b"\n")[0].decode(errors="ignore").strip().split("|")
+        if len(partes) != 3 or partes[0].lower() != "replicar" or not partes[2].isdigit():
+            raise ValueError("Saludo de replicación inválido.")
+        return partes[1], int(partes[2])
+
+    def _reanudable(self, epoca, lsn):
+        with self.cond:
+            if epoca != self.epoca or lsn > self.lsn:
+                return False
+            return lsn == self.lsn or bool(self.historial) and self.historial[0][0] <= lsn + 1
+
+    """
+        Envía el almacén completo y retorna el LSN en el que se tomó.
+    """
+    def _enviar_snapshot(self, conn):
+        # Con todos los locks tomados ningún observador está a medias, así
+        # que self.lsn corresponde exactamente a los procesos copiados.
+        procesos, _, lsn = process_manager.congelar(lambda: self.lsn)
+        conn.sendall(_mensaje(["i", self.epoca, lsn]))
+        for inicio in range(0, len(procesos), FILAS_POR_MENSAJE):
+            filas = [[pid, p.nombre, p.prioridad, p.estado] for pid, p in procesos[inicio:inicio + FILAS_POR_MENSAJE]]
+            conn.sendall(_mensaje(["p", filas]))
+        conn.sendall(_mensaje(["f"]))
+        return lsn
+
+    """
+        Envía al seguidor las mutaciones posteriores a lsn según llegan, o
+        un latido si no hay ninguna en LATIDO segundos.
+    """
+    def _transmitir(self, conn, direccion, lsn):
+        while self.abierto:
+            with self.cond:
+                self.seguidores[direccion] = lsn
+                if self.lsn == lsn:
+                    self.cond.wait(LATIDO)
+                actual = self.lsn
+                primero = self.historial[0][0] if self.historial else actual + 1
+                if actual == lsn or primero > lsn + 1:
+                    mensajes = None
+                else:
+                    mensajes = [datos for _, datos in itertools.islice(self.historial, lsn + 1 - primero, None)]
+            if mensajes is None and actual != lsn:
+                # Se ha quedado fuera del historial: vuelve a empezar.
+                registro.advertencia("seguidor_retrasado", seguidor=direccion, lsn=lsn, primario=actual)
+                lsn = self._enviar_snapshot(conn)
+                continue
+            cabecera = _mensaje(["h", actual, time.time()])
+            enviar_segmentos(conn, [cabecera, *mensajes] if mensajes else [cabecera])
+            lsn = actual
+
+    def estado(self):
+        with self.cond:
+            lineas = [f"rol=primario epoca={self.epoca} lsn={self.lsn} puerto={self.puerto} seguidores={len(self.seguidores)}"]
+            for direccion, enviado in sorted(self.seguidores.items()):
+                lineas.append(f"seguidor={direccion} enviado={enviado} pendientes={self.lsn - enviado}")
+        return lineas
+
+    def cerrar(self):
+        with self.cond:
+            self.abierto = False
+            conexiones = list(self.conexiones)
+            self.cond.notify_all()
+        self.servidor.close()
+        for conn in conexiones:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+"""
+    Lado seguidor: mantiene una conexión con el primario (reconectando si
+    se cae) y aplica en el almacén local lo que recibe.
+"""
+class Seguidor:
+    def __init__(self, host, port):
+        self.primario = (host, port)
+        self.epoca = "-"
+        self.lsn = 0
+        # LSN del primario según el último mensaje "h" recibido.
+        self.lsn_primario = 0
+        # Marca (hora del primario) de la última mutación aplicada.
+        self.marca = None
+        # time.monotonic() del último mensaje recibido.
+        self.contacto = None
+        self.conectado = False
+        self.snapshots = 0
+        self.conexion = None
+        self.parar = threading.Event()
+        self.hilo = threading.Thread(target=self._ejecutar, name="seguidor", daemon=True)
+        self.hilo.start()
+
+    def _ejecutar(self):
+        espera = 0.1
+        while not self.parar.is_set():
+            try:
+                conn = socket.create_connection(self.primario, timeout=LATIDO * LATIDOS_PERDIDOS)
+            except OSError as e:
+                registro.advertencia("primario_no_disponible", primario=self._direccion(), error=str(e))
+            else:
+                self.conexion = conn
+                try:
+                    with conn:
+                        conn.sendall(f"REPLICAR|{self.epoca}|{self.lsn}\n".encode())
+                        self.conectado = True
+                        espera = 0.1
+                        registro.info("replicacion_iniciada", primario=self._direccion(), lsn=self.lsn)
+                        self._recibir(conn)
+                except (OSError, ValueError) as e:
+                    if not self.parar.is_set():
+                        registro.advertencia("replicacion_interrumpida", primario=self._direccion(), error=str(e))
+                finally:
+                    self.conectado = False
+                    self.conexion = None
+            self.parar.wait(espera)
+            espera = min(espera * 2, REINTENTO_MAXIMO)
+
+    def _recibir(self, conn):
+        procesos = None
+        with conn.makefile("rb") as entrada:
+            for linea in entrada:
+                self.contacto = time.monotonic()
+                mensaje = json.loads(linea)
+                tipo = mensaje[0]
+                if tipo.__class__ is int:
+                    lsn, marca, mutacion = mensaje
+                    process_manager.replicar_mutacion(_tupla(mutacion))
+                    self.lsn, self.marca = lsn, marca
+                elif tipo == "h":
+                    self.lsn_primario = mensaje[1]
+                elif tipo == "i":
+                    _, epoca, lsn_snapshot = mensaje
+                    procesos = []
+                elif tipo == "p":
+                    procesos += [(str(pid), Proceso(nombre, prioridad, estado)) for pid, nombre, prioridad, estado in mensaje[1]]
+                elif tipo == "f":
+                    siguiente = max((int(pid) for pid, _ in procesos), default=0) + 1
+                    process_manager.cargar_procesos(procesos, siguiente, notificar=True)
+                    self.epoca, self.lsn, self.lsn_primario = epoca, lsn_snapshot, lsn_snapshot
+                    self.snapshots += 1
+                    registro.info("snapshot_replicado", procesos=len(procesos), lsn=lsn_snapshot)
+                    procesos = None
+        if not self.parar.is_set():
+            raise ConnectionResetError("El primario cerró la conexión.")
+
+    def _direccion(self):
+        return f"{self.primario[0]}:{self.primario[1]}"
+
+    """
+        Retraso de la réplica: (mutaciones por aplicar, segundos). Los
+        segundos son la antigüedad de la última mutación aplicada mientras
+        quedan mutaciones por aplicar (0 si está al día).
+    """
+    def retraso(self):
+        pendientes = max(self.lsn_primario - self.lsn, 0)
+        if not pendientes or self.marca is None:
+            return pendientes, 0.0
+        return pendientes, max(time.time() - self.marca, 0.0)
+
+    def estado(self):
+        pendientes, segundos = self.retraso()
+        contacto = f"{time.monotonic() - self.contacto:.1f}" if self.contacto is not None else "-"
+        return [
+            f"rol=seguidor primario={self._direccion()} conectado={'si' if self.conectado else 'no'} epoca={self.epoca}",
+            f"lsn={self.lsn} lsn_primario={self.lsn_primario} retraso={pendientes} retraso_segundos={segundos:.3f}",
+            f"ultimo_contacto={contacto} snapshots={self.snapshots}",
+        ]
+
+    def cerrar(self):
+        self.parar.set()
+        conn = self.conexion
+        if conn is not None:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.hilo.join()
+
+"""
+    Convierte este servidor en primario: a partir de ahora cada mutación
+    se envía a los seguidores que se conecten a host:port.
+    port: Puerto de replicación (0 para uno libre; ver Primario.puerto).
+    host: Interfaz de escucha. El flujo no se autentica, así que por
+    defecto solo es accesible desde la propia máquina.
+"""
+def activar_primario(port, host="127.0.0.1"):
+    global _primario
+    if _primario is None:
+        _primario = Primario(host, port)
+        process_manager.registrar_observador(_primario.al_mutar)
+    return _primario
+
+"""
+    Convierte este servidor en réplica de solo lectura del primario que
+    sirve la replicación en host:port.
+"""
+def seguir(host, port):
+    global _seguidor
+    if _seguidor is None:
+        mensaje = MENSAJE_SOLO_LECTURA.format(f"{host}:{port}")
+        command_handler.fijar_solo_lectura(mensaje)
+        protocolo_binario.fijar_solo_lectura(mensaje)
+        _seguidor = Seguidor(host, port)
+    return _seguidor
+
+"""
+    Deja de replicar (en cualquiera de los dos roles). Útil en tests.
+"""
+def desactivar():
+    global _primario, _seguidor
+    if _primario is not None:
+        process_manager.quitar_observador(_primario.al_mutar)
+        _primario.cerrar()
+        _primario = None
+    if _seguidor is not None:
+        _seguidor.cerrar()
+        command_handler.fijar_solo_lectura(None)
+        protocolo_binario.fijar_solo_lectura(None)
+        _seguidor = None
+
+"""
+    Líneas de estado de REPLICACION.
+"""
+def estado():
+    lineas = []
+    if _primario is not None:
+        lineas += _primario.estado()
+    if _seguidor is not None:
+        lineas += _seguidor.estado()
+    return lineas or ["rol=ninguno"]
+
+@command_handler.registrar_comando("replicacion", 1, "REPLICACION",
+                                   ("REPLICACION - Muestra el rol de replicación, el LSN y el retraso de las réplicas.",))
+def _cmd_replicacion(partes, cmd):
+    return command_handler.formato_datos("\n".join(estado()))
@@ -0,0 +1,238 @@
+# servidor_multiproceso.py
+# Description: Modo multiproceso del servidor. N procesos trabajadores
+# aceptan conexiones en el mismo puerto (SO_REUSEPORT) y reenvían los
+# comandos, ya separados, al proceso dueño del almacén por un socket Unix.
+#
+# Los trabajadores hacen la parte cara por conexión (sockets, framing,
+# protocolo), repartida entre núcleos. El dueño ejecuta procesar_comando
+# sobre el único almacén, así la asignación de PIDs y LISTAR siguen siendo
+# globalmente consistentes. Cada trabajador agrupa en una sola petición
+# todos los comandos que llegan en una lectura de un cliente.
+#
+# Protocolo del socket Unix (enteros big-endian):
+#   petición:  u8 tipo (0 texto, 1 binario) | u32 n | n x (u32 longitud | bytes)
+#   respuesta: uno o más bloques u8 fin | u32 longitud | bytes; el último
+#              lleva fin=1. Así LISTAR|STREAM se sigue enviando por bloques.
+
+import functools
+import multiprocessing
+import os
+import socket
+import struct
+import tempfile
+import threading
+
+import eventos
+import persistencia
+import registro
+from protocolo import Sesion, generar_respuestas, enviar_segmentos
+from protocolo_binario import generar_respuestas_binarias
+
+TIPO_TEXTO = 0
+TIPO_BINARIO = 1
+
+_PETICION = struct.Struct("!BI")
+_LONGITUD = struct.Struct("!I")
+_BLOQUE = struct.Struct("!BI")
+
+"""
+    Lee exactamente n bytes de un socket. Lanza ConnectionResetError si se cierra antes.
+"""
+def _leer_exacto(sock, n):
+    datos = bytearray()
+    while len(datos) < n:
+        parte = sock.recv(n - len(datos))
+        if not parte:
+            raise ConnectionResetError("Conexión IPC cerrada.")
+        datos += parte
+    return bytes(datos)
+
+# --- Proceso dueño del almacén ---
+
+"""
+    Atiende a un trabajador: recibe lotes de comandos, los procesa sobre
+    el almacén local y envía las respuestas por bloques.
+"""
+def _atender_trabajador(conn):
+    salida = bytearray()
+    responder = {TIPO_TEXTO: functools.partial(generar_respuestas, salida=salida),
+                 TIPO_BINARIO: generar_respuestas_binarias}
+    with conn:
+        try:
+            while True:
+                tipo, n = _PETICION.unpack(_leer_exacto(conn, _PETICION.size))
+                comandos = []
+                for _ in range(n):
+                    longitud = _LONGITUD.unpack(_leer_exacto(conn, _LONGITUD.size))[0]
+                    comandos.append(_leer_exacto(conn, longitud))
+                if tipo == TIPO_TEXTO:
+                    comandos = [c.decode() for c in comandos]
+                for bloque in responder[tipo](comandos):
+                    if bloque.__class__ is eventos.Suscriptor:
+                        _reenviar_suscripcion(conn, bloque)
+                        return
+                    persistencia.esperar_durable()
+                    # Cabecera y respuesta en un solo sendmsg, sin concatenarlas.
+                    enviar_segmentos(conn, [_BLOQUE.pack(0, len(bloque)), bloque])
+                conn.sendall(_BLOQUE.pack(1, 0))
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        except ValueError as e:
+            # WAL fallido: se corta la conexión IPC sin el bloque final, así
+            # el trabajador cierra la del cliente sin confirmar nada.
+            registro.error("wal_fallido", error=str(e))
+
+"""
+    Envía al trabajador los eventos de una suscripción como bloques sin
+    fin. La conexión IPC queda dedicada a ella: cuando el cliente se va, el
+    trabajador la cierra y el siguiente envío (como tarde, un latido) falla.
+"""
+def _reenviar_suscripcion(conn, suscriptor):
+    try:
+        bloque = suscriptor.inicial
+        while True:
+            datos = bloque.encode()
+            enviar_segmentos(conn, [_BLOQUE.pack(0, len(datos)), datos])
+            bloque = suscriptor.esperar()
+    except OSError:
+        pass
+    finally:
+        eventos.cancelar(suscriptor)
+
+"""
+    Escucha en el socket Unix ruta y atiende a cada trabajador en un hilo.
+    Se ejecuta en el proceso que tiene el almacén.
+"""
+def servir_almacen(ruta, listo=None):
+    if os.path.exists(ruta):
+        os.remove(ruta)
+    servidor = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    servidor.bind(ruta)
+    servidor.listen(128)
+    if listo is not None:
+        listo.set()
+    while True:
+        conn, _ = servidor.accept()
+        threading.Thread(target=_atender_trabajador, args=(conn,), daemon=True).start()
+
+# --- Procesos trabajadores ---
+
+"""
+    Cliente del almacén remoto para un trabajador. Cada hilo usa su propia
+    conexión al dueño, así las peticiones de distintos clientes no se mezclan.
+"""
+class ClienteAlmacen:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.local = threading.local()
+
+    def _conexion(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conn.connect(self.ruta)
+            self.local.conn = conn
+        return conn
+
+    def _descartar(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+    """
+        Envía un lote de comandos al dueño y genera los bloques de respuesta.
+        Si el lote no se consume entero (por ejemplo, el cliente se desconecta
+        a mitad de un streaming), la conexión se descarta para no desincronizarla.
+    """
+    def _reenviar(self, tipo, comandos):
+        if not comandos:
+            return
+        conn = self._conexion()
+        partes = [_PETICION.pack(tipo, len(comandos))]
+        for comando in comandos:
+            datos = comando.encode() if tipo == TIPO_TEXTO else comando
+            partes.append(_LONGITUD.pack(len(datos)))
+            partes.append(datos)
+        completo = False
+        try:
+            enviar_segmentos(conn, partes)
+            while True:
+                fin, longitud = _BLOQUE.unpack(_leer_exacto(conn, _BLOQUE.size))
+                if longitud:
+                    yield _leer_exacto(conn, longitud)
+                if fin:
+                    completo = True
+                    return
+        finally:
+            if not completo:
+                self._descartar()
+
+    def responder_texto(self, lineas):
+        return self._reenviar(TIPO_TEXTO, lineas)
+
+    def responder_binario(self, tramas):
+        return self._reenviar(TIPO_BINARIO, tramas)
+
+    """
+        Crea una Sesion cuyas respuestas vienen del almacén remoto.
+    """
+    def crear_sesion(self):
+        return Sesion(self.responder_texto, self.responder_binario)
+
+"""
+    Crea el socket de escucha de un trabajador con SO_REUSEPORT, para que
+    el kernel reparta las conexiones entrantes entre todos los trabajadores.
+"""
+def crear_socket_reuseport(host, port, max_conexiones):
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise OSError("SO_REUSEPORT no está disponible en este sistema.")
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(max_conexiones)
+    return sock
+
+"""
+    Punto de entrada de un proceso trabajador.
+    servir: Función servir(server_socket, crear_sesion) que atiende las
+    conexiones (main.servir_hilos).
+    configuracion_registro: Argumentos de registro.configurar del dueño.
+"""
+def _bucle_trabajador(host, port, max_conexiones, ruta, servir, configuracion_registro):
+    if configuracion_registro is not None:
+        registro.configurar(*configuracion_registro)
+    sock = crear_socket_reuseport(host, port, max_conexiones)
+    servir(sock, ClienteAlmacen(ruta).crear_sesion)
+
+"""
+    Inicia el servidor multiproceso: arranca el servicio del almacén en
+    este proceso y lanza los trabajadores.
+    trabajadores: Número de procesos trabajadores (por defecto, uno por núcleo).
+    servir: Función que atiende las conexiones de cada trabajador.
+    ruta: Ruta del socket Unix (por defecto, una en el directorio temporal).
+"""
+def iniciar_servidor_multiproceso(host, port, max_conexiones, servir, trabajadores=None, ruta=None):
+    trabajadores = trabajadores or os.cpu_count() or 1
+    ruta = ruta or os.path.join(tempfile.gettempdir(), f"tcprocesses-{os.getpid()}.sock")
+    listo = threading.Event()
+    threading.Thread(target=servir_almacen, args=(ruta, listo), daemon=True).start()
+    listo.wait()
+
+    # spawn: los trabajadores arrancan limpios, sin copiar el almacén ni los
+    # hilos (WAL, compactador) del proceso dueño.
+    contexto = multiprocessing.get_context("spawn")
+    procesos = [
+        contexto.Process(target=_bucle_trabajador,
+                         args=(host, port, max_conexiones, ruta, servir, registro.configuracion), daemon=True)
+        for _ in range(trabajadores)
+    ]
+    for proceso in procesos:
+        proceso.start()
+    registro.info("servidor_iniciado", modo="multiproceso", host=host, port=port, trabajadores=trabajadores)
+    try:
+        for proceso in procesos:
+            proceso.join()
+    finally:
+        if os.path.exists(ruta):
+            os.remove(ruta)
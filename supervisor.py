@@ -0,0 +1,312 @@
+# supervisor.py
+# Description: Backend opcional que respalda el almacén con procesos reales
+# del sistema operativo. Con el supervisor activo:
+#   CREAR       lanza <nombre> (partido como en un shell) como proceso hijo
+#   ELIMINAR    le envía SIGTERM (y SIGKILL si no termina en GRACIA segundos)
+#   MODIFICAR   prioridad lo renicea; estado=detenido lo para (SIGSTOP) y
+#               estado=activo/ejecutando lo reanuda (SIGCONT)
+# y las filas de LISTAR, TOP y SIGUIENTE llevan el estado real del hijo:
+#   so_pid, so_estado (R, S, T, Z... de /proc), cpu (% de un núcleo),
+#   rss_kb y, cuando ha terminado, codigo (negativo = señal).
+#
+# Todo el trabajo con los hijos se hace en un único hilo con un bucle
+# asyncio: el observador del almacén solo encola la mutación en el bucle,
+# así nunca se lanza ni se señaliza un proceso con un lock del almacén
+# tomado. Cada hijo se vigila con un pidfd registrado en el bucle (sin un
+# hilo que espere por hijo) y se recoge en cuanto termina. La CPU y la
+# memoria se muestrean de /proc para todos los hijos a la vez cada
+# INTERVALO_MUESTREO segundos; LISTAR solo lee la última muestra.
+#
+# Solo se supervisan los procesos creados mientras está activo: los
+# recuperados desde disco no tienen hijo. Ejecuta comandos recibidos por
+# red: activarlo solo en redes de confianza.
+
+import asyncio
+import os
+import shlex
+import signal
+import threading
+import time
+
+import process_manager
+import registro
+
+# Segundos entre muestras de CPU y memoria de los hijos.
+INTERVALO_MUESTREO = 1.0
+
+# Segundos entre SIGTERM y SIGKILL al eliminar un proceso.
+GRACIA = 5.0
+
+# Estados del almacén que paran o reanudan al hijo.
+ESTADO_DETENIDO = "detenido"
+ESTADO_TERMINADO = "terminado"
+ESTADO_FALLIDO = "fallido"
+_SENALES_ESTADO = {
+    ESTADO_DETENIDO: signal.SIGSTOP,
+    process_manager.ESTADO_LISTO: signal.SIGCONT,
+    process_manager.ESTADO_EJECUTANDO: signal.SIGCONT,
+}
+
+_TICKS = os.sysconf("SC_CLK_TCK")
+_PAGINA_KB = os.sysconf("SC_PAGE_SIZE") // 1024
+
+# Supervisor activo (None si está desactivado).
+_supervisor = None
+
+"""
+    Convierte una prioridad del almacén en un valor nice: mayor prioridad,
+    menor nice. "alta" (10) corresponde a nice 0, que es el de partida.
+"""
+def nice_de_prioridad(prioridad):
+    clave = process_manager.clave_prioridad(prioridad)
+    if clave == float("-inf"):
+        return 19
+    return max(-20, min(19, round(10 - clave)))
+
+"""
+    Proceso hijo supervisado.
+"""
+class Hijo:
+    __slots__ = ("so_pid", "pidfd", "codigo", "ticks", "instante", "so_estado", "cpu", "rss_kb", "eliminado")
+
+    def __init__(self, so_pid, pidfd):
+        self.so_pid = so_pid
+        self.pidfd = pidfd
+        self.codigo = None
+        self.ticks = None
+        self.instante = None
+        self.so_estado = None
+        self.cpu = 0.0
+        self.rss_kb = 0
+        self.eliminado = False
+
+    """
+        Campos en vivo de la fila de LISTAR.
+    """
+    def campos(self):
+        if self.codigo is not None:
+            return {"so_pid": self.so_pid, "codigo": self.codigo}
+        return {"so_pid": self.so_pid, "so_estado": self.so_estado, "cpu": self.cpu, "rss_kb": self.rss_kb}
+
+"""
+    Lanza y vigila los procesos hijos desde un hilo con su propio bucle asyncio.
+"""
+class Supervisor:
+    def __init__(self, intervalo=INTERVALO_MUESTREO):
+        self.intervalo = intervalo
+        # pid del almacén -> Hijo. Solo lo modifica el hilo del bucle; los
+        # hilos que listan solo lo leen.
+        self.hijos = {}
+        self.bucle = asyncio.new_event_loop()
+        self.hilo = threading.Thread(target=self._ejecutar, name="supervisor", daemon=True)
+        self.hilo.start()
+
+    def _ejecutar(self):
+        asyncio.set_event_loop(self.bucle)
+        self.bucle.call_soon(self._muestrear)
+        self.bucle.run_forever()
+        self.bucle.close()
+
+    """
+        Observador del almacén. Se llama con el lock de la partición, así
+        que solo pasa la mutación al bucle.
+    """
+    def al_mutar(self, mutacion):
+        self.bucle.call_soon_threadsafe(self._aplicar, mutacion)
+
+    def campos(self, pid):
+        hijo = self.hijos.get(pid)
+        return hijo.campos() if hijo is not None else None
+
+    def _aplicar(self, mutacion):
+        tipo = mutacion[0]
+        try:
+            if tipo == "c":
+                self._lanzar(*mutacion[1:])
+            elif tipo == "e":
+                self._terminar(mutacion[1])
+            elif tipo == "m":
+                self._modificar(*mutacion[1:])
+            elif tipo == "l":
+                for interna in mutacion[1]:
+                    self._aplicar(interna)
+            elif tipo == "r":
+                for pid in list(self.hijos):
+                    self._terminar(pid)
+        except Exception:
+            registro.error("supervisor_fallido", traza=True, mutacion=repr(mutacion)[:registro.MAX_COMANDO])
+
+    def _lanzar(self, pid, nombre, prioridad):
+        try:
+            argv = shlex.split(nombre)
+            if not argv:
+                raise ValueError("comando vacío")
+            so_pid = os.posix_spawnp(argv[0], argv, os.environ, setsid=True, file_actions=[
+                (os.POSIX_SPAWN_OPEN, 0, os.devnull, os.O_RDONLY, 0),
+                (os.POSIX_SPAWN_OPEN, 1, os.devnull, os.O_WRONLY, 0),
+                (os.POSIX_SPAWN_OPEN, 2, os.devnull, os.O_WRONLY, 0),
+            ])
+        except (OSError, ValueError) as e:
+            registro.advertencia("proceso_no_lanzado", pid=pid, comando=nombre[:registro.MAX_COMANDO], error=str(e))
+            self._marcar(pid, ESTADO_FALLIDO)
+            return
+        try:
+            pidfd = os.pidfd_open(so_pid)
+        except (AttributeError, OSError):
+            # Sin pidfd (Linux < 5.3) el hijo se recoge en el muestreo.
+            pidfd = None
+        hijo = self.hijos[pid] = Hijo(so_pid, pidfd)
+        if pidfd is not None:
+            self.bucle.add_reader(pidfd, self._recoger, pid, hijo)
+        self._renice(pid, hijo, prioridad)
+        registro.info("proceso_lanzado", pid=pid, so_pid=so_pid)
+
+    """
+        Recoge un hijo terminado (su pidfd está listo para lectura o el
+        muestreo lo vio como zombi). Retorna False si aún no ha terminado.
+    """
+    def _recoger(self, pid, hijo):
+        try:
+            so_pid, estado = os.waitpid(hijo.so_pid, os.WNOHANG)
+        except ChildProcessError:
+            so_pid, estado = hijo.so_pid, 0
+        if so_pid == 0:
+            return False
+        if hijo.pidfd is not None:
+            self.bucle.remove_reader(hijo.pidfd)
+            os.close(hijo.pidfd)
+            hijo.pidfd = None
+        hijo.codigo = os.waitstatus_to_exitcode(estado)
+        registro.info("proceso_terminado", pid=pid, so_pid=hijo.so_pid, codigo=hijo.codigo)
+        if hijo.eliminado:
+            self.hijos.pop(pid, None)
+        else:
+            self._marcar(pid, ESTADO_TERMINADO)
+        return True
+
+    def _terminar(self, pid):
+        hijo = self.hijos.get(pid)
+        if hijo is None:
+            return
+        hijo.eliminado = True
+        if hijo.codigo is not None:
+            self.hijos.pop(pid, None)
+            return
+        self._senal(hijo, signal.SIGCONT)
+        self._senal(hijo, signal.SIGTERM)
+        self.bucle.call_later(GRACIA, self._matar, pid, hijo)
+
+    def _matar(self, pid, hijo):
+        if hijo.codigo is None:
+            self._senal(hijo, signal.SIGKILL)
+
+    def _modificar(self, pid, campo, valor):
+        hijo = self.hijos.get(pid)
+        if hijo is None or hijo.codigo is not None:
+            return
+        if campo == "prioridad":
+            self._renice(pid, hijo, valor)
+        elif campo == "estado" and valor in _SENALES_ESTADO:
+            self._senal(hijo, _SENALES_ESTADO[valor])
+
+    """
+        Aplica al hijo el nice de su prioridad. Bajar el nice (subir la
+        prioridad) necesita privilegios: CAP_SYS_NICE o un RLIMIT_NICE que
+        lo permita. Sin ellos se intenta max(nice, 0), y si tampoco se puede
+        (el hijo ya tiene un nice mayor) se deja como está y se avisa.
+    """
+    def _renice(self, pid, hijo, prioridad):
+        nice = nice_de_prioridad(prioridad)
+        try:
+            os.setpriority(os.PRIO_PROCESS, hijo.so_pid, nice)
+        except PermissionError:
+            try:
+                os.setpriority(os.PRIO_PROCESS, hijo.so_pid, max(nice, 0))
+            except PermissionError:
+                registro.advertencia("renice_sin_permiso", pid=pid, so_pid=hijo.so_pid, nice=nice)
+            except ProcessLookupError:
+                pass
+        except ProcessLookupError:
+            pass
+
+    def _senal(self, hijo, senal):
+        # Con pidfd no se puede señalizar por error un PID ya reutilizado.
+        try:
+            if hijo.pidfd is not None:
+                signal.pidfd_send_signal(hijo.pidfd, senal)
+            else:
+                os.kill(hijo.so_pid, senal)
+        except ProcessLookupError:
+            pass
+
+    """
+        Cambia el estado en el almacén desde el bucle (sin locks tomados).
+        Los estados que no están en _SENALES_ESTADO no vuelven a este
+        supervisor como señales.
+    """
+    def _marcar(self, pid, estado):
+        process_manager.modificar_proceso(pid, "estado", estado)
+
+    """
+        Lee /proc/<pid>/stat de todos los hijos vivos de una vez y
+        actualiza su estado, CPU y memoria. Se reprograma cada intervalo.
+    """
+    def _muestrear(self):
+        ahora = time.monotonic()
+        for pid, hijo in list(self.hijos.items()):
+            if hijo.codigo is not None:
+                continue
+            try:
+                with open(f"/proc/{hijo.so_pid}/stat", "rb") as f:
+                    datos = f.read()
+            except OSError:
+                continue
+            # El nombre del comando (campo 2) va entre paréntesis y puede
+            # tener espacios: los campos se cuentan tras el último ')'.
+            campos = datos[datos.rindex(b")") + 2:].split()
+            hijo.so_estado = campos[0].decode()
+            ticks = int(campos[11]) + int(campos[12])
+            if hijo.ticks is not None and ahora > hijo.instante:
+                hijo.cpu = round((ticks - hijo.ticks) / _TICKS / (ahora - hijo.instante) * 100, 1)
+            hijo.ticks, hijo.instante = ticks, ahora
+            hijo.rss_kb = int(campos[21]) * _PAGINA_KB
+            if hijo.so_estado == "Z" and hijo.pidfd is None:
+                self._recoger(pid, hijo)
+        self.bucle.call_later(self.intervalo, self._muestrear)
+
+    """
+        Termina todos los hijos (SIGTERM) y para el bucle.
+    """
+    def detener(self):
+        def parar():
+            for pid in list(self.hijos):
+                self._terminar(pid)
+            self.bucle.stop()
+        self.bucle.call_soon_threadsafe(parar)
+        self.hilo.join()
+
+"""
+    Activa el supervisor: los procesos que se creen a partir de ahora
+    lanzan un proceso hijo real.
+    intervalo: Segundos entre muestras de CPU y memoria.
+"""
+def activar(intervalo=INTERVALO_MUESTREO):
+    global _supervisor
+    if _supervisor is not None:
+        return _supervisor
+    _supervisor = Supervisor(intervalo)
+    process_manager.registrar_observador(_supervisor.al_mutar)
+    process_manager.registrar_campos_en_vivo(_supervisor.campos)
+    return _supervisor
+
+"""
+    Desactiva el supervisor y termina los hijos que sigan vivos.
+"""
+def desactivar():
+    global _supervisor
+    if _supervisor is None:
+        return
+    process_manager.quitar_observador(_supervisor.al_mutar)
+    process_manager.registrar_campos_en_vivo(None)
+    _supervisor.detener()
+    _supervisor = None
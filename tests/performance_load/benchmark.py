@@ -0,0 +1,271 @@
+# benchmark.py
+# Description: Benchmark de carga autocontenido (sin Locust). Arranca el
+# servidor en el mismo proceso, lanza N clientes concurrentes con una mezcla
+# de comandos configurable y reporta throughput y latencias p50/p99/p999
+# medidas con perf_counter_ns. Los resultados se guardan en JSON para
+# compararlos entre commits.
+
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, RAIZ)
+
+from main import COLA_POR_DEFECTO, HILOS_POR_DEFECTO, MODOS, MODO_HILOS, RESPUESTA_OCUPADO, iniciar_servidor
+
+# Mezcla por defecto, parecida a la de locustfile.py.
+MEZCLA_POR_DEFECTO = "crear=4,listar=2,modificar=3,eliminar=3"
+
+# Filas máximas pedidas por la operación "listar". "listar_todo" pide todas.
+FILAS_LISTAR = 100
+
+PERCENTILES = (("p50", 0.50), ("p99", 0.99), ("p999", 0.999))
+
+"""
+    Convierte "op=peso,op=peso" en una lista de operaciones y otra de pesos.
+"""
+def parsear_mezcla(texto):
+    operaciones, pesos = [], []
+    for parte in texto.split(","):
+        op, _, peso = parte.partition("=")
+        op = op.strip().lower()
+        if op not in OPERACIONES:
+            raise ValueError(f"Operación desconocida en la mezcla: {op}")
+        operaciones.append(op)
+        pesos.append(float(peso or 1))
+    return operaciones, pesos
+
+"""
+    El servidor saturado respondió ERROR|Ocupado en lugar de la bienvenida.
+"""
+class ConexionRechazada(Exception):
+    pass
+
+"""
+    Cliente TCP bloqueante que lee las respuestas completas del protocolo
+    de texto, incluidos los listados multilínea (LISTAR|STREAM termina en
+    la línea FIN|<total>).
+"""
+class ClienteBenchmark:
+    def __init__(self, host, port):
+        self.socket = socket.create_connection((host, port))
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.archivo = self.socket.makefile("rb")
+        if self.archivo.readline() == RESPUESTA_OCUPADO:
+            self.cerrar()
+            raise ConexionRechazada()
+        self.pids = []
+
+    """
+        Envía un comando y retorna la primera línea de la respuesta.
+        stream: True si la respuesta es un LISTAR|STREAM.
+    """
+    def enviar(self, comando, stream=False):
+        self.socket.sendall(comando.encode() + b"\n")
+        primera = self.archivo.readline()
+        if stream:
+            while not self.archivo.readline().startswith(b"FIN|"):
+                pass
+        return primera.decode()
+
+    def cerrar(self):
+        self.archivo.close()
+        self.socket.close()
+
+def _op_crear(cliente, n):
+    respuesta = cliente.enviar(f"CREAR|bench_{n}|alta")
+    if respuesta.startswith("OK|Proceso"):
+        cliente.pids.append(respuesta.split()[1])
+
+def _op_listar(cliente, n):
+    cliente.enviar(f"LISTAR|STREAM|0|{FILAS_LISTAR}", stream=True)
+
+def _op_listar_todo(cliente, n):
+    cliente.enviar("LISTAR|STREAM", stream=True)
+
+def _op_modificar(cliente, n):
+    if not cliente.pids:
+        return _op_crear(cliente, n)
+    cliente.enviar(f"MODIFICAR|{random.choice(cliente.pids)}|prioridad|baja")
+
+def _op_eliminar(cliente, n):
+    if not cliente.pids:
+        return _op_crear(cliente, n)
+    cliente.enviar(f"ELIMINAR|{cliente.pids.pop()}")
+
+OPERACIONES = {
+    "crear": _op_crear,
+    "listar": _op_listar,
+    "listar_todo": _op_listar_todo,
+    "modificar": _op_modificar,
+    "eliminar": _op_eliminar,
+}
+
+"""
+    Arranca el servidor en un hilo daemon sobre un puerto libre y espera
+    a que acepte conexiones. Retorna el puerto.
+    hilos, cola: Límites del pool del servidor (ver main.iniciar_servidor).
+"""
+def arrancar_servidor(modo, hilos=HILOS_POR_DEFECTO, cola=COLA_POR_DEFECTO):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    hilo = threading.Thread(target=iniciar_servidor, args=("127.0.0.1", port, 1024, modo),
+                            kwargs={"hilos": hilos, "cola": cola}, daemon=True)
+    hilo.start()
+    limite = time.monotonic() + 5
+    while time.monotonic() < limite:
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return port
+        except ConnectionRefusedError:
+            time.sleep(0.05)
+    raise RuntimeError("El servidor no arrancó a tiempo.")
+
+"""
+    Bucle de un cliente: ejecuta operaciones de la mezcla hasta fin_ns y
+    guarda las latencias en ns por operación en latencias. Si el servidor
+    rechaza la conexión por saturación, lo anota en latencias["rechazada"].
+"""
+def ejecutar_cliente(host, port, operaciones, pesos, fin_ns, latencias, semilla):
+    aleatorio = random.Random(semilla)
+    try:
+        cliente = ClienteBenchmark(host, port)
+    except ConexionRechazada:
+        latencias["rechazada"] = True
+        return
+    n = 0
+    try:
+        while time.perf_counter_ns() < fin_ns:
+            op = aleatorio.choices(operaciones, pesos)[0]
+            inicio = time.perf_counter_ns()
+            OPERACIONES[op](cliente, f"{semilla}_{n}")
+            latencias[op].append(time.perf_counter_ns() - inicio)
+            n += 1
+    finally:
+        cliente.cerrar()
+
+"""
+    Calcula count y percentiles (en microsegundos) de una lista de latencias en ns.
+"""
+def resumir(valores):
+    if not valores:
+        return {"count": 0}
+    ordenados = sorted(valores)
+    resumen = {"count": len(ordenados)}
+    for nombre, q in PERCENTILES:
+        resumen[nombre + "_us"] = ordenados[min(len(ordenados) - 1, int(q * len(ordenados)))] / 1000
+    return resumen
+
+def _commit_actual():
+    try:
+        return subprocess.run(["git", "-C", RAIZ, "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+"""
+    Ejecuta el benchmark completo y retorna el dict de resultados.
+"""
+def ejecutar(modo, clientes, duracion, mezcla, host="127.0.0.1", port=None,
+             hilos=HILOS_POR_DEFECTO, cola=COLA_POR_DEFECTO):
+    operaciones, pesos = parsear_mezcla(mezcla)
+    if port is None:
+        port = arrancar_servidor(modo, hilos, cola)
+    por_cliente = [{op: [] for op in operaciones} for _ in range(clientes)]
+
+    inicio = time.perf_counter_ns()
+    fin_ns = inicio + int(duracion * 1e9)
+    hilos = [
+        threading.Thread(target=ejecutar_cliente, args=(host, port, operaciones, pesos, fin_ns, por_cliente[i], i))
+        for i in range(clientes)
+    ]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    transcurrido = (time.perf_counter_ns() - inicio) / 1e9
+
+    por_op = {op: [v for lat in por_cliente for v in lat[op]] for op in operaciones}
+    todas = [v for valores in por_op.values() for v in valores]
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit_actual(),
+        "python": platform.python_version(),
+        "config": {"modo": modo, "clientes": clientes, "duracion_s": duracion, "mezcla": mezcla},
+        "throughput_ops_s": len(todas) / transcurrido,
+        "rechazados": sum(1 for lat in por_cliente if lat.get("rechazada")),
+        "total": resumir(todas),
+        "operaciones": {op: resumir(valores) for op, valores in por_op.items()},
+    }
+
+"""
+    Compara con un resultado anterior. Retorna la lista de regresiones
+    (throughput o p99 peor que el umbral relativo).
+"""
+def comparar(actual, anterior, umbral):
+    regresiones = []
+    if actual["throughput_ops_s"] < anterior["throughput_ops_s"] * (1 - umbral):
+        regresiones.append(f"throughput {anterior['throughput_ops_s']:.0f} -> {actual['throughput_ops_s']:.0f} ops/s")
+    p99_antes = anterior["total"].get("p99_us")
+    p99_ahora = actual["total"].get("p99_us")
+    if p99_antes and p99_ahora and p99_ahora > p99_antes * (1 + umbral):
+        regresiones.append(f"p99 {p99_antes:.0f} -> {p99_ahora:.0f} us")
+    return regresiones
+
+def imprimir(resultados):
+    config = resultados["config"]
+    print(f"\n=== BENCHMARK ({config['modo']}, {config['clientes']} clientes, {config['duracion_s']}s) ===")
+    print(f"Throughput: {resultados['throughput_ops_s']:.0f} ops/s")
+    if resultados.get("rechazados"):
+        print(f"Clientes rechazados (ERROR|Ocupado): {resultados['rechazados']}")
+    print(f"{'operación':<14}{'count':>9}{'p50 us':>10}{'p99 us':>10}{'p999 us':>10}")
+    filas = list(resultados["operaciones"].items()) + [("TOTAL", resultados["total"])]
+    for op, r in filas:
+        if r["count"]:
+            print(f"{op:<14}{r['count']:>9}{r['p50_us']:>10.0f}{r['p99_us']:>10.0f}{r['p999_us']:>10.0f}")
+
+def parsear_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de carga del servidor de procesos.")
+    parser.add_argument("--modo", choices=MODOS, default=MODO_HILOS)
+    parser.add_argument("--clientes", type=int, default=20)
+    parser.add_argument("--duracion", type=float, default=10.0, help="Segundos de medición.")
+    parser.add_argument("--mezcla", default=MEZCLA_POR_DEFECTO,
+                        help=f"Pesos por operación ({', '.join(OPERACIONES)}).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None,
+                        help="Usar un servidor ya arrancado en lugar de uno en el proceso.")
+    parser.add_argument("--hilos", type=int, default=HILOS_POR_DEFECTO,
+                        help="Pool de hilos del servidor en el proceso.")
+    parser.add_argument("--cola", type=int, default=COLA_POR_DEFECTO,
+                        help="Cola de conexiones pendientes del servidor en el proceso.")
+    parser.add_argument("--salida", default="benchmark_results.json")
+    parser.add_argument("--comparar", default=None, help="JSON de una ejecución anterior.")
+    parser.add_argument("--umbral", type=float, default=0.10, help="Regresión relativa tolerada.")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parsear_argumentos()
+    resultados = ejecutar(args.modo, args.clientes, args.duracion, args.mezcla, args.host, args.port,
+                          args.hilos, args.cola)
+    imprimir(resultados)
+    with open(args.salida, "w") as f:
+        json.dump(resultados, f, indent=2)
+    print(f"\nResultados guardados en {args.salida}")
+
+    if args.comparar:
+        with open(args.comparar) as f:
+            regresiones = comparar(resultados, json.load(f), args.umbral)
+        if regresiones:
+            print("REGRESIÓN: " + "; ".join(regresiones))
+            sys.exit(1)
+        print("Sin regresiones respecto a " + args.comparar)
@@ -0,0 +1,98 @@
+# dispatch_benchmark.py
+# Description: Microbenchmark del despacho de comandos de procesar_comando
+# (cadena if/elif anterior frente al registro COMANDOS).
+# Las funciones de process_manager se sustituyen por funciones vacías para
+# medir solo el coste del despacho y del formateo de la respuesta.
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import command_handler
+from command_handler import formato_ok, formato_error, formato_datos
+
+COMANDOS = [
+    "CREAR|proceso|alta",
+    "ELIMINAR|1",
+    "MODIFICAR|1|prioridad|baja",
+    "AYUDA",
+    "SALIR",
+    "CREAR|incompleto",
+    "DESCONOCIDO",
+]
+
+def _ok(*args):
+    return True, "Proceso 1 actualizado."
+
+"""
+    Despacho anterior: cadena if/elif con el texto de AYUDA y los errores
+    construidos en cada llamada.
+"""
+def procesar_comando_if_elif(cmd):
+    partes = cmd.strip().split('|')
+    if not partes:
+        return formato_error("Comando vacío.")
+    accion = partes[0].lower()
+    try:
+        if accion == "crear":
+            if len(partes) != 3:
+                return formato_error("Argumentos inválidos para CREAR. Se necesita: CREAR|nombre|prioridad")
+            _, nombre, prioridad = partes
+            ok, msg = _ok(nombre, prioridad)
+            return formato_ok(msg) if ok else formato_error(msg)
+        elif accion == "listar":
+            return formato_datos("Sin procesos.")
+        elif accion == "eliminar":
+            if len(partes) != 2:
+                return formato_error("Argumentos inválidos para ELIMINAR. Se necesita: ELIMINAR|id")
+            _, id_ = partes
+            ok, msg = _ok(id_)
+            return formato_ok(msg) if ok else formato_error(msg)
+        elif accion == "modificar":
+            if len(partes) != 4:
+                return formato_error("Argumentos inválidos para MODIFICAR. Se necesita: MODIFICAR|id|campo|valor")
+            _, id_, campo, valor = partes
+            ok, msg = _ok(id_, campo, valor)
+            return formato_ok(msg) if ok else formato_error(msg)
+        elif accion == "ayuda":
+            ayuda = (
+                "Comandos disponibles:\n"
+                "CREAR|<nombre>|<prioridad> - Crea un nuevo proceso.\n"
+                "LISTAR - Lista todos los procesos.\n"
+                "ELIMINAR|<id> - Elimina un proceso por su ID.\n"
+                "MODIFICAR|<id>|<campo>|<valor> - Modifica un campo de un proceso.\n"
+                "SALIR - Desconecta del servidor."
+            )
+            return formato_datos(ayuda)
+        elif accion == "salir":
+            return "SALIR|Desconectando."
+        else:
+            return formato_error("Comando no reconocido.")
+    except Exception as e:
+        return formato_error(f"Error inesperado en el servidor: {str(e)}")
+
+"""
+    Mide los nanosegundos de una llamada procesar(comando)
+    (mejor de 15 rondas para reducir el ruido).
+"""
+def medir(procesar, comando, repeticiones):
+    total = min(timeit.repeat(lambda: procesar(comando), number=repeticiones, repeat=15))
+    return total / repeticiones * 1e9
+
+if __name__ == "__main__":
+    command_handler.crear_proceso = _ok
+    command_handler.eliminar_proceso = _ok
+    command_handler.modificar_proceso = _ok
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    total_antes = total_despues = 0
+    print(f"{'comando':<30}{'if/elif':>10}{'registro':>10}  (ns)")
+    for comando in COMANDOS:
+        antes = medir(procesar_comando_if_elif, comando, repeticiones)
+        despues = medir(command_handler.procesar_comando, comando, repeticiones)
+        total_antes += antes
+        total_despues += despues
+        print(f"{comando:<30}{antes:>10.0f}{despues:>10.0f}")
+    print(f"Mejora media: {(1 - total_despues / total_antes) * 100:.1f}%")
@@ -0,0 +1,58 @@
+# memory_benchmark.py
+# Description: Mide los bytes por proceso del almacén en memoria
+# (registro dict anterior frente al registro compacto Proceso).
+
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import process_manager
+from process_manager import crear_proceso, reiniciar_procesos
+
+PRIORIDADES = ["alta", "media", "baja"]
+
+"""
+    Mide la memoria asignada por una función que crea n procesos.
+    Retorna los bytes por proceso.
+"""
+def medir(crear, n):
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    datos = crear(n)
+    despues = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del datos
+    return (despues - antes) / n
+
+"""
+    Representación anterior: un dict por proceso con claves str.
+"""
+def crear_dicts(n):
+    procesos = {}
+    for i in range(1, n + 1):
+        procesos[str(i)] = {
+            "nombre": f"proceso_{i}",
+            "prioridad": PRIORIDADES[i % 3],
+            "estado": "activo"
+        }
+    return procesos
+
+"""
+    Representación actual: registros Proceso en el almacén particionado.
+"""
+def crear_registros(n):
+    reiniciar_procesos()
+    for i in range(1, n + 1):
+        crear_proceso(f"proceso_{i}", PRIORIDADES[i % 3])
+    return process_manager.shards
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    antes = medir(crear_dicts, n)
+    despues = medir(crear_registros, n)
+    print(f"Procesos: {n}")
+    print(f"dict por proceso:    {antes:.1f} bytes/proceso")
+    print(f"Proceso (__slots__): {despues:.1f} bytes/proceso")
+    print(f"Ahorro: {(1 - despues / antes) * 100:.1f}%")
@@ -0,0 +1,166 @@
+# respuestas_benchmark.py
+# Description: Compara la ruta de entrada/salida de una conexión con hilos
+# anterior (recv + split por línea + f-string, join y encode + sendall)
+# con la actual (recv_into en un buffer reutilizado + decodificación única
+# desde una vista + respuestas codificadas en el buffer de salida de la
+# conexión y enviadas como memoryview).
+# Mide la memoria transitoria por lectura con tracemalloc (pico sobre lo
+# ya asignado) y el rendimiento en peticiones por segundo sobre un socketpair
+# (el envío del cliente se cuenta en ambas rutas por igual).
+# Con --solo-ruta, procesar_comando se sustituye en ambas rutas por una
+# función que retorna una respuesta fija, para medir solo la entrada/salida.
+
+import os
+import socket
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import protocolo
+from command_handler import procesar_comando
+from process_manager import crear_proceso, reiniciar_procesos
+from protocolo import FramerLineas, generar_respuestas
+
+TAM_LECTURA = 65536
+
+# Rondas de rendimiento por ruta (se toma la mejor).
+RONDAS = 5
+
+COMANDOS = ["PING", "MODIFICAR|1|prioridad|5", "CREAR|x", "PING", "MODIFICAR|1|estado|activo"]
+
+"""
+    Framer anterior: separa el buffer en un bytearray por línea y
+    decodifica cada una.
+"""
+class FramerAnterior(FramerLineas):
+    def alimentar(self, data):
+        self.buffer += data
+        if b"\n" not in data:
+            return []
+        *lineas, resto = self.buffer.split(b"\n")
+        self.buffer = bytearray(resto)
+        return self._agrupar(l.decode(errors='ignore') for l in lineas if l.strip())
+
+"""
+    Respuestas anteriores: cada respuesta + "\n", un join y un encode por bloque.
+"""
+def generar_anterior(lineas):
+    pendientes = []
+    for linea in lineas:
+        respuesta = procesar_comando(linea)
+        if isinstance(respuesta, str):
+            pendientes.append(respuesta + "\n")
+            continue
+        if pendientes:
+            yield "".join(pendientes).encode()
+            pendientes = []
+        for bloque in respuesta:
+            yield bloque.encode()
+    if pendientes:
+        yield "".join(pendientes).encode()
+
+"""
+    Bucle de conexión anterior: un bytes nuevo por recv y sendall por bloque.
+"""
+def atender_anterior(conn, lecturas, enviar):
+    framer = FramerAnterior()
+    for _ in range(lecturas):
+        enviar()
+        data = conn.recv(TAM_LECTURA)
+        for bloque in generar_anterior(framer.alimentar(data)):
+            conn.sendall(bloque)
+
+"""
+    Bucle de conexión actual (como main._atender_conexion).
+"""
+def atender_actual(conn, lecturas, enviar):
+    framer = FramerLineas()
+    entrada = bytearray(TAM_LECTURA)
+    vista = memoryview(entrada)
+    salida = bytearray()
+    for _ in range(lecturas):
+        enviar()
+        n = conn.recv_into(entrada)
+        for bloque in generar_respuestas(framer.alimentar(vista[:n]), salida):
+            conn.sendall(bloque)
+
+"""
+    Ejecuta atender sobre un extremo de un socketpair; antes de cada
+    lectura el otro extremo descarta las respuestas y envía el lote
+    completo, así cada recv procesa exactamente un lote.
+    Retorna (segundos, bytes transitorios por lectura) si medir_memoria,
+    o (segundos, None).
+"""
+def ejecutar(atender, lote, lecturas, medir_memoria):
+    cliente, servidor = socket.socketpair()
+    cliente.setblocking(False)
+    respuestas = bytearray(1 << 20)
+    picos = []
+
+    def enviar():
+        # Sin hilo lector: las respuestas del lote anterior se descartan
+        # aquí, así la medida no depende del reparto de la CPU entre hilos.
+        try:
+            while cliente.recv_into(respuestas):
+                pass
+        except BlockingIOError:
+            pass
+        # El pico de cada lectura se toma al empezar la siguiente, con la
+        # misma conexión (framer y buffers ya creados).
+        if medir_memoria:
+            actual, pico = tracemalloc.get_traced_memory()
+            picos.append(pico - enviar.base)
+            enviar.base = actual
+            tracemalloc.reset_peak()
+        cliente.sendall(lote)
+
+    if medir_memoria:
+        tracemalloc.start()
+        enviar.base = 0
+    inicio = time.perf_counter()
+    atender(servidor, lecturas, enviar)
+    segundos = time.perf_counter() - inicio
+    if medir_memoria:
+        tracemalloc.stop()
+    cliente.close()
+    servidor.close()
+    # Se descartan las primeras lecturas (creación de los buffers).
+    picos = sorted(picos[10:])
+    return segundos, (picos[len(picos) // 2] if picos else None)
+
+def _respuesta_fija(linea):
+    return "OK|Proceso 1 actualizado."
+
+if __name__ == "__main__":
+    argumentos = [a for a in sys.argv[1:] if a != "--solo-ruta"]
+    if "--solo-ruta" in sys.argv:
+        procesar_comando = protocolo.procesar_comando = _respuesta_fija
+    por_lectura = int(argumentos[0]) if len(argumentos) > 0 else 200
+    lecturas = int(argumentos[1]) if len(argumentos) > 1 else 2000
+    lineas = [COMANDOS[i % len(COMANDOS)] for i in range(por_lectura)]
+    lote = ("\n".join(lineas) + "\n").encode()
+    # Cada lote debe caber en una lectura.
+    assert len(lote) <= TAM_LECTURA
+
+    print(f"{por_lectura} comandos por lectura, {lecturas} lecturas")
+    print(f"{'ruta':<12}{'peticiones/s':>14}{'bytes transitorios/petición':>30}")
+    rutas = (("anterior", atender_anterior), ("actual", atender_actual))
+    picos = {}
+    for nombre, atender in rutas:
+        reiniciar_procesos()
+        crear_proceso("p", "1")
+        picos[nombre] = ejecutar(atender, lote, min(lecturas, 500), True)[1] / por_lectura
+    # Rondas alternadas para repartir el ruido de la máquina entre ambas rutas.
+    segundos = {nombre: float("inf") for nombre, _ in rutas}
+    for _ in range(RONDAS):
+        for nombre, atender in rutas:
+            reiniciar_procesos()
+            crear_proceso("p", "1")
+            segundos[nombre] = min(segundos[nombre], ejecutar(atender, lote, lecturas, False)[0])
+    for nombre, _ in rutas:
+        print(f"{nombre:<12}{por_lectura * lecturas / segundos[nombre]:>14.0f}{picos[nombre]:>30.1f}")
+    mejora = segundos["anterior"] / segundos["actual"] - 1
+    memoria = picos["actual"] / picos["anterior"] - 1
+    print(f"Rendimiento: {mejora * 100:+.1f}%  Memoria transitoria: {memoria * 100:+.1f}%")
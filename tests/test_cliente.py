@@ -0,0 +1,92 @@
+# tests/test_cliente.py
+import asyncio
+import socket
+import threading
+import time
+import unittest
+from cliente import Cliente, ClienteAsync, ErrorServidor, PoolClientes, PoolClientesAsync
+from cliente.respuestas import LectorRespuestas, codificar
+from main import servir_hilos
+from process_manager import reiniciar_procesos
+
+class TestLectorRespuestas(unittest.TestCase):
+
+    def test_formas_de_respuesta(self):
+        lector = LectorRespuestas()
+        for comando in ("CREAR|a|1", "LISTAR", "LISTAR|STREAM", "LOTE|2\nCREAR|b|1\nCREAR|c|1", "AYUDA"):
+            lector.esperar(codificar(comando)[1])
+        flujo = (b"OK|Proceso 1 creado.\nDATOS|1: {'nombre': 'a'}\n2: {'nombre': 'b'}\nOK|PONG\n"
+                 b"DATOS|STREAM\n1: {'nombre': 'a'}\nFIN|1\nDATOS|OK|Proceso 2 creado.\nOK|Proceso 3 creado.\n"
+                 b"ERROR|Comando no reconocido.\nOK|PONG\n")
+        # Entregado byte a byte para cubrir respuestas partidas entre lecturas.
+        respuestas = [r for i in range(len(flujo)) for r in lector.alimentar(flujo[i:i + 1])]
+        self.assertEqual([r.estado for r in respuestas], ["OK", "DATOS", "DATOS", "DATOS", "ERROR"])
+        self.assertEqual(respuestas[1].filas(), [(1, {"nombre": "a"}), (2, {"nombre": "b"})])
+        self.assertEqual(respuestas[2].filas(), [(1, {"nombre": "a"})])
+        self.assertEqual(respuestas[3].lineas, ["OK|Proceso 3 creado."])
+        self.assertFalse(lector.esperadas)
+
+class TestCliente(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        servidor = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        servidor.bind(("127.0.0.1", 0))
+        servidor.listen(64)
+        threading.Thread(target=servir_hilos, args=(servidor,), kwargs={"timeout": None}, daemon=True).start()
+        cls.port = servidor.getsockname()[1]
+
+    def setUp(self):
+        reiniciar_procesos()
+
+    def test_api_sincrona(self):
+        with Cliente(port=self.port) as c:
+            self.assertEqual(c.crear("a", "alta"), 1)
+            self.assertEqual(c.crear("b", "baja"), 2)
+            c.modificar(1, "estado", "detenido")
+            self.assertEqual([pid for pid, _ in c.listar()], [1, 2])
+            self.assertEqual(c.listar({"estado": "detenido"}), [(1, {"nombre": "a", "prioridad": "alta", "estado": "detenido"})])
+            self.assertEqual(c.lote(["CREAR|c|1", "ELIMINAR|2"]), ["Proceso 3 creado.", "Proceso 2 eliminado."])
+            self.assertEqual([pid for pid, _ in c.top(5)], [3])
+            with self.assertRaises(ErrorServidor):
+                c.eliminar(99)
+            respuestas = c.pipeline(["CREAR|d|1", "AYUDA", "LISTAR", "ELIMINAR|1"])
+            self.assertEqual([r.estado for r in respuestas], ["OK", "DATOS", "DATOS", "OK"])
+            self.assertEqual(len(respuestas[2].filas()), 3)
+
+    def test_pool_sincrono(self):
+        pool = PoolClientes(port=self.port, tamano=4)
+        pids = []
+        hilos = [threading.Thread(target=lambda: pids.append(pool.enviar("CREAR|p|1").mensaje)) for _ in range(20)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        pool.cerrar()
+        self.assertEqual(len(set(pids)), 20)
+
+    def test_pool_descarta_conexiones_cerradas_por_inactividad(self):
+        servidor = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        servidor.bind(("127.0.0.1", 0))
+        servidor.listen(8)
+        threading.Thread(target=servir_hilos, args=(servidor,), kwargs={"timeout": 0.2}, daemon=True).start()
+        pool = PoolClientes(port=servidor.getsockname()[1], tamano=2)
+        self.assertEqual(pool.enviar("CREAR|a|1").estado, "OK")
+        time.sleep(0.5)
+        self.assertEqual(pool.enviar("CREAR|b|1").mensaje, "Proceso 2 creado.")
+        pool.cerrar()
+
+    def test_api_asyncio(self):
+        async def probar():
+            async with PoolClientesAsync(port=self.port, tamano=3) as pool:
+                respuestas = await asyncio.gather(*(pool.enviar(f"CREAR|p{i}|1") for i in range(200)))
+                self.assertTrue(all(r.estado == "OK" for r in respuestas))
+                self.assertLessEqual(len(pool.clientes), 3)
+            async with await ClienteAsync.conectar(port=self.port) as c:
+                self.assertEqual(len(await c.listar()), 200)
+                self.assertEqual(await c.crear("x", "alta"), 201)
+                self.assertEqual((await c.siguiente())[0], 201)
+        asyncio.run(probar())
+
+if __name__ == "__main__":
+    unittest.main()
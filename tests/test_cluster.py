@@ -0,0 +1,129 @@
+# tests/test_cluster.py
+import os
+import subprocess
+import sys
+import unittest
+import cluster
+from cliente import Cliente
+from tests.utilidades import esperar, puerto_libre
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class TestAnillo(unittest.TestCase):
+
+    def test_reparto_equilibrado(self):
+        anillo = cluster.Anillo(["1", "2", "3"])
+        claves = [str(pid) for pid in range(1, 30001)]
+        for nodo in ("1", "2", "3"):
+            parte = sum(anillo.dueno(c) == nodo for c in claves) / len(claves)
+            self.assertAlmostEqual(parte, 1 / 3, delta=0.08)
+
+    def test_agregar_nodo_mueve_solo_su_parte(self):
+        anillo = cluster.Anillo(["1", "2", "3"])
+        claves = [str(pid) for pid in range(1, 30001)]
+        antes = [anillo.dueno(c) for c in claves]
+        anillo.agregar("4")
+        movidas = [c for c, dueno in zip(claves, antes) if anillo.dueno(c) != dueno]
+        # Solo se mueven claves al nodo nuevo, y alrededor de 1/4 de ellas.
+        self.assertTrue(all(anillo.dueno(c) == "4" for c in movidas))
+        self.assertAlmostEqual(len(movidas) / len(claves), 1 / 4, delta=0.08)
+
+    def test_parsear_nodos(self):
+        self.assertEqual(cluster.parsear_nodos("1=127.0.0.1:1,02=h:2"), {"1": ("127.0.0.1", 1), "2": ("h", 2)})
+        for texto in ("0=h:1", "1=h", "1=h:1,1=h:2", "x=h:1"):
+            with self.assertRaises(ValueError):
+                cluster.parsear_nodos(texto)
+
+"""
+    Tres nodos locales (main.py --cluster) y un cuarto que se une después.
+"""
+class TestCluster(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.puertos = {str(i): puerto_libre() for i in range(1, 5)}
+        cls.nodos = []
+        cls.clientes = [cls.arrancar(nodo) for nodo in ("1", "2", "3")]
+
+    @classmethod
+    def arrancar(cls, nodo):
+        # Los tres primeros no conocen al cuarto hasta CLUSTER_UNIR.
+        ids = ("1", "2", "3", "4") if nodo == "4" else ("1", "2", "3")
+        lista = ",".join(f"{i}=127.0.0.1:{cls.puertos[i]}" for i in ids)
+        cls.nodos.append(subprocess.Popen(
+            [sys.executable, "main.py", "--host", "127.0.0.1", "--port", str(cls.puertos[nodo]), "--log-nivel", "ERROR",
+             "--cluster", lista, "--cluster-id", nodo, "--cluster-secreto", "prueba"],
+            cwd=RAIZ, stdout=subprocess.DEVNULL))
+        return esperar(lambda: Cliente("127.0.0.1", cls.puertos[nodo], timeout=10))
+
+    @classmethod
+    def tearDownClass(cls):
+        for cliente in cls.clientes:
+            if cliente:
+                cliente.cerrar()
+        for nodo in cls.nodos:
+            nodo.terminate()
+            nodo.wait()
+
+    def procesos(self, cliente):
+        # "nodo=1 nodos=3 procesos=N migrados=M trasladando=no"
+        campos = dict(c.split("=") for c in cliente.enviar("CLUSTER").mensaje.split())
+        return int(campos["procesos"]), int(campos["migrados"]), campos["trasladando"] == "si"
+
+    def test_cualquier_nodo_enruta_y_mezcla(self):
+        uno, dos, tres = self.clientes[:3]
+        pids = [uno.crear(f"p{i}", str(i % 7)) for i in range(60)]
+        self.assertEqual(len(set(pids)), 60)
+        # Los procesos quedan repartidos entre los tres nodos.
+        for cliente in self.clientes[:3]:
+            self.assertGreater(self.procesos(cliente)[0], 0)
+        listado = dos.listar()
+        self.assertEqual([pid for pid, _ in listado], sorted(pid for pid, _ in listado))
+        self.assertTrue(set(pids) <= {pid for pid, _ in listado})
+        self.assertEqual(tres.enviar("LISTAR").texto, uno.enviar("LISTAR").texto)
+
+        tres.modificar(pids[0], "estado", "detenido")
+        self.assertEqual(dos.listar({"estado": "detenido"}), [(pids[0], {"nombre": "p0", "prioridad": "0", "estado": "detenido"})])
+        self.assertEqual(uno.listar(offset=3, limit=4), listado[3:7])
+        tres.eliminar(pids[-1])
+        self.assertNotIn(pids[-1], [pid for pid, _ in uno.listar()])
+
+        esperados = sorted(pid for pid, info in listado if info["prioridad"] == "6")[:3]
+        self.assertEqual([pid for pid, _ in dos.top(3)], esperados)
+        self.assertEqual(uno.siguiente()[0], esperados[0])
+        self.assertTrue(uno.enviar("LOTE|1\nCREAR|a|1").texto.startswith("ERROR|LOTE no está disponible"))
+
+    def test_nodo_solo_con_firma(self):
+        uno = self.clientes[0]
+        for mensaje in ("NODO|UNIR|9|127.0.0.1:1", "NODO|0000|UNIR|9|127.0.0.1:1", "NODO|ACOGER|[[1,\"x\",\"1\",\"activo\",null]]"):
+            self.assertEqual(uno.enviar(mensaje).texto, cluster.ERROR_NODO_NO_AUTORIZADO)
+        self.assertNotIn("nodo=9", uno.enviar("CLUSTER").texto)
+        firmado = cluster.Cluster("2", {}, "prueba").firmar("TOP|0")
+        self.assertEqual(uno.enviar(f"NODO|{firmado}|TOP|0").texto, cluster.SIN_PROCESOS)
+
+    def test_unir_nodo_traslada_su_parte(self):
+        uno = self.clientes[0]
+        uno.pipeline([f"CREAR|u{i}|1" for i in range(600)])
+        antes = uno.enviar("LISTAR").texto
+        cuatro = self.arrancar("4")
+        self.clientes.append(cuatro)
+        self.assertTrue(uno.enviar(f"CLUSTER_UNIR|4|127.0.0.1:{self.puertos['4']}").ok)
+
+        def trasladados():
+            estados = [self.procesos(c) for c in self.clientes[:3]]
+            if any(trasladando for _, _, trasladando in estados):
+                return None
+            recibidos = self.procesos(cuatro)[0]
+            return recibidos == sum(migrados for _, migrados, _ in estados) and recibidos
+
+        recibidos = esperar(trasladados)
+        self.assertTrue(recibidos)
+        # Solo se traslada la parte del nodo nuevo (alrededor de 1/4).
+        self.assertLess(recibidos, (antes.count("\n") + 1) * 0.45)
+        for cliente in self.clientes:
+            self.assertEqual(cliente.enviar("LISTAR").texto, antes)
+        pid = cuatro.crear("nuevo", "alta")
+        self.assertEqual(self.clientes[1].listar({"nombre": "nuevo"})[0][0], pid)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,20 @@
 # tests/test_commands.py
+import json
+import os
+import tempfile
+import threading
+import time
 import unittest
-from process_manager import crear_proceso, listar_procesos, eliminar_proceso, modificar_proceso, reiniciar_procesos
+import urllib.request
+import eventos
+import metricas
+import planificador
+import process_manager
+import registro
+from command_handler import procesar_comando
+from process_manager import (crear_proceso, listar_procesos, eliminar_proceso, modificar_proceso, reiniciar_procesos,
+                             ejecutar_lote, top_procesos, siguiente_proceso, clave_prioridad, renovar_proceso,
+                             caducar_procesos)
 
 class TestProcessManager(unittest.TestCase):
 
@@ -35,5 +49,346 @@ class TestProcessManager(unittest.TestCase):
         self.assertFalse(ok)
         print(msg)
 
+    def test_formato_listar_sin_cambios(self):
+        crear_proceso("proceso_A", "baja")
+        self.assertEqual(listar_procesos(), "1: {'nombre': 'proceso_A', 'prioridad': 'baja', 'estado': 'activo'}")
+
+    def test_listar_ordenado_por_pid(self):
+        for i in range(20):
+            crear_proceso(f"p{i}", "1")
+        pids = [linea.split(":")[0] for linea in listar_procesos().split("\n")]
+        self.assertEqual(pids, [str(i) for i in range(1, 21)])
+
+    def test_cache_listar(self):
+        crear_proceso("a", "1")
+        crear_proceso("b", "2")
+        primero = listar_procesos()
+        self.assertIs(listar_procesos(), primero)
+        modificar_proceso("2", "estado", "detenido")
+        self.assertEqual(listar_procesos().split("\n")[1], "2: {'nombre': 'b', 'prioridad': '2', 'estado': 'detenido'}")
+        eliminar_proceso("1")
+        self.assertNotIn("'a'", listar_procesos())
+
+    def test_listar_paginado(self):
+        for i in range(10):
+            crear_proceso(f"p{i}", "1")
+        pagina = listar_procesos(3, 2).split("\n")
+        self.assertEqual([linea.split(":")[0] for linea in pagina], ["4", "5"])
+        self.assertEqual(listar_procesos(20, 5), "Sin procesos.")
+
+    def test_lote(self):
+        ok, resultados = ejecutar_lote([("crear", "a", "1"), ("crear", "b", "2"), ("modificar", "1", "estado", "detenido")])
+        self.assertTrue(ok)
+        self.assertEqual(resultados, ["Proceso 1 creado.", "Proceso 2 creado.", "Proceso 1 actualizado."])
+        self.assertIn("'estado': 'detenido'", listar_procesos())
+
+    def test_lote_fallido_no_aplica_nada(self):
+        crear_proceso("a", "1")
+        antes = listar_procesos()
+        ok, msg = ejecutar_lote([("crear", "b", "2"), ("eliminar", "1"), ("eliminar", "99")])
+        self.assertFalse(ok)
+        self.assertIn("operación 3", msg)
+        self.assertEqual(listar_procesos(), antes)
+
+    def test_listar_filtrado(self):
+        crear_proceso("web", "alta")
+        crear_proceso("db", "alta")
+        crear_proceso("cron", "baja")
+        modificar_proceso("2", "estado", "suspendido")
+        self.assertEqual(listar_procesos(filtros=[("prioridad", "alta")]).count("\n"), 1)
+        self.assertEqual(listar_procesos(filtros=[("prioridad", "alta"), ("estado", "suspendido")]),
+                         "2: {'nombre': 'db', 'prioridad': 'alta', 'estado': 'suspendido'}")
+        self.assertEqual(listar_procesos(filtros=[("estado", "activo")], offset=1, limit=5).split(":")[0], "3")
+        eliminar_proceso("3")
+        self.assertEqual(listar_procesos(filtros=[("nombre", "cron")]), "Sin procesos.")
+
+    def test_lote_fallido_mantiene_indices(self):
+        crear_proceso("a", "1")
+        ejecutar_lote([("modificar", "1", "estado", "suspendido"), ("eliminar", "99")])
+        self.assertEqual(listar_procesos(filtros=[("estado", "suspendido")]), "Sin procesos.")
+        self.assertIn("'a'", listar_procesos(filtros=[("estado", "activo")]))
+
+    def test_lote_fallido_mantiene_plazos(self):
+        crear_proceso("a", "1", ttl=60)
+        vence = process_manager._vencimientos["1"]
+        for operacion in (("modificar", "1", "estado", "x"), ("eliminar", "1")):
+            ok, _ = ejecutar_lote([operacion, ("eliminar", "99")])
+            self.assertFalse(ok)
+            self.assertEqual(process_manager._vencimientos.get("1"), vence)
+        self.assertAlmostEqual(process_manager.plazo_restante("1"), 60, delta=5)
+
+    def test_acoger_reemplazando(self):
+        crear_proceso("a", "1", ttl=60)
+        self.assertFalse(process_manager.acoger_proceso("1", "b", "2")[0])
+        # Un lector concurrente nunca ve el PID ausente durante el reemplazo.
+        ausente = []
+        parar = threading.Event()
+        def leer():
+            while not parar.is_set():
+                if not process_manager.snapshot_procesos():
+                    ausente.append(True)
+        lector = threading.Thread(target=leer)
+        lector.start()
+        try:
+            for _ in range(2000):
+                process_manager.acoger_proceso("1", "b", "2", "suspendido", reemplazar=True)
+        finally:
+            parar.set()
+            lector.join()
+        self.assertEqual(ausente, [])
+        self.assertIn("'b'", listar_procesos(filtros=[("estado", "suspendido")]))
+        self.assertNotIn("1", process_manager._vencimientos)
+
+    def test_clave_prioridad(self):
+        self.assertLess(clave_prioridad("baja"), clave_prioridad("alta"))
+        self.assertLess(clave_prioridad("3"), clave_prioridad("ALTA"))
+        self.assertLess(clave_prioridad("desconocida"), clave_prioridad("0"))
+        for valor in ("nan", "inf", "-inf", "NaN"):
+            self.assertEqual(clave_prioridad(valor), float("-inf"))
+        crear_proceso("a", "nan")
+        crear_proceso("b", "1")
+        crear_proceso("c", "inf")
+        crear_proceso("d", "2")
+        self.assertEqual([pid for pid, _ in top_procesos(4)], ["4", "2", "1", "3"])
+
+    def test_top_y_siguiente(self):
+        crear_proceso("a", "baja")
+        crear_proceso("b", "alta")
+        crear_proceso("c", "7")
+        crear_proceso("d", "alta")
+        modificar_proceso("4", "estado", "suspendido")
+        self.assertEqual([pid for pid, _ in top_procesos(3)], ["2", "3", "1"])
+        pid, info = siguiente_proceso()
+        self.assertEqual((pid, info.estado), ("2", "ejecutando"))
+        modificar_proceso("1", "prioridad", "99")
+        self.assertEqual([pid for pid, _ in top_procesos(10)], ["1", "3"])
+        eliminar_proceso("1")
+        self.assertEqual(siguiente_proceso()[0], "3")
+        self.assertIsNone(siguiente_proceso())
+
+    def test_crear_concurrente_sin_pids_repetidos(self):
+        resultados = []
+        def crear():
+            for _ in range(200):
+                resultados.append(crear_proceso("p", "1")[1])
+        hilos = [threading.Thread(target=crear) for _ in range(8)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        self.assertEqual(len(set(resultados)), 1600)
+        self.assertEqual(len(listar_procesos().split("\n")), 1600)
+
+class TestCaducidad(unittest.TestCase):
+
+    def setUp(self):
+        reiniciar_procesos()
+
+    def test_caducar_y_renovar(self):
+        crear_proceso("lease", "5", 10)
+        crear_proceso("lease2", "5", 20)
+        crear_proceso("fijo", "5")
+        ahora = time.monotonic()
+        self.assertEqual(caducar_procesos(ahora), 0)
+        self.assertTrue(renovar_proceso("1", 30)[0])
+        self.assertFalse(renovar_proceso("99", 30)[0])
+        # El 2 vence antes que el 1 renovado; el 3 no tiene plazo.
+        self.assertEqual(caducar_procesos(ahora + 25), 1)
+        self.assertEqual([pid for pid, _ in process_manager.snapshot_procesos()], ["1", "3"])
+        self.assertEqual(caducar_procesos(ahora + 3600), 1)
+        self.assertEqual(procesar_comando("LISTAR"), "DATOS|3: {'nombre': 'fijo', 'prioridad': '5', 'estado': 'activo'}")
+        self.assertFalse(process_manager._vencimientos)
+
+    def test_eliminado_antes_de_caducar(self):
+        crear_proceso("lease", "5", 10)
+        eliminar_proceso("1")
+        self.assertFalse(process_manager._vencimientos)
+        self.assertEqual(caducar_procesos(time.monotonic() + 3600), 0)
+
+    def test_comandos_y_recolector(self):
+        self.assertTrue(procesar_comando("CREAR|a|5|0.05").startswith("OK|"))
+        self.assertTrue(procesar_comando("CREAR|b|5|60").startswith("OK|"))
+        self.assertEqual(procesar_comando("RENOVAR|2|0.05"), "OK|Proceso 2 renovado.")
+        for ttl in ("0", "-1", "x", "inf"):
+            self.assertEqual(procesar_comando(f"CREAR|c|5|{ttl}"), procesar_comando(f"RENOVAR|1|{ttl}"))
+        self.assertTrue(procesar_comando("CREAR|c|5|1|2").startswith("ERROR|Argumentos inválidos"))
+        self.assertTrue(procesar_comando("LOTE|1\nCREAR|c|5|1").startswith("ERROR|"))
+        limite = time.monotonic() + 5
+        while procesar_comando("LISTAR") != "DATOS|Sin procesos." and time.monotonic() < limite:
+            time.sleep(0.01)
+        self.assertEqual(procesar_comando("LISTAR"), "DATOS|Sin procesos.")
+
+class TestPlanificador(unittest.TestCase):
+
+    def setUp(self):
+        reiniciar_procesos()
+        planificador.descartar()
+
+    def tearDown(self):
+        planificador.descartar()
+
+    def estados(self):
+        return {pid: p.estado for pid, p in process_manager.snapshot_procesos()}
+
+    def test_algoritmos(self):
+        rafagas = {}
+        for nombre, prioridad in (("a", "1"), ("b", "alta"), ("c", "5")):
+            crear_proceso(nombre, prioridad)
+        for pid in ("1", "2", "3"):
+            rafagas[pid] = planificador.rafaga(pid)
+        total = sum(rafagas.values())
+        # Prioridad: el primero en correr es el de prioridad alta.
+        self.assertEqual(procesar_comando("SIMULAR|1|prioridad"), "OK|Tiempo 1: 1 despachos, 0 terminados.")
+        self.assertEqual(self.estados()["2"], "ejecutando")
+        planificador.simular(total)
+        self.assertEqual(set(self.estados().values()), {"terminado"})
+        # Round-robin expulsa al agotar el quantum y termina igual.
+        reiniciar_procesos()
+        for nombre in "abc":
+            crear_proceso(nombre, "1")
+        _, despachos, terminados = planificador.simular(total, "rr")
+        self.assertEqual(terminados, 3)
+        self.assertEqual(despachos, sum(-(-r // planificador.QUANTUM) for r in rafagas.values()))
+        self.assertIn("uso_cpu=100.0%", procesar_comando("ESTADO_PLANIFICADOR"))
+
+    def test_cambios_externos(self):
+        for i in range(5):
+            crear_proceso(f"p{i}", "1")
+        planificador.simular(0, "fifo", 2)
+        eliminar_proceso("1")
+        modificar_proceso("2", "estado", "detenido")
+        crear_proceso("nuevo", "1")
+        planificador.simular(1000)
+        self.assertEqual(self.estados(), {"2": "detenido", "3": "terminado", "4": "terminado",
+                                          "5": "terminado", "6": "terminado"})
+        self.assertIn("terminados=4", procesar_comando("ESTADO_PLANIFICADOR"))
+        self.assertTrue(procesar_comando("SIMULAR|10|lifo").startswith("ERROR|"))
+
+    def test_desbordamiento_de_entrantes(self):
+        crear_proceso("a", "1")
+        planificador.simular(0)
+        actual = planificador._planificador
+        for i in range(10):
+            modificar_proceso("1", "nombre", f"a{i}")
+        # Los cambios que no afectan a la cola no se acumulan.
+        self.assertEqual(len(actual.entrantes), 0)
+        maximo, trozo = planificador.MAX_ENTRANTES, process_manager.TROZO_ESTADOS
+        self.addCleanup(setattr, planificador, "MAX_ENTRANTES", maximo)
+        self.addCleanup(setattr, process_manager, "TROZO_ESTADOS", trozo)
+        planificador.MAX_ENTRANTES, process_manager.TROZO_ESTADOS = 3, 2
+        for i in range(5):
+            crear_proceso(f"p{i}", "1")
+        self.assertTrue(actual.desbordado)
+        lotes = []
+        process_manager.registrar_observador(lotes.append)
+        self.addCleanup(process_manager.quitar_observador, lotes.append)
+        planificador.simular(1000)
+        self.assertEqual(set(self.estados().values()), {"terminado"})
+        self.assertIn("terminados=6", procesar_comando("ESTADO_PLANIFICADOR"))
+        # Los cambios de estado se escriben en trozos de TROZO_ESTADOS.
+        self.assertTrue(all(len(lote[1]) <= 2 for lote in lotes))
+
+class TestMetricas(unittest.TestCase):
+
+    def setUp(self):
+        reiniciar_procesos()
+
+    def test_estadisticas(self):
+        antes = metricas.metrica_comando("eliminar").leer()
+        procesar_comando("CREAR|a|1")
+        procesar_comando("ELIMINAR|999")
+        total, errores, _, cubos = metricas.metrica_comando("eliminar").leer()
+        self.assertEqual((total - antes[0], errores - antes[1]), (1, 1))
+        self.assertEqual(sum(cubos), total)
+        respuesta = procesar_comando("ESTADISTICAS")
+        self.assertTrue(respuesta.startswith("DATOS|conexiones activas="))
+        self.assertIn("comando crear total=", respuesta)
+        self.assertIn("locks adquisiciones=", respuesta)
+
+    def test_prometheus_http(self):
+        procesar_comando("CREAR|a|1")
+        servidor = metricas.servir_http(0)
+        try:
+            url = f"http://127.0.0.1:{servidor.server_address[1]}/metrics"
+            texto = urllib.request.urlopen(url, timeout=5).read().decode()
+        finally:
+            servidor.shutdown()
+            servidor.server_close()
+        self.assertIn('tcprocesses_comando_segundos_bucket{accion="crear",le="+Inf"}', texto)
+        self.assertIn("tcprocesses_lock_espera_segundos_total", texto)
+
+class TestEventos(unittest.TestCase):
+
+    def setUp(self):
+        reiniciar_procesos()
+
+    def suscribir(self, *args, **kwargs):
+        suscriptor = eventos.suscribir(*args, **kwargs)
+        self.addCleanup(eventos.cancelar, suscriptor)
+        return suscriptor
+
+    def test_eventos_y_agrupacion(self):
+        suscriptor = self.suscribir()
+        crear_proceso("a", "alta")
+        modificar_proceso("1", "estado", "detenido")
+        # Creado + modificado se agrupan en un solo evento.
+        self.assertEqual(suscriptor.esperar(0).split("|", 2)[2], "creado|1|nombre=a|prioridad=alta|estado=detenido\n")
+        crear_proceso("b", "baja")
+        eliminar_proceso("2")
+        crear_proceso("c", "baja")
+        eliminar_proceso("1")
+        # "b" creado y eliminado antes de enviarse no llega.
+        lineas = suscriptor.esperar(0).splitlines()
+        self.assertEqual([l.split("|", 2)[2] for l in lineas],
+                         ["creado|3|nombre=c|prioridad=baja|estado=activo", "eliminado|1"])
+        self.assertTrue(suscriptor.esperar(0).endswith("|latido\n"))
+
+    def test_desbordado(self):
+        suscriptor = self.suscribir(max_pendientes=2)
+        for _ in range(3):
+            crear_proceso("p", "1")
+        crear_proceso("q", "1")
+        lineas = suscriptor.esperar(0).splitlines()
+        self.assertTrue(lineas[0].endswith("|desbordado"))
+        self.assertEqual(lineas[1].split("|")[2:4], ["creado", "4"])
+
+    def test_reanudar(self):
+        inicial = self.suscribir().inicial
+        desde = int(inicial.split()[-1].rstrip("."))
+        crear_proceso("a", "1")
+        modificar_proceso("1", "prioridad", "2")
+        reanudado = self.suscribir(desde)
+        self.assertEqual(reanudado.esperar(0).splitlines()[0].split("|")[2:],
+                         ["creado", "1", "nombre=a", "prioridad=2", "estado=activo"])
+        self.assertTrue(self.suscribir(10 ** 9).esperar(0).split("|")[2].startswith("desbordado"))
+
+class TestRegistro(unittest.TestCase):
+
+    def setUp(self):
+        self.archivo = os.path.join(tempfile.mkdtemp(), "servidor.log")
+        self.addCleanup(registro.detener)
+
+    def lineas(self):
+        registro.detener()
+        with open(self.archivo, encoding="utf-8") as f:
+            return [json.loads(linea) for linea in f]
+
+    def test_auditoria_json(self):
+        registro.configurar("DEBUG", 1.0, self.archivo)
+        procesar_comando("CREAR|a|1")
+        procesar_comando("FOO")
+        auditadas = [l for l in self.lineas() if l["evento"] == "comando"]
+        self.assertEqual([(l["accion"], l["error"]) for l in auditadas], [("crear", False), ("desconocido", True)])
+        self.assertEqual(auditadas[0]["nivel"], "DEBUG")
+
+    def test_nivel_y_muestreo(self):
+        registro.configurar("INFO", 1.0, self.archivo)
+        self.assertFalse(registro.auditoria)
+        registro.info("conexion_abierta", cliente=("127.0.0.1", 1))
+        registro.configurar("DEBUG", 0.0, self.archivo)
+        self.assertFalse(registro.auditoria)
+        procesar_comando("AYUDA")
+        self.assertEqual([l["evento"] for l in self.lineas()], ["conexion_abierta"])
+
 if __name__ == "__main__":
     unittest.main()
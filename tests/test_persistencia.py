@@ -0,0 +1,133 @@
+# tests/test_persistencia.py
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import persistencia
+from process_manager import (crear_proceso, listar_procesos, eliminar_proceso, modificar_proceso,
+                             reiniciar_procesos, ejecutar_lote, renovar_proceso, plazo_restante, caducar_procesos)
+
+class TestPersistencia(unittest.TestCase):
+
+    def setUp(self):
+        reiniciar_procesos()
+        self.directorio = tempfile.mkdtemp()
+        persistencia.activar(self.directorio, snapshot_cada=10**9, fsync=False)
+
+    def tearDown(self):
+        persistencia.desactivar()
+        reiniciar_procesos()
+        shutil.rmtree(self.directorio)
+
+    def reiniciar_servidor(self):
+        persistencia.desactivar()
+        reiniciar_procesos()
+        persistencia.activar(self.directorio, snapshot_cada=10**9, fsync=False)
+
+    def test_recuperar_desde_wal(self):
+        crear_proceso("a", "1")
+        crear_proceso("b", "2")
+        modificar_proceso("1", "estado", "suspendido")
+        eliminar_proceso("2")
+        ejecutar_lote([("crear", "c", "3")])
+        antes = listar_procesos()
+        self.reiniciar_servidor()
+        self.assertEqual(listar_procesos(), antes)
+        self.assertEqual(crear_proceso("d", "4")[1], "Proceso 4 creado.")
+
+    def test_recuperar_desde_snapshot_y_cola_del_wal(self):
+        for i in range(50):
+            crear_proceso(f"p{i}", "alta")
+        persistencia.compactar()
+        modificar_proceso("7", "estado", "suspendido")
+        eliminar_proceso("50")
+        antes = listar_procesos()
+        self.assertEqual(len(persistencia._segmentos(self.directorio)), 1)
+        self.reiniciar_servidor()
+        self.assertEqual(listar_procesos(), antes)
+        self.assertEqual(crear_proceso("x", "1")[1], "Proceso 51 creado.")
+
+    def test_snapshot_no_gasta_pids(self):
+        crear_proceso("a", "1")
+        persistencia.compactar()
+        persistencia.compactar()
+        self.assertEqual(crear_proceso("b", "2")[1], "Proceso 2 creado.")
+        persistencia.compactar()
+        self.reiniciar_servidor()
+        self.assertEqual(crear_proceso("c", "3")[1], "Proceso 3 creado.")
+
+    def test_cola_del_wal_cortada(self):
+        crear_proceso("a", "1")
+        persistencia.esperar_durable()
+        crear_proceso("b", "2")
+        persistencia.esperar_durable()
+        segmento = persistencia._ruta_segmento(self.directorio, persistencia._wal.segmento)
+        persistencia.desactivar()
+        with open(segmento, "r+b") as f:
+            f.truncate(os.path.getsize(segmento) - 3)
+        reiniciar_procesos()
+        persistencia.activar(self.directorio, snapshot_cada=10**9, fsync=False)
+        self.assertEqual(listar_procesos(), "1: {'nombre': 'a', 'prioridad': '1', 'estado': 'activo'}")
+
+    def test_group_commit_concurrente(self):
+        def crear():
+            for _ in range(100):
+                crear_proceso("p", "1")
+                persistencia.esperar_durable()
+        hilos = [threading.Thread(target=crear) for _ in range(8)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        self.reiniciar_servidor()
+        self.assertEqual(len(listar_procesos().split("\n")), 800)
+
+    def test_plazos_sobreviven_al_reinicio(self):
+        crear_proceso("wal", "1", ttl=60)
+        crear_proceso("sin_plazo", "1")
+        crear_proceso("corto", "1", ttl=0.2)
+        renovar_proceso("2", 120)
+        eliminar_proceso("1")
+        crear_proceso("x", "1", ttl=30)
+        persistencia.compactar()
+        # Renovado después del snapshot: vale el plazo del WAL.
+        renovar_proceso("4", 90)
+        self.reiniciar_servidor()
+        self.assertIsNone(plazo_restante("1"))
+        self.assertAlmostEqual(plazo_restante("2"), 120, delta=5)
+        self.assertAlmostEqual(plazo_restante("4"), 90, delta=5)
+        time.sleep(0.3)
+        caducar_procesos()
+        self.assertEqual([linea.split(":")[0] for linea in listar_procesos().split("\n")], ["2", "4"])
+
+    def test_fallo_de_escritura_no_confirma(self):
+        class ArchivoRoto:
+            def write(self, datos):
+                raise OSError("disco lleno")
+            def flush(self):
+                pass
+            def fileno(self):
+                return -1
+            def close(self):
+                pass
+        crear_proceso("a", "1")
+        persistencia.esperar_durable()
+        wal = persistencia._wal
+        wal.archivo, archivo = ArchivoRoto(), wal.archivo
+        crear_proceso("b", "2")
+        with self.assertRaises(ValueError):
+            persistencia.esperar_durable()
+        self.assertEqual(wal.durables, 1)
+        self.assertEqual(len(wal.pendientes), 1)
+        self.assertEqual(persistencia.secuencia_pendiente(), 2)
+        # El WAL queda fallido: las esperas siguientes tampoco confirman.
+        with self.assertRaises(ValueError):
+            persistencia.esperar_durable()
+        with self.assertRaises(OSError):
+            persistencia.desactivar()
+        archivo.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+# tests/test_replicacion.py
+import os
+import socket
+import subprocess
+import sys
+import unittest
+import replicacion
+from cliente import Cliente
+from command_handler import procesar_comando
+from process_manager import reiniciar_procesos
+from tests.utilidades import esperar, puerto_libre
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+"""
+    Primario en este proceso y dos réplicas como servidores independientes
+    (main.py --seguir) en localhost.
+"""
+class TestReplicacion(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        reiniciar_procesos()
+        procesar_comando("CREAR|previo|alta")
+        cls.primario = replicacion.activar_primario(0, "127.0.0.1")
+        cls.puertos = [puerto_libre() for _ in range(2)]
+        cls.replicas = [subprocess.Popen(
+            [sys.executable, "main.py", "--host", "127.0.0.1", "--port", str(puerto), "--log-nivel", "ERROR",
+             "--seguir", f"127.0.0.1:{cls.primario.puerto}"],
+            cwd=RAIZ, stdout=subprocess.DEVNULL) for puerto in cls.puertos]
+        cls.clientes = [esperar(lambda: Cliente("127.0.0.1", puerto, timeout=5)) for puerto in cls.puertos]
+
+    @classmethod
+    def tearDownClass(cls):
+        for cliente in cls.clientes:
+            if cliente:
+                cliente.cerrar()
+        for replica in cls.replicas:
+            replica.terminate()
+            replica.wait()
+        replicacion.desactivar()
+        reiniciar_procesos()
+
+    def listado(self):
+        return procesar_comando("LISTAR")
+
+    def al_dia(self, cliente):
+        return cliente.enviar("LISTAR").texto == self.listado()
+
+    def test_replicas_sirven_lecturas(self):
+        # "previo" llega en el snapshot inicial; el resto, por el flujo.
+        pid = procesar_comando("CREAR|web|media").split()[1]
+        procesar_comando(f"MODIFICAR|{pid}|estado|detenido")
+        procesar_comando("LOTE|2\nCREAR|a|1\nELIMINAR|1")
+        for cliente in self.clientes:
+            self.assertTrue(esperar(lambda: self.al_dia(cliente)))
+            self.assertEqual(cliente.listar({"estado": "detenido"}), [(int(pid), {"nombre": "web", "prioridad": "media", "estado": "detenido"})])
+            self.assertTrue(cliente.enviar("CREAR|x|1").texto.startswith("ERROR|Réplica de solo lectura"))
+            estado = cliente.enviar("REPLICACION").texto
+            self.assertIn("rol=seguidor", estado)
+            self.assertIn("conectado=si", estado)
+            self.assertIn("retraso=0 ", estado)
+        self.assertIn("seguidores=2", procesar_comando("REPLICACION"))
+
+    def test_reconexion_retoma_sin_snapshot(self):
+        for cliente in self.clientes:
+            self.assertTrue(esperar(lambda: "snapshots=1" in cliente.enviar("REPLICACION").texto))
+        # Corta las conexiones de replicación: las réplicas reconectan con
+        # la misma época y retoman desde su LSN.
+        with self.primario.cond:
+            conexiones = list(self.primario.conexiones)
+        for conn in conexiones:
+            conn.shutdown(socket.SHUT_RDWR)
+        procesar_comando("CREAR|tras_corte|baja")
+        for cliente in self.clientes:
+            self.assertTrue(esperar(lambda: self.al_dia(cliente)))
+            self.assertIn("snapshots=1", cliente.enviar("REPLICACION").texto)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,361 @@
+# tests/test_servidor.py
+import asyncio
+import os
+import socket
+import tempfile
+import threading
+import unittest
+from main import (MENSAJE_BIENVENIDA, RESPUESTA_OCUPADO, RESPUESTA_INACTIVIDAD, crear_servidor_async,
+                  manejar_cliente, manejar_cliente_async, servir_hilos)
+from command_handler import procesar_comando
+from process_manager import registrar_proceso, reiniciar_procesos
+from protocolo import FramerLineas, MAX_SEGMENTOS, enviar_segmentos, generar_respuestas, procesar_lote
+from servidor_multiproceso import ClienteAlmacen, servir_almacen
+from protocolo_binario import (ESTADO_OK, ESTADO_ERROR, ESTADO_DATOS, procesar_trama, decodificar_respuesta,
+                               trama_crear, trama_listar, trama_eliminar, trama_modificar)
+
+class TestFramerLineas(unittest.TestCase):
+
+    def test_varios_comandos_en_una_lectura(self):
+        framer = FramerLineas()
+        self.assertEqual(framer.alimentar(b"LISTAR\nAYUDA\n"), ["LISTAR", "AYUDA"])
+
+    def test_comando_partido(self):
+        framer = FramerLineas()
+        self.assertEqual(framer.alimentar(b"CREAR|ba"), [])
+        self.assertEqual(framer.alimentar(b"ckup|5\r\nLIS"), ["CREAR|backup|5\r"])
+        self.assertEqual(framer.vaciar(), "LIS")
+
+    def test_lote_agrupado(self):
+        framer = FramerLineas()
+        self.assertEqual(framer.alimentar(b"LISTAR\nLOTE|2\nCREAR|a|1\n"), ["LISTAR"])
+        self.assertEqual(framer.alimentar(b"ELIMINAR|1\nAYUDA\n"), ["LOTE|2\nCREAR|a|1\nELIMINAR|1", "AYUDA"])
+
+    def test_lote_invalido_descarta_sus_lineas(self):
+        framer = FramerLineas()
+        self.assertEqual(framer.alimentar(b"LOTE|100001\nCREAR|a|1\n"), ["LOTE|100001"])
+        self.assertEqual(framer.alimentar(b"ELIMINAR|99\n" * 100000 + b"LISTAR\nLOTE|1|x\nCREAR|b|1\nPING\n"),
+                         ["LISTAR", "LOTE|1|x", "PING"])
+        reiniciar_procesos()
+        respuestas = procesar_lote(FramerLineas().alimentar(b"LOTE|100001\nCREAR|a|1\nELIMINAR|99\n"))
+        self.assertEqual(respuestas.decode().count("\n"), 1)
+        self.assertTrue(respuestas.startswith(b"ERROR|Argumentos inv"))
+        self.assertEqual(procesar_comando("LISTAR"), "DATOS|Sin procesos.")
+
+    def test_lote_demasiado_grande(self):
+        framer = FramerLineas(max_bytes_lote=100)
+        with self.assertRaises(ValueError):
+            framer.alimentar(b"LOTE|5\n" + (b"CREAR|" + b"a" * 40 + b"|1\n") * 3)
+
+    def test_linea_demasiado_larga(self):
+        framer = FramerLineas(max_linea=10)
+        with self.assertRaises(ValueError):
+            framer.alimentar(b"A" * 11)
+
+    def test_vista_de_buffer_reutilizado(self):
+        framer = FramerLineas()
+        entrada = bytearray(b"PING\nLIS")
+        self.assertEqual(framer.alimentar(memoryview(entrada)[:8]), ["PING"])
+        entrada[:4] = b"TAR\n"
+        self.assertEqual(framer.alimentar(memoryview(entrada)[:4]), ["LISTAR"])
+
+class TestBufferSalida(unittest.TestCase):
+
+    def setUp(self):
+        reiniciar_procesos()
+
+    def test_buffer_reutilizado(self):
+        salida = bytearray()
+        bloques = generar_respuestas(["PING", "CREAR|a|1", "PING"], salida)
+        self.assertIs(next(bloques), salida)
+        self.assertEqual(salida, b"OK|PONG\nOK|Proceso 1 creado.\nOK|PONG\n")
+        self.assertEqual(list(bloques), [])
+        for bloque in generar_respuestas(["ELIMINAR|1"], salida):
+            self.assertEqual(bloque, b"OK|Proceso 1 eliminado.\n")
+        self.assertEqual(procesar_lote(["PING", "ELIMINAR|1"]), b"OK|PONG\nERROR|Proceso no encontrado.\n")
+
+    def test_enviar_mas_segmentos_que_iov_max(self):
+        a, b = socket.socketpair()
+        with a, b:
+            segmentos = [b"OK|PONG\n"] * (MAX_SEGMENTOS * 2 + 3)
+            hilo = threading.Thread(target=enviar_segmentos, args=(a, segmentos))
+            hilo.start()
+            recibido = bytearray()
+            while len(recibido) < len(segmentos) * 8:
+                recibido += b.recv(65536)
+            hilo.join()
+            self.assertEqual(bytes(recibido), b"".join(segmentos))
+
+class TestProtocoloBinario(unittest.TestCase):
+
+    def setUp(self):
+        reiniciar_procesos()
+
+    def responder(self, trama):
+        return decodificar_respuesta(procesar_trama(trama[4:])[4:])
+
+    def test_operaciones(self):
+        self.assertEqual(self.responder(trama_crear("a|b\nc", "alta")), (ESTADO_OK, 1))
+        self.assertEqual(self.responder(trama_modificar(1, "estado", "detenido")), (ESTADO_OK, None))
+        self.assertEqual(self.responder(trama_listar()), (ESTADO_DATOS, [(1, "a|b\nc", "alta", "detenido")]))
+        self.assertEqual(self.responder(trama_eliminar(1)), (ESTADO_OK, None))
+        self.assertEqual(self.responder(trama_eliminar(1)), (ESTADO_ERROR, "Proceso no encontrado."))
+
+    def test_campos_largos_y_paginas(self):
+        # Un campo de más de 65535 bytes (creado por otra vía) no desborda el prefijo de longitud.
+        nombre = "n" * 70000
+        for _ in range(3):
+            registrar_proceso(nombre, "1")
+        self.assertEqual(self.responder(trama_listar(1, 1)), (ESTADO_DATOS, [(2, nombre, "1", "activo")]))
+        self.assertEqual(self.responder(trama_listar(2, 5)), (ESTADO_DATOS, [(3, nombre, "1", "activo")]))
+
+    def test_trama_mal_formada(self):
+        self.assertEqual(self.responder(trama_crear("a", "1")[:-1]), (ESTADO_ERROR, "Trama mal formada."))
+        self.assertEqual(self.responder(b"\x00\x00\x00\x01\x09"), (ESTADO_ERROR, "Opcode no reconocido."))
+
+class TestAlmacenRemoto(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.ruta = os.path.join(tempfile.mkdtemp(), "almacen.sock")
+        listo = threading.Event()
+        threading.Thread(target=servir_almacen, args=(cls.ruta, listo), daemon=True).start()
+        listo.wait()
+
+    def setUp(self):
+        reiniciar_procesos()
+        self.cliente = ClienteAlmacen(self.ruta)
+
+    def recibir(self, sesion, datos):
+        return b"".join(sesion.recibir(datos))
+
+    def test_comandos_de_texto(self):
+        sesion = self.cliente.crear_sesion()
+        respuesta = self.recibir(sesion, b"CREAR|a|1\nCREAR|b|2\nELIMINAR|1\n")
+        self.assertEqual(respuesta, b"OK|Proceso 1 creado.\nOK|Proceso 2 creado.\nOK|Proceso 1 eliminado.\n")
+
+    def test_pids_compartidos_entre_sesiones(self):
+        otro = ClienteAlmacen(self.ruta)
+        self.recibir(self.cliente.crear_sesion(), b"CREAR|a|1\n")
+        self.assertEqual(self.recibir(otro.crear_sesion(), b"CREAR|b|1\n"), b"OK|Proceso 2 creado.\n")
+
+    def test_stream_parcial_no_desincroniza(self):
+        sesion = self.cliente.crear_sesion()
+        self.recibir(sesion, b"".join(b"CREAR|p|1\n" for _ in range(1200)))
+        bloques = sesion.recibir(b"LISTAR|STREAM\n")
+        next(bloques)
+        bloques.close()
+        self.assertEqual(self.recibir(sesion, b"ELIMINAR|1\n"), b"OK|Proceso 1 eliminado.\n")
+
+    def test_binario(self):
+        sesion = self.cliente.crear_sesion()
+        respuesta = self.recibir(sesion, b"BINARIO\n" + trama_crear("a", "1"))
+        self.assertEqual(respuesta[:30], b"OK|Protocolo binario activado.")
+        self.assertEqual(decodificar_respuesta(respuesta.split(b"\n", 1)[1][4:]), (ESTADO_OK, 1))
+
+class TestPoolHilos(unittest.TestCase):
+
+    def iniciar(self, **limites):
+        servidor = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        servidor.bind(("127.0.0.1", 0))
+        servidor.listen(16)
+        threading.Thread(target=servir_hilos, args=(servidor,), kwargs=limites, daemon=True).start()
+        return servidor.getsockname()[1]
+
+    def conectar(self, port):
+        conn = socket.create_connection(("127.0.0.1", port), timeout=5)
+        self.addCleanup(conn.close)
+        return conn
+
+    def test_saturado_responde_ocupado(self):
+        port = self.iniciar(hilos=1, cola=1, timeout=None)
+        atendida = self.conectar(port)
+        self.assertEqual(atendida.recv(100), MENSAJE_BIENVENIDA)
+        self.conectar(port)
+        self.assertEqual(self.conectar(port).recv(100), RESPUESTA_OCUPADO)
+
+    def test_error_de_socket_cierra_la_conexion(self):
+        # Un OSError cualquiera al leer no debe dejar el socket abierto.
+        servidor, cliente = socket.socketpair()
+        self.addCleanup(cliente.close)
+        cerrar = servidor.close
+
+        class Conexion:
+            sendall = servidor.sendall
+            fileno = servidor.fileno
+
+            def recv_into(self, buffer):
+                raise OSError("Socket inválido")
+
+            def close(self):
+                cerrar()
+
+        manejar_cliente(Conexion(), ("127.0.0.1", 0))
+        self.assertEqual(servidor.fileno(), -1)
+        self.assertEqual(cliente.recv(100), MENSAJE_BIENVENIDA)
+
+    def test_clientes_inactivos_no_cuelgan_la_cola(self):
+        port = self.iniciar(hilos=2, cola=2, timeout=None, espera_cola=0.3)
+        for _ in range(2):
+            self.assertEqual(self.conectar(port).recv(100), MENSAJE_BIENVENIDA)
+        # Los dos hilos quedan ocupados por clientes que no envían nada: las
+        # conexiones en cola reciben ERROR|Ocupado al vencer su espera.
+        en_cola = [self.conectar(port) for _ in range(2)]
+        for conn in en_cola:
+            self.assertEqual(conn.recv(100), RESPUESTA_OCUPADO)
+        self.assertEqual(self.conectar(port).recv(100), RESPUESTA_OCUPADO)
+
+    def test_suscribir(self):
+        reiniciar_procesos()
+        port = self.iniciar(hilos=2, cola=0, timeout=None)
+        suscrito = self.conectar(port)
+        suscrito.recv(100)
+        suscrito.sendall(b"SUSCRIBIR\n")
+        self.assertTrue(suscrito.recv(100).startswith(b"OK|Suscrito desde"))
+        otro = self.conectar(port)
+        otro.recv(100)
+        otro.sendall(b"CREAR|a|1\nELIMINAR|1\nCREAR|b|1\n")
+        recibido = b""
+        while recibido.count(b"\n") < 1:
+            recibido += suscrito.recv(1000)
+        self.assertIn(b"|creado|", recibido)
+
+    def test_timeout_inactividad(self):
+        port = self.iniciar(hilos=1, cola=0, timeout=0.2)
+        conn = self.conectar(port)
+        self.assertEqual(conn.recv(100), MENSAJE_BIENVENIDA)
+        self.assertEqual(conn.recv(100), RESPUESTA_INACTIVIDAD)
+        # El hilo queda libre para la siguiente conexión.
+        self.assertEqual(self.conectar(port).recv(100), MENSAJE_BIENVENIDA)
+
+class TestServidorAsync(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        reiniciar_procesos()
+        self.servidor = await asyncio.start_server(manejar_cliente_async, "127.0.0.1", 0)
+        self.port = self.servidor.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.servidor.close()
+        await self.servidor.wait_closed()
+
+    async def conectar(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        await reader.readline()
+        return reader, writer
+
+    async def enviar(self, reader, writer, comando):
+        writer.write((comando + "\n").encode())
+        await writer.drain()
+        return (await reader.readline()).decode().strip()
+
+    async def test_crear_y_eliminar(self):
+        reader, writer = await self.conectar()
+        self.assertEqual(await self.enviar(reader, writer, "CREAR|backup|5"), "OK|Proceso 1 creado.")
+        self.assertEqual(await self.enviar(reader, writer, "ELIMINAR|1"), "OK|Proceso 1 eliminado.")
+        writer.close()
+        await writer.wait_closed()
+
+    async def test_pipelining(self):
+        reader, writer = await self.conectar()
+        writer.write(b"CREAR|a|1\nCREAR|b|2\nELIMINAR|1\n")
+        await writer.drain()
+        respuestas = [(await reader.readline()).decode().strip() for _ in range(3)]
+        self.assertEqual(respuestas, ["OK|Proceso 1 creado.", "OK|Proceso 2 creado.", "OK|Proceso 1 eliminado."])
+        writer.close()
+        await writer.wait_closed()
+
+    async def test_lote(self):
+        reader, writer = await self.conectar()
+        writer.write(b"LOTE|3\nCREAR|a|1\nCREAR|b|2\nELIMINAR|1\n")
+        await writer.drain()
+        respuesta = [(await reader.readline()).decode().strip() for _ in range(3)]
+        self.assertEqual(respuesta, ["DATOS|OK|Proceso 1 creado.", "OK|Proceso 2 creado.", "OK|Proceso 1 eliminado."])
+        writer.close()
+        await writer.wait_closed()
+
+    async def test_listar_stream(self):
+        reader, writer = await self.conectar()
+        writer.write(b"".join(b"CREAR|p|1\n" for _ in range(1200)))
+        writer.write(b"LISTAR|STREAM\nAYUDA\n")
+        await writer.drain()
+        for _ in range(1200):
+            await reader.readline()
+        self.assertEqual(await reader.readline(), b"DATOS|STREAM\n")
+        filas = []
+        while True:
+            linea = (await reader.readline()).decode().strip()
+            if linea.startswith("FIN|"):
+                break
+            filas.append(linea)
+        self.assertEqual(linea, "FIN|1200")
+        self.assertEqual(len(filas), 1200)
+        self.assertTrue((await reader.readline()).startswith(b"DATOS|Comandos"))
+        writer.close()
+        await writer.wait_closed()
+
+    async def test_negociar_binario(self):
+        reader, writer = await self.conectar()
+        writer.write(b"BINARIO\n" + trama_crear("a", "1") + trama_crear("b", "2") + trama_listar(1, 5))
+        await writer.drain()
+        self.assertEqual(await reader.readline(), b"OK|Protocolo binario activado.\n")
+        respuestas = []
+        for _ in range(3):
+            n = int.from_bytes(await reader.readexactly(4), "big")
+            respuestas.append(decodificar_respuesta(await reader.readexactly(n)))
+        self.assertEqual(respuestas, [(ESTADO_OK, 1), (ESTADO_OK, 2), (ESTADO_DATOS, [(2, "b", "2", "activo")])])
+        writer.close()
+        await writer.wait_closed()
+
+    async def test_admision_y_timeout(self):
+        servidor = await crear_servidor_async("127.0.0.1", 0, max_clientes=1, timeout=0.2)
+        port = servidor.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        self.assertEqual(await reader.readline(), MENSAJE_BIENVENIDA)
+        otro_reader, otro_writer = await asyncio.open_connection("127.0.0.1", port)
+        self.assertEqual(await otro_reader.readline(), RESPUESTA_OCUPADO)
+        self.assertEqual(await reader.readline(), RESPUESTA_INACTIVIDAD)
+        for w in (writer, otro_writer):
+            w.close()
+        servidor.close()
+        await servidor.wait_closed()
+
+    async def test_miles_de_conexiones_inactivas(self):
+        # Sin límite por defecto: muchas más conexiones que hilos + cola del modo con hilos.
+        servidor = await crear_servidor_async("127.0.0.1", 0, timeout=None)
+        port = servidor.sockets[0].getsockname()[1]
+        conexiones = []
+        for _ in range(1000):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            self.assertEqual(await reader.readline(), MENSAJE_BIENVENIDA)
+            conexiones.append(writer)
+        # Con todas abiertas, la última sigue recibiendo servicio.
+        self.assertEqual(await self.enviar(reader, writer, "CREAR|a|1"), "OK|Proceso 1 creado.")
+        for w in conexiones:
+            w.close()
+        servidor.close()
+        await servidor.wait_closed()
+
+    async def test_suscribir(self):
+        reader, writer = await self.conectar()
+        respuesta = await self.enviar(reader, writer, "SUSCRIBIR")
+        self.assertTrue(respuesta.startswith("OK|Suscrito desde"))
+        otro_reader, otro_writer = await self.conectar()
+        await self.enviar(otro_reader, otro_writer, "CREAR|a|alta")
+        evento = (await reader.readline()).decode().strip()
+        self.assertEqual(evento.split("|")[2:], ["creado", "1", "nombre=a", "prioridad=alta", "estado=activo"])
+        for w in (writer, otro_writer):
+            w.close()
+            await w.wait_closed()
+
+    async def test_varios_clientes(self):
+        conexiones = [await self.conectar() for _ in range(50)]
+        respuestas = await asyncio.gather(
+            *(self.enviar(r, w, "CREAR|p|1") for r, w in conexiones)
+        )
+        self.assertTrue(all(r.startswith("OK|Proceso") for r in respuestas))
+        for _, writer in conexiones:
+            writer.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+# tests/test_supervisor.py
+import ast
+import os
+import unittest
+import supervisor
+from command_handler import procesar_comando
+from process_manager import reiniciar_procesos
+from tests.utilidades import esperar
+
+def fila(pid):
+    respuesta = procesar_comando("LISTAR")
+    for linea in respuesta.partition("|")[2].split("\n"):
+        numero, _, datos = linea.partition(": ")
+        if numero == pid:
+            return ast.literal_eval(datos)
+    return None
+
+class TestSupervisor(unittest.TestCase):
+
+    def setUp(self):
+        reiniciar_procesos()
+        supervisor.activar(intervalo=0.05)
+
+    def tearDown(self):
+        supervisor.desactivar()
+        reiniciar_procesos()
+
+    def test_lanzar_detener_y_eliminar(self):
+        self.assertEqual(procesar_comando("CREAR|sleep 30|baja"), "OK|Proceso 1 creado.")
+        info = esperar(lambda: (fila("1") or {}).get("so_estado") and fila("1"))
+        self.assertEqual(info["so_estado"], "S")
+        so_pid = info["so_pid"]
+        self.assertEqual(os.getpriority(os.PRIO_PROCESS, so_pid), supervisor.nice_de_prioridad("baja"))
+        procesar_comando("MODIFICAR|1|estado|detenido")
+        self.assertEqual(esperar(lambda: fila("1")["so_estado"] == "T"), True)
+        procesar_comando("ELIMINAR|1")
+        # El pidfd se cierra y el hijo se recoge sin dejar zombi.
+        self.assertTrue(esperar(lambda: not os.path.exists(f"/proc/{so_pid}")))
+
+    def test_hijo_terminado_y_comando_invalido(self):
+        procesar_comando("CREAR|sh -c 'exit 3'|5")
+        procesar_comando("CREAR|no-existe-este-comando|5")
+        self.assertTrue(esperar(lambda: fila("1")["estado"] == "terminado"))
+        self.assertEqual(fila("1")["codigo"], 3)
+        self.assertTrue(esperar(lambda: fila("2")["estado"] == "fallido"))
+        self.assertNotIn("so_pid", fila("2"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,28 @@
+# tests/utilidades.py
+# Description: Utilidades compartidas por los tests que arrancan servidores.
+
+import socket
+import time
+
+"""
+    Retorna un puerto TCP libre en localhost.
+"""
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+"""
+    Espera hasta limite segundos a que condicion() sea verdadera y retorna
+    su último valor. Un OSError (servidor aún sin arrancar) cuenta como falso.
+"""
+def esperar(condicion, limite=10, intervalo=0.05):
+    fin = time.monotonic() + limite
+    while True:
+        try:
+            valor = condicion()
+        except OSError:
+            valor = None
+        if valor or time.monotonic() > fin:
+            return valor
+        time.sleep(intervalo)